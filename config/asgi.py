@@ -9,8 +9,16 @@ https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
 
 import os
 
+from asgiref.sync import ThreadSensitiveContext
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+
+async def application(scope, receive, send):
+    # The sync code of each request (sync views and sync_to_async calls) runs in a thread of
+    # its own request, instead of one thread shared by all requests of the worker, as in Django 4.0
+    async with ThreadSensitiveContext():
+        await django_application(scope, receive, send)
@@ -0,0 +1,24 @@
+"""
+Gunicorn settings of the production server (see entrypoint.prod.sh and docs/deployment.md)
+"""
+
+# Load Django once in the master process. The workers are forked with everything imported,
+# so they start (and restart, when a worker dies) without booting Django again.
+preload_app = True
+
+# A sync worker that doesn't answer the master for this many seconds is killed, also while it
+# streams a response. Requests that play rounds keep within it (ROBOT_ROUND_SECONDS, FAST_FORWARD_SECONDS).
+timeout = 30
+
+
+def when_ready(server):
+    """ Called in the master process before the workers are forked """
+    from django.db import connections
+    from market.startup import warm_up
+
+    # Compile the templates once for all workers
+    num_templates = warm_up()
+    server.log.info("Warmed up: %d templates compiled", num_templates)
+
+    # The workers must never share a database connection of the master
+    connections.close_all()
@@ -61,6 +61,8 @@ INSTALLED_APPS = [
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
 MIDDLEWARE = [
+    'market.middleware.RequestTimingMiddleware',
+    'market.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.locale.LocaleMiddleware',
@@ -69,13 +71,17 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'market.middleware.ReplicaRoutingMiddleware',
+    'market.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # The Django backend, with render times measured (see market/request_timing.py)
+        'BACKEND': 'market.request_timing.TimedDjangoTemplates',
+        'NAME': 'django',
         'DIRS': [str(BASE_DIR.joinpath('accounts', 'templates'))],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -107,6 +113,52 @@ DATABASES = {
     }
 }
 
+# Read replica used by the read-only views in REPLICA_READ_VIEWS (see market/db_router.py).
+# Without POSTGRES_REPLICA_HOST the alias is a second connection to the primary, so the
+# routing can be tried out locally. In tests, the replica mirrors the test database.
+DATABASES['replica'] = {
+    **DATABASES['default'],
+    'HOST': os.environ.get("POSTGRES_REPLICA_HOST", DATABASES['default']['HOST']),
+    'TEST': {'MIRROR': 'default'},
+}
+
+DATABASE_ROUTERS = ['market.db_router.ReplicaRouter']
+REPLICA_DATABASE = 'replica'
+REPLICA_READ_VIEWS = [
+    'market:current_round',
+    'market:trader_table',
+    'market:monitor',
+    'market:play',
+    'market:my_markets',
+]
+# How long a client reads from the primary after a POST request (read-your-writes)
+REPLICA_STICKY_SECONDS = int(os.environ.get("REPLICA_STICKY_SECONDS", default=5))
+
+
+# Caches
+# The session cache has to be shared by all gunicorn workers on the server, so it is file based
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get(
+            "SESSION_CACHE_DIR", '/tmp/markedsspillet_session_cache'),
+        # Room for the sessions of all players of a busy day. With the default of 300 the cache
+        # deletes a third of its files whenever it is full, so classes evict each other's sessions
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get("SESSION_CACHE_MAX_ENTRIES", 50000)),
+        },
+    },
+}
+
+# Sessions of (anonymous) traders are read from the session cache, sessions of hosts from
+# the database (see market/session_store.py)
+SESSION_ENGINE = 'market.session_store'
+SESSION_CACHE_ALIAS = 'sessions'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.1/ref/settings/#auth-password-validators
@@ -192,6 +244,74 @@ ACCOUNT_EMAIL_VERIFICATION = 'optional'
 ACCOUNT_LOGIN_ON_PASSWORD_RESET = True
 ACCOUNT_EMAIL_SUBJECT_PREFIX = "[Markedsspillet.dk]"
 
+# Where archive files of finished and deleted markets are stored (see market/archive.py)
+MARKET_ARCHIVE_DIR = os.environ.get(
+    "MARKET_ARCHIVE_DIR", os.path.join(BASE_DIR, 'archives'))
+
+# Key of the permutation that turns sequence numbers into market IDs (see market/market_ids.py).
+# Must never change once markets have been created, or new IDs can collide with old ones
+MARKET_ID_SECRET = os.environ.get("MARKET_ID_SECRET", default=SECRET_KEY)
+
+# Directory shared by all gunicorn workers, where each worker writes its metrics (see market/metrics.py)
+METRICS_DIR = os.environ.get("METRICS_DIR", '/tmp/markedsspillet_metrics')
+# When set, /metrics requires the header "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", '')
+
+# Where profiles of requests made by staff users with ?profile are stored (see market/profiling.py)
+PROFILE_DIR = os.environ.get(
+    "PROFILE_DIR", os.path.join(BASE_DIR, 'profiles'))
+
+# Each query of a request that takes more than this many seconds is logged to SLOW_QUERY_LOG, read-only SELECTs
+# with the plan of EXPLAIN at most every SLOW_QUERY_EXPLAIN_INTERVAL seconds per query (see market/slow_queries.py)
+SLOW_QUERY_SECONDS = float(os.environ.get("SLOW_QUERY_SECONDS", 0.1))
+SLOW_QUERY_EXPLAIN_INTERVAL = float(os.environ.get("SLOW_QUERY_EXPLAIN_INTERVAL", 300))
+SLOW_QUERY_LOG = os.environ.get("SLOW_QUERY_LOG", '/tmp/markedsspillet_slow_queries.log')
+
+# Limits of the subprocesses that run the algorithms of robot traders after each round, and how many
+# of them run at the same time (see market/robots.py)
+ROBOT_CPU_SECONDS = int(os.environ.get("ROBOT_CPU_SECONDS", 1))
+ROBOT_MEMORY_MB = int(os.environ.get("ROBOT_MEMORY_MB", 256))
+ROBOT_TIMEOUT_SECONDS = float(os.environ.get("ROBOT_TIMEOUT_SECONDS", 3))
+ROBOT_WORKERS = int(os.environ.get("ROBOT_WORKERS", 4))
+# The time all robots of a market get together in a round, well within the timeout of gunicorn (30 s)
+ROBOT_ROUND_SECONDS = float(os.environ.get("ROBOT_ROUND_SECONDS", 10))
+# Each web server process keeps up to ROBOT_WARM_PROCESSES robot subprocesses running between the
+# rounds, each for ROBOT_PROCESS_ROUNDS rounds (its CPU limit covers them all)
+ROBOT_WARM_PROCESSES = int(os.environ.get("ROBOT_WARM_PROCESSES", 200))
+ROBOT_PROCESS_ROUNDS = int(os.environ.get("ROBOT_PROCESS_ROUNDS", 100))
+# A fast-forward starts no new round after FAST_FORWARD_SECONDS, so that with the last round's robots
+# (up to ROBOT_ROUND_SECONDS) the stream ends before gunicorn's timeout (see market/fast_forward.py)
+FAST_FORWARD_SECONDS = float(os.environ.get("FAST_FORWARD_SECONDS", 15))
+
+# One line per request with timings and query counts (see market/request_timing.py).
+# Set REQUEST_TIMING_LOG_LEVEL=WARNING in the .env file to turn the lines off
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+        'slow_queries': {
+            'class': 'logging.handlers.WatchedFileHandler',
+            'filename': SLOW_QUERY_LOG,
+            'delay': True,
+        },
+    },
+    'loggers': {
+        'market.request_timing': {
+            'handlers': ['console'],
+            'level': os.environ.get("REQUEST_TIMING_LOG_LEVEL", "INFO"),
+            'propagate': False,
+        },
+        'market.slow_queries': {
+            'handlers': ['slow_queries'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
+}
+
 DBBACKUP_STORAGE = 'django.core.files.storage.FileSystemStorage'
 DBBACKUP_STORAGE_OPTIONS = {'location': '/backups'}
 DBBACKUP_CLEANUP_KEEP = 30
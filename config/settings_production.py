@@ -0,0 +1,21 @@
+"""
+Settings of the web server in production (see entrypoint.prod.sh and config/gunicorn.conf.py).
+
+The same as settings.py, without the apps that are only used by management commands, so the
+gunicorn workers import less when they start. Management commands (e.g. reset_db of
+django_extensions, or dbbackup) still run with settings.py.
+
+Compare the start-up time with: python manage.py startup_profile config.settings config.settings_production
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import INSTALLED_APPS
+
+# Apps that only add management commands
+DEFERRED_APPS = ['django_extensions', 'dbbackup']
+
+INSTALLED_APPS = [app for app in INSTALLED_APPS if app not in DEFERRED_APPS]
+
+# Static files with hashed names and gzipped copies, so nginx can cache and serve them as they
+# are. collectstatic must run with these settings too (see entrypoint.prod.sh).
+STATICFILES_STORAGE = 'market.static_storage.CompressedManifestStaticFilesStorage'
@@ -6,9 +6,22 @@ echo "${0}: running migrations."
 python manage.py migrate
 
 echo "${0}: collecting static files."
-python manage.py collectstatic --noinput --clear
+# With the storage of the production settings: hashed names and gzipped copies (see market/static_storage.py)
+DJANGO_SETTINGS_MODULE=config.settings_production python manage.py collectstatic --noinput
+
+echo "${0}: clearing metrics of earlier runs."
+rm -rf "${METRICS_DIR:-/tmp/markedsspillet_metrics}"
 
 echo "${0}: running production server."
 mkdir -p /var/log/gunicorn
-pipenv run gunicorn config.wsgi:application --bind 0.0.0.0:8000 --access-logfile /var/log/gunicorn/access.log --error-log /var/log/gunicorn/error.log --capture-output
+# With ASGI_WORKER_CLASS=uvicorn.workers.UvicornWorker, the async polling views are
+# served by an ASGI worker, see docs/deployment.md
+if [ -n "${ASGI_WORKER_CLASS}" ]; then
+    APPLICATION="config.asgi:application --worker-class ${ASGI_WORKER_CLASS}"
+else
+    APPLICATION="config.wsgi:application"
+fi
+# The server runs with the production settings (fewer apps, see config/settings_production.py),
+# and loads Django and compiles the templates before it forks the workers (see config/gunicorn.conf.py)
+DJANGO_SETTINGS_MODULE=config.settings_production pipenv run gunicorn ${APPLICATION} --config config/gunicorn.conf.py --bind 0.0.0.0:8000 --access-logfile /var/log/gunicorn/access.log --access-logformat '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s" "%({server-timing}o)s"' --error-log /var/log/gunicorn/error.log --capture-output
 
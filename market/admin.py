@@ -1,6 +1,6 @@
 from django.contrib import admin
 
-from .models import Market, Trader, Trade, RoundStat
+from .models import Market, Trader, Trade, RoundStat, MarketEvent
 
 
 class MarketAdmin(admin.ModelAdmin):
@@ -23,7 +23,8 @@ class MarketAdmin(admin.ModelAdmin):
         'accum_cost_change',
         'monitor_auto_pilot',
         'deleted',
-        'game_over')
+        'game_over',
+        'archived')
 
     readonly_fields = ['market_id']
 
@@ -47,6 +48,7 @@ class TradeAdmin(admin.ModelAdmin):
     list_display = (
         'id',
         'trader',
+        'market',
         'unit_price',
         'was_forced',
         'unit_amount',
@@ -72,7 +74,19 @@ class RoundStatAdmin(admin.ModelAdmin):
     )
 
 
+class MarketEventAdmin(admin.ModelAdmin):
+    list_display = (
+        'market',
+        'kind',
+        'round',
+        'trader_id',
+        'duration_ms',
+        'created_at'
+    )
+
+
 admin.site.register(Market, MarketAdmin)
 admin.site.register(Trader, TraderAdmin)
 admin.site.register(Trade, TradeAdmin)
 admin.site.register(RoundStat, RoundStatAdmin)
+admin.site.register(MarketEvent, MarketEventAdmin)
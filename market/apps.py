@@ -1,5 +1,15 @@
 from django.apps import AppConfig
+from django.core.signals import request_finished
+from django.db.backends.signals import connection_created
 
 
 class MarketConfig(AppConfig):
     name = 'market'
+
+    def ready(self):
+        from .request_timing import install_execute_wrapper
+        from .slow_queries import explain_pending
+        # Every database connection reports its queries to the timing of the current request
+        connection_created.connect(install_execute_wrapper)
+        # Slow queries are explained after the response has been sent
+        request_finished.connect(explain_pending)
@@ -0,0 +1,167 @@
+"""
+Cold storage for finished and deleted markets.
+
+Archiving a market writes all of its rows (traders, trades, round stats and events) to a
+compressed, self-contained JSON file on local disk and purges them from the live tables, in a
+single transaction that locks the rows it archives. The market row itself is kept (flagged
+as archived), so the market still shows up for its host and can be restored on demand.
+"""
+
+import gzip
+import json
+import os
+from datetime import timedelta
+from pathlib import Path
+
+from django.conf import settings
+from django.core import serializers
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Market, Trader, Trade, RoundStat, MarketEvent
+
+# Number of rows per INSERT when restoring a market, and per DELETE when purging one (only to
+# keep the statements small: the purge is a single transaction)
+ARCHIVE_BATCH_SIZE = 1000
+
+# The models holding the rows of a market, in the order they have to be restored
+# (traders before the trades that reference them)
+ARCHIVED_MODELS = [Trader, Trade, RoundStat, MarketEvent]
+
+
+def archive_path(market):
+    """ Returns the path of the archive file for the market """
+    return Path(settings.MARKET_ARCHIVE_DIR) / f"{market.market_id}.json.gz"
+
+
+def archivable_markets(older_than_days=0):
+    """
+    Returns a query set of markets that can be archived:
+    markets that are either deleted or game over, and were created more than older_than_days ago.
+    """
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    return Market.objects.filter(
+        Q(deleted=True) | Q(game_over=True),
+        archived=False,
+        created_at__lte=cutoff,
+    )
+
+
+def rows_of_market(market, model):
+    """ Returns a query set of all rows of the given model belonging to the market """
+    return model.objects.filter(market=market).order_by('pk')
+
+
+class MarketChangedError(Exception):
+    """ Rows were added to a market while it was being archived, so it was left as it was """
+
+
+def purge_rows(model, pks):
+    """ Deletes the rows of the model with the given primary keys """
+    for start in range(0, len(pks), ARCHIVE_BATCH_SIZE):
+        model.objects.filter(pk__in=pks[start:start + ARCHIVE_BATCH_SIZE]).delete()
+
+
+def write_archive(path, objects):
+    """ Writes the objects to a new archive file at path """
+    # Write to a temporary file first, so a crash never leaves a truncated archive behind
+    tmp_path = path.with_suffix('.tmp')
+    # The python serializer + str() keeps full timestamp precision (the json serializer drops microseconds)
+    with gzip.open(tmp_path, 'wt', encoding='utf-8') as archive_file:
+        json.dump(serializers.serialize('python', objects), archive_file, default=str)
+    # Unlike a rename, a link fails if another archive of the market appeared in the meantime
+    try:
+        os.link(tmp_path, path)
+    finally:
+        tmp_path.unlink()
+
+
+def archive_market(market):
+    """
+    Writes the market and all its rows to an archive file, then purges the rows
+    from the live tables and flags the market as archived. Returns the path of the archive file.
+
+    It all happens in one transaction, that locks the market and the rows as they are read, so
+    only rows that are in the archive are purged, as they are in the archive. The rows are
+    deleted with statements of ARCHIVE_BATCH_SIZE rows, but committed together. If anything fails
+    (or rows were added in the meantime, see MarketChangedError), the rows are still live and
+    the new archive file is removed again.
+    Raises FileExistsError if the market already has an archive file, which is never overwritten.
+    """
+    path = archive_path(market)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        raise FileExistsError(f"{path} already exists")
+
+    written = False
+    try:
+        with transaction.atomic():
+            objects = [Market.objects.select_for_update().get(pk=market.pk)]
+            archived_pks = {}
+            for model in ARCHIVED_MODELS:
+                rows = list(rows_of_market(market, model).select_for_update())
+                archived_pks[model] = [row.pk for row in rows]
+                objects += rows
+
+            write_archive(path, objects)
+            written = True
+
+            # New rows have to wait for the lock of the market (their foreign keys), so this is a
+            # last check. Purging traders would also delete trades that are not in the archive
+            if any(rows_of_market(market, model).count() != len(archived_pks[model]) for model in ARCHIVED_MODELS):
+                raise MarketChangedError(f"Market {market.market_id} got new rows while it was archived")
+
+            Market.objects.filter(pk=market.pk).update(archived=True)
+            # Trades reference traders, so they have to go first
+            for model in reversed(ARCHIVED_MODELS):
+                purge_rows(model, archived_pks[model])
+    except BaseException:
+        if written:
+            path.unlink()
+        raise
+
+    market.archived = True
+    return path
+
+
+def bulk_restore(model, rows):
+    """
+    Inserts archived rows with bulk inserts. bulk_create() overwrites auto_now_add
+    timestamps, so the original created_at values are written back afterwards.
+    """
+    if not rows:
+        return
+    created_at = [getattr(row, 'created_at', None) for row in rows]
+    model.objects.bulk_create(rows, batch_size=ARCHIVE_BATCH_SIZE)
+
+    if hasattr(model, 'created_at'):
+        for row, timestamp in zip(rows, created_at):
+            row.created_at = timestamp
+        model.objects.bulk_update(rows, ['created_at'], batch_size=ARCHIVE_BATCH_SIZE)
+
+
+@transaction.atomic
+def restore_market(market):
+    """
+    Moves the rows of an archived market from its archive file back into the live tables.
+    """
+    path = archive_path(market)
+
+    with gzip.open(path, 'rt', encoding='utf-8') as archive_file:
+        archived = json.load(archive_file)
+
+    # Archives written before the production cost pools were removed also hold rows of those models
+    restored_labels = {model._meta.label_lower for model in ARCHIVED_MODELS}
+    archived = [obj for obj in archived if obj['model'] in restored_labels]
+    deserialized = list(serializers.deserialize('python', archived))
+
+    for model in ARCHIVED_MODELS:
+        rows = [obj.object for obj in deserialized if isinstance(obj.object, model)]
+        bulk_restore(model, rows)
+
+    Market.objects.filter(pk=market.pk).update(archived=False)
+    market.archived = False
+
+    # Only remove the archive once the restored rows are committed
+    transaction.on_commit(lambda: path.unlink(missing_ok=True))
@@ -0,0 +1,158 @@
+"""
+Micro-benchmarks of the settlement and chart code (see the benchmark management command).
+
+Each benchmark is timed on seeded markets of different sizes (number of traders and
+rounds played). Every timed run is rolled back to a savepoint, so all runs see exactly the
+same data, and the seeded markets are rolled back at the end, so the database is left as it
+was. The results can be saved as a baseline and later runs compared against it, so any
+performance work on these code paths can be proven (or any regression caught).
+"""
+
+import json
+import statistics
+import time
+from datetime import datetime
+
+from django.db import transaction
+from django.test import RequestFactory
+from django.urls import reverse
+
+from .helpers import (process_trade, generate_balance_list, add_graph_context_for_monitor_page,
+                      add_context_for_play_page)
+from .views import finish_round
+from .synthetic_data import host_user, seed_market
+
+DEFAULT_TRADERS = [10, 100, 500]
+DEFAULT_ROUNDS = [1, 15, 100]
+
+
+def benchmark_process_trade(market, host):
+    """ Settles all trades of the current round in memory (finish_round saves them in bulk) """
+    trades = list(market.valid_trades_this_round().select_related('trader'))
+    avg_price = sum([trade.unit_price for trade in trades]) / len(trades)
+
+    def run():
+        for trade in trades:
+            process_trade(market, trade, avg_price, save=False)
+    return run
+
+
+def benchmark_finish_round(market, host):
+    """ The whole finish_round view, as posted by the host """
+    request = RequestFactory().post(reverse('market:finish_round', args=(market.market_id,)))
+    request.user = host
+
+    def run():
+        response = finish_round(request, market.market_id)
+        assert response.status_code == 302
+    return run
+
+
+def benchmark_generate_balance_list(market, host):
+    """ The balance graph of a single trader, including the query for the trader's trades """
+    trader = market.all_traders().select_related('market').first()
+    return lambda: generate_balance_list(trader)
+
+
+def benchmark_monitor_graphs(market, host):
+    """ All the graph data of the monitor page """
+    return lambda: add_graph_context_for_monitor_page({'market': market})
+
+
+def benchmark_play_context(market, host):
+    """ The whole context of the play page of a trader who has traded in the current round """
+    trader = market.all_traders().select_related('market').first()
+    return lambda: add_context_for_play_page({'market': market, 'trader': trader})
+
+
+# name: function that prepares a benchmark on a market and returns the function to time
+BENCHMARKS = {
+    'process_trade': benchmark_process_trade,
+    'finish_round': benchmark_finish_round,
+    'generate_balance_list': benchmark_generate_balance_list,
+    'monitor_graphs': benchmark_monitor_graphs,
+    'play_context': benchmark_play_context,
+}
+
+
+def size_key(num_traders, num_rounds):
+    return f"{num_traders}x{num_rounds}"
+
+
+def time_runs(run, warmup, repeats):
+    """
+    Calls run() warmup times without timing it, then repeats times with timing.
+    Every call is rolled back to a savepoint. Returns the timings in seconds.
+    """
+    timings = []
+    for i in range(warmup + repeats):
+        savepoint = transaction.savepoint()
+        start = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - start
+        transaction.savepoint_rollback(savepoint)
+        if i >= warmup:
+            timings.append(seconds)
+    return timings
+
+
+def run_benchmarks(traders=DEFAULT_TRADERS, rounds=DEFAULT_ROUNDS, names=None, warmup=2, repeats=10):
+    """
+    Runs the benchmarks (all of them, or the ones in names) on a market of every combination
+    of number of traders and rounds. Returns {benchmark name: {size key: timings in ms}}.
+    """
+    names = names or list(BENCHMARKS)
+    results = {name: {} for name in names}
+
+    with transaction.atomic():
+        host = host_user()
+        for num_traders in traders:
+            for num_rounds in rounds:
+                market = seed_market(num_traders, num_rounds, created_by=host)
+                for name in names:
+                    run = BENCHMARKS[name](market, host)
+                    timings = time_runs(run, warmup, repeats)
+                    results[name][size_key(num_traders, num_rounds)] = {
+                        'median_ms': statistics.median(timings) * 1000,
+                        'min_ms': min(timings) * 1000,
+                        'max_ms': max(timings) * 1000,
+                    }
+        # Leave the database as it was
+        transaction.set_rollback(True)
+
+    return results
+
+
+def save_baseline(path, results, warmup, repeats):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w') as baseline_file:
+        json.dump({
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'warmup': warmup,
+            'repeats': repeats,
+            'results': results,
+        }, baseline_file, indent=2)
+
+
+def load_baseline(path):
+    with open(path) as baseline_file:
+        return json.load(baseline_file)['results']
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares the medians of the results with the baseline.
+    Returns rows of (name, size key, median ms, baseline median ms or None, regressed), where
+    regressed is True if the median is more than tolerance (e.g. 0.25 = 25 %) slower than the baseline.
+    """
+    rows = []
+    for name, sizes in results.items():
+        for key, timing in sizes.items():
+            baseline_timing = baseline.get(name, {}).get(key)
+            if baseline_timing is None:
+                rows.append((name, key, timing['median_ms'], None, False))
+                continue
+            baseline_median = baseline_timing['median_ms']
+            regressed = timing['median_ms'] > baseline_median * (1 + tolerance)
+            rows.append((name, key, timing['median_ms'], baseline_median, regressed))
+    return rows
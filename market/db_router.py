@@ -0,0 +1,59 @@
+"""
+Database router that sends the reads of read-only views to a replica.
+
+ReplicaRoutingMiddleware (see middleware.py) decides per request whether reads may go
+to the replica. All writes, and every read outside those views, go to the primary.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# Set to True by ReplicaRoutingMiddleware while a read-only view is handled
+_use_replica = ContextVar('use_replica', default=False)
+
+
+def replica_configured():
+    return settings.REPLICA_DATABASE in settings.DATABASES
+
+
+@contextmanager
+def reads_from_replica(enabled=True):
+    """ Route the reads of the market app to the replica inside the with-block """
+    token = _use_replica.set(enabled)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def reads_from_primary():
+    """
+    Route all reads to the primary inside the with-block.
+    Used when a read-only view has to write, and then read what it has written.
+    """
+    return reads_from_replica(enabled=False)
+
+
+class ReplicaRouter:
+    """
+    Reads of the market app go to the replica when the current request allows it.
+    Sessions and user accounts are always read from the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and model._meta.app_label == 'market' and replica_configured():
+            return settings.REPLICA_DATABASE
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica holds the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        return db != settings.REPLICA_DATABASE
@@ -0,0 +1,95 @@
+"""
+The event log of a market: every action that changes a market (a trader joins, places a trade,
+goes bankrupt or is removed, the host finishes a round or edits the settings) is recorded as a
+MarketEvent with its time and how long the server took (see record_event).
+
+The timeline of a market (see round_timeline and the timeline view) is computed from the events:
+how long each round took, how long the students took to decide on their trades, and how long
+the settlement of the round ran.
+"""
+
+import statistics
+import time
+
+from .models import MarketEvent
+
+
+def record_event(market, kind, trader=None, round_num=None, started=None):
+    """
+    Appends an event to the log of the market. started is the time.perf_counter() at which the
+    action started, so the event gets its duration. round_num defaults to the market's round.
+    """
+    return MarketEvent.objects.create(
+        market=market,
+        kind=kind,
+        round=market.round if round_num is None else round_num,
+        trader_id=trader.id if trader is not None else None,
+        duration_ms=(time.perf_counter() - started) * 1000 if started is not None else None,
+    )
+
+
+def seconds_between(start, end):
+    return (end - start).total_seconds()
+
+
+def round_timeline(market):
+    """
+    Returns a list with a dict for each round played (or being played) on the market:
+     - 'round': the round number (0, 1, ...)
+     - 'started_at', 'finished_at': when the round started (when the previous round was finished,
+       or for round 0 when the first event happened) and when it was finished (None if not yet)
+     - 'duration': seconds from start to finish of the round (None if not finished)
+     - 'trades': the number of trades placed in the round
+     - 'median_decision', 'max_decision': seconds from the start of the round (or from when the
+       trader joined, if later) until the trade was placed, the median and the slowest
+     - 'settlement_ms': the time the server spent finishing the round
+     - 'joins', 'bankruptcies', 'removals': the number of each in the round
+    """
+    rounds = {}
+    joined_at = {}
+    round_start = None
+
+    def current(round_num):
+        if round_num not in rounds:
+            rounds[round_num] = {
+                'round': round_num, 'started_at': round_start, 'finished_at': None, 'duration': None,
+                'decisions': [], 'settlement_ms': None, 'joins': 0, 'bankruptcies': 0, 'removals': 0,
+            }
+        return rounds[round_num]
+
+    for event in MarketEvent.objects.filter(market=market).order_by('created_at', 'pk'):
+        if round_start is None:
+            round_start = event.created_at
+        entry = current(event.round)
+
+        if event.kind == MarketEvent.JOIN:
+            entry['joins'] += 1
+            joined_at[event.trader_id] = event.created_at
+        elif event.kind == MarketEvent.TRADE:
+            decision_start = max(entry['started_at'], joined_at.get(event.trader_id, entry['started_at']))
+            entry['decisions'].append(seconds_between(decision_start, event.created_at))
+        elif event.kind == MarketEvent.BANKRUPTCY:
+            entry['bankruptcies'] += 1
+        elif event.kind == MarketEvent.REMOVAL:
+            entry['removals'] += 1
+        elif event.kind == MarketEvent.ROUND_FINISHED:
+            entry['finished_at'] = event.created_at
+            entry['duration'] = seconds_between(entry['started_at'], event.created_at)
+            entry['settlement_ms'] = event.duration_ms
+            round_start = event.created_at
+
+    timeline = []
+    for round_num in sorted(rounds):
+        entry = rounds[round_num]
+        decisions = entry.pop('decisions')
+        entry['trades'] = len(decisions)
+        entry['median_decision'] = statistics.median(decisions) if decisions else None
+        entry['max_decision'] = max(decisions) if decisions else None
+        timeline.append(entry)
+    return timeline
+
+
+def settings_edits(market):
+    """ The times the host edited the settings of the market """
+    return list(MarketEvent.objects.filter(market=market, kind=MarketEvent.SETTINGS_EDITED)
+                .order_by('created_at').values_list('created_at', flat=True))
@@ -0,0 +1,60 @@
+"""
+Fast-forward of markets where all traders are robots (see Market.all_are_robots).
+
+Instead of the host finishing one round at a time, fast_forward() plays the rounds back to back
+in the same request: it settles the round (the same as finish_round), and the robots place
+their trades for the next round (see robots.py). The code of each robot runs in one process for
+all the rounds (a RobotPool), so Python isn't started for every robot in every round.
+
+fast_forward() yields the progress after each round, which the fast_forward view streams to
+the monitor page. Each round is committed on its own, so the trader table of the monitor page
+shows the rounds as they are played. The stream keeps a gunicorn worker busy, and gunicorn kills
+a worker that is busy for longer than its timeout, so the view gives fast_forward() a time limit;
+the host fast-forwards again to play the rest of the rounds.
+"""
+
+import time
+
+from .events import record_event
+from .helpers import settle_round
+from .models import MarketEvent
+from .robots import RobotPool, play_robots
+from . import metrics
+
+
+def rounds_to_play(market, num_rounds=None):
+    """
+    The number of rounds to fast-forward: num_rounds, but no more than the rounds left of the
+    market. Markets with a fixed number of rounds are played to the end if num_rounds is None.
+    """
+    if market.endless:
+        return num_rounds
+    rounds_left = market.max_rounds - market.round
+    return rounds_left if num_rounds is None else min(num_rounds, rounds_left)
+
+
+def fast_forward(market, num_rounds, seconds=None):
+    """
+    Plays num_rounds rounds of the market, or until the game is over, or (if seconds is given)
+    until seconds have passed. Yields a dict after each round with the round the market is in,
+    the number of rounds played, num_rounds and whether the time is up before all rounds are played.
+    """
+    deadline = time.perf_counter() + seconds if seconds is not None else None
+    with RobotPool(num_rounds + 1) as pool:
+        # Robots that haven't traded in the current round yet
+        play_robots(market, pool)
+
+        for played in range(1, num_rounds + 1):
+            start = time.perf_counter()
+            valid_trades = settle_round(market)
+            record_event(market, MarketEvent.ROUND_FINISHED, round_num=market.round - 1, started=start)
+            metrics.FINISH_ROUND_DURATION.observe(time.perf_counter() - start)
+            metrics.FINISH_ROUND_TRADES.observe(len(valid_trades))
+
+            play_robots(market, pool)
+            out_of_time = (deadline is not None and time.perf_counter() >= deadline
+                           and played < num_rounds and not market.game_over)
+            yield {'round': market.round, 'played': played, 'total': num_rounds, 'game_over': market.game_over,
+                   'out_of_time': out_of_time}
+            if market.game_over or out_of_time:
+                break
@@ -1,5 +1,7 @@
 from django import forms
+from django.db import transaction
 from .models import Market, Trade, Trader
+from .market_ids import new_market_ids
 from django.core.exceptions import ValidationError
 from math import floor
 
@@ -74,6 +76,33 @@ class MarketForm(forms.ModelForm):
         return max_rounds
 
 
+class BulkMarketForm(MarketForm):
+    """ Creates a number of markets with the same settings, e.g. one for each group in a class """
+
+    MAX_NUM_MARKETS = 100
+
+    num_markets = forms.IntegerField(
+        min_value=1, max_value=MAX_NUM_MARKETS, initial=10, label='Antal markeder',
+        help_text=f"Hvor mange markeder med disse indstillinger skal der oprettes? Vælg et tal mellem 1 og {MAX_NUM_MARKETS}")
+
+    field_order = ['num_markets']
+
+    @transaction.atomic
+    def save_markets(self, created_by):
+        """
+        Creates num_markets markets with the settings of the form in one transaction.
+        The market IDs are fetched with one query and the markets are created with one INSERT.
+        Returns the list of new markets.
+        """
+        num_markets = self.cleaned_data['num_markets']
+        template = self.save(commit=False)
+        settings_of_markets = {field: getattr(template, field) for field in self.Meta.fields}
+
+        markets = [Market(market_id=market_id, created_by=created_by, **settings_of_markets)
+                   for market_id in new_market_ids(num_markets)]
+        return Market.objects.bulk_create(markets)
+
+
 class MarketUpdateForm(MarketForm):
 
     class Meta(MarketForm.Meta):
@@ -148,9 +177,17 @@ class TraderForm(forms.ModelForm):
         return cleaned_data
 
 
+# Longer code than this is not accepted from a robot trader (the algorithms of the play page are under 2000)
+MAX_ROBOT_CODE_LENGTH = 20000
+
+
 class TradeForm(forms.ModelForm):
     auto_play = forms.BooleanField(
         widget=forms.HiddenInput(), required=False, initial=False)
+    # The code of the trade algorithm, sent along when the trader starts a robot (see robots.py).
+    # Only stored when the market allows robots (see the play view)
+    robot_code = forms.CharField(
+        widget=forms.HiddenInput(), required=False, strip=False, max_length=MAX_ROBOT_CODE_LENGTH)
 
     class Meta:
         model = Trade
@@ -193,3 +230,18 @@ class TradeForm(forms.ModelForm):
 
             # Set default value of amount slider equal to zero
             self.fields['unit_amount'].widget.attrs['value'] = 0
+
+
+class FastForwardForm(forms.Form):
+    """ How many rounds to fast-forward a market where all traders are robots (see fast_forward.py) """
+
+    MAX_ROUNDS = 1000
+
+    num_rounds = forms.IntegerField(
+        min_value=1, max_value=MAX_ROUNDS, label='Antal runder',
+        help_text=f"Hvor mange runder skal spilles? Vælg et tal mellem 1 og {MAX_ROUNDS}")
+
+    def __init__(self, market, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Without a number, a market with a fixed number of rounds is played to the end
+        self.fields['num_rounds'].required = market.endless
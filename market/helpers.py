@@ -2,14 +2,17 @@
 Helper functions used by the views
 """
 
+from django.db.models import F
 from .models import Trader, Trade, RoundStat
+from .forms import TradeForm
 import json
 
 
-def process_trade(market, trade, avg_price):
+def process_trade(market, trade, avg_price, save=True):
     """
     Calculates key values for a single trade and updates trade and trader accordingly.
-    Used by monitor-view on post-requests, when host finishes a round
+    Used by monitor-view on post-requests, when host finishes a round.
+    With save=False, the caller saves the trade and trader (finish_round saves all of them with bulk updates)
     """
     alpha, theta, gamma = market.alpha, market.theta, market.gamma
 
@@ -32,18 +35,101 @@ def process_trade(market, trade, avg_price):
     trade.balance_after = trader.balance
 
     # save to database
-    trader.save()
-    trade.save()
+    if save:
+        trader.save()
+        trade.save()
 
     return expenses, raw_demand, demand, units_sold, income, trade_profit
 
 
+def settle_round(market):
+    """
+    Finishes the current round of the market: processes the valid trades of the round, creates
+    forced trades for the traders who didn't trade, saves the stats of the round and moves the
+    market to the next round. Used by the finish_round view and by fast_forward.
+    Returns the valid trades of the round.
+    """
+    # Query the trade decisions made by the traders in the current round
+    valid_trades = list(market.valid_trades_this_round().select_related('trader'))
+
+    # Let's assert that there is at leat 1 valid trade. Otherwise we will get a zero division error,
+    # when calculating the avg. price below.
+    assert(len(valid_trades) >
+           0), "No trades in market this round. Can't calculate avg. price."
+
+    # Calculate the average price (will be used to calculate the demand for each traders good)
+    avg_price = sum(
+        [trade.unit_price for trade in valid_trades]) / len(valid_trades)
+
+    # Process each of the valid trades, and save all of them (and their traders) with two bulk updates
+    for trade in valid_trades:
+        process_trade(
+            market, trade, avg_price, save=False)
+    Trader.objects.bulk_update(
+        [trade.trader for trade in valid_trades], ['balance'])
+    Trade.objects.bulk_update(
+        valid_trades, ['demand', 'units_sold', 'profit', 'balance_after'])
+
+    # Create 'forced trades' for all traders who did not make a trade in time
+    traders_with_trade = set(
+        market.all_trades_this_round().values_list('trader_id', flat=True))
+    Trade.objects.bulk_create([
+        new_forced_trade(trader=trader, round_num=market.round, is_new_trader=False)
+        for trader in market.all_traders() if trader.id not in traders_with_trade
+    ])
+
+    # Let's assert that at this point, there is exactly one trade pr trader in the current round
+    assert(market.all_trades_this_round().count() == market.all_traders().count()
+           ), f"Number of trades in this round does not equal num traders ."
+
+    # Save data for charts
+    active_or_bankrupt_traders = market.active_or_bankrupt_traders()
+
+    avg_balance_after = sum(
+        [trader.balance for trader in active_or_bankrupt_traders])/len(active_or_bankrupt_traders)
+
+    avg_amount = sum(
+        [trade.unit_amount for trade in valid_trades]) / len(valid_trades)
+
+    RoundStat.objects.create(
+        market=market, round=market.round, avg_price=avg_price,
+        avg_balance_after=avg_balance_after, avg_amount=avg_amount)
+
+    # Update trader production cost (a cost never becomes 0 or negative)
+    if market.cost_slope:
+        market.all_traders().filter(prod_cost__gt=-market.cost_slope).update(
+            prod_cost=F('prod_cost') + market.cost_slope)
+
+    # Update total production cost change
+    market.accum_cost_change += market.cost_slope
+
+    # Update market round
+    market.round += 1
+
+    # Check game over
+    if market.check_game_over():
+        market.game_over = True
+
+    market.save(update_fields=['accum_cost_change', 'round', 'game_over'])
+
+    return valid_trades
+
+
 def create_forced_trade(trader, round_num, is_new_trader):
     """
     Used in two different situations:
     1) To create a "null trade" for round 0,1,2,..., n-1 for a trader who has entered the game in a round n
     2) To create a "null trade" for the current round for a trader who joined in a previos round but did not trade in current round
 
+    """
+    forced_trade = new_forced_trade(trader, round_num, is_new_trader)
+    forced_trade.save()
+    return forced_trade
+
+
+def new_forced_trade(trader, round_num, is_new_trader):
+    """
+    Returns an unsaved forced trade (see create_forced_trade), so many of them can be saved with one bulk_create
     """
     if is_new_trader:
         # situation 1
@@ -56,9 +142,10 @@ def create_forced_trade(trader, round_num, is_new_trader):
         balance_before = trader.balance
         prod_cost = trader.prod_cost
 
-    forced_trade = Trade.objects.create(
+    return Trade(
         round=round_num,
         trader=trader,
+        market_id=trader.market_id,
         unit_price=None,
         unit_amount=None,
         demand=None,
@@ -68,21 +155,23 @@ def create_forced_trade(trader, round_num, is_new_trader):
         was_forced=True,
         prod_cost=prod_cost
     )
-    return forced_trade
 
 
-def generate_prod_cost_list(market, trades, trader):
+def generate_prod_cost_list(market, trades, trader, wait=None):
+    """ wait is trader.should_be_waiting(), if the caller already knows it """
 
     prod_costs = [float(trade.prod_cost) if (
         trade.prod_cost != None) else None for trade in trades]
 
-    if not trader.should_be_waiting():
+    if wait is None:
+        wait = trader.should_be_waiting()
+    if not wait:
         prod_costs += [float(trader.prod_cost)]
 
     return prod_costs
 
 
-def generate_balance_list(trader):
+def generate_balance_list(trader, trades=None):
     """
     Generates a list of floats consisting of the balances of a single trader.
     The i'th entry of the list is the balance before/during each round, not the
@@ -98,9 +187,13 @@ def generate_balance_list(trader):
 
     The length of the list should equal market.round + 1, as there should be one
     balance for each round, including the current round. 
+
+    The trader's trades from previous rounds can be passed in as trades, if they 
+    have already been fetched (as on the monitor page). 
     """
-    trades = Trade.objects.filter(
-        trader=trader, round__lte=trader.market.round - 1)
+    if trades is None:
+        trades = Trade.objects.filter(
+            trader=trader, round__lte=trader.market.round - 1).order_by('round')
     initial_balance = float(trader.market.initial_balance)
 
     balance_list = [initial_balance] + \
@@ -114,6 +207,84 @@ def generate_balance_list(trader):
     return balance_list
 
 
+def add_context_for_play_page(context):
+    """
+    Produces the context of the play page of context['trader'] on context['market'].
+    A new trade form is added, unless the context already has one (an invalid form that was posted).
+    """
+    market, trader = context['market'], context['trader']
+
+    round_stats = list(RoundStat.objects.filter(market=market).order_by('round'))
+    last_round_stat = round_stats[-1] if round_stats else None
+    trades = list(Trade.objects.filter(trader=trader).order_by('round'))
+    last_trade = trades[-1] if trades else None
+    # Same as trader.should_be_waiting()
+    wait = last_trade is not None and last_trade.round == market.round
+
+    if 'form' not in context:
+        if market.round > 0 and last_round_stat is not None:
+            market_average = last_round_stat.avg_price
+            context['form'] = TradeForm(trader, market_average)
+        else:
+            context['form'] = TradeForm(trader)
+
+    # Set x-axis for graphs
+    if market.endless:
+        round_labels = list(range(1, market.round + 2))
+    else:
+        round_labels = list(range(1, market.max_rounds + 1))
+
+    context.update({
+        'round_stats': round_stats,
+        'last_round_stat': last_round_stat,
+        'trades': trades,
+        'last_trade': last_trade,
+
+        # Labels for x-axis for graphs
+        'round_labels_json': json.dumps(round_labels),
+
+        # data for units graph
+        'data_demand_json': json.dumps([trade.demand for trade in trades]),
+        'data_sold_json': json.dumps([trade.units_sold for trade in trades]),
+        'data_produced_json': json.dumps([trade.unit_amount if (trade.unit_amount != None) else None for trade in trades]),
+
+        # data for price graph
+        'data_price_json': json.dumps([float(trade.unit_price) if (trade.unit_price != None) else None for trade in trades]),
+        'data_prod_cost_json': json.dumps(generate_prod_cost_list(market, trades, trader, wait)),
+        'data_market_avg_price_json': json.dumps([float(round_stat.avg_price) for round_stat in round_stats]),
+
+        # add data for balance graph
+        'trader_balance_json': json.dumps(
+            generate_balance_list(trader, [trade for trade in trades if trade.round < market.round])),
+        'avg_balance_json': json.dumps([float(market.initial_balance)] +
+                                       [float(round_stat.avg_balance_after) for round_stat in round_stats]),
+
+        'wait': wait,
+    })
+    return context
+
+
+def add_context_for_trader_table(context):
+    """
+    Adds the traders and counts shown in the trader table (trader-table.html) to the context.
+    Uses two queries, however many traders there are on the market.
+    """
+    market = context['market']
+
+    traders = list(market.active_or_bankrupt_traders())
+    ready_trader_ids = set(
+        market.valid_trades_this_round().values_list('trader_id', flat=True))
+    num_active_traders = len([trader for trader in traders if not trader.bankrupt])
+
+    context['traders'] = traders
+    context['ready_trader_ids'] = ready_trader_ids
+    context['num_ready_traders'] = len(ready_trader_ids)
+    context['num_active_traders'] = num_active_traders
+    # Same as market.all_are_bankrupt()
+    context['all_are_bankrupt'] = len(traders) > 0 and num_active_traders == 0
+    return context
+
+
 def add_graph_context_for_monitor_page(context):
     """ 
     This function produces all the data for the graphs on the monitor pages
@@ -132,17 +303,18 @@ def add_graph_context_for_monitor_page(context):
 
     color_for_averages = 'blue'
 
+    # On the monitor page graphs, we only want to show data for previous rounds.
+    # We fetch these trades for the whole market in one query and group them by trader.
+    trades_by_trader = {}
+    for trade in Trade.objects.filter(market=market, round__lte=market.round - 1).order_by('round'):
+        trades_by_trader.setdefault(trade.trader_id, []).append(trade)
+
     def generate_price_list(trader):
-        # On the monitor page price graph, we only want to show data for previous rounds.
-        trades = Trade.objects.filter(
-            trader=trader, round__lte=market.round - 1)
+        trades = trades_by_trader.get(trader.id, [])
         return [float(trade.unit_price) if (trade.unit_price != None) else None for trade in trades]
 
     def generate_amount_list(trader):
-        # On the monitor page amount graph, we only want to show data for previous rounds.
-        trades = Trade.objects.filter(
-            trader=trader, round__lte=market.round - 1)
-
+        trades = trades_by_trader.get(trader.id, [])
         return [float(trade.unit_amount) if (trade.unit_amount != None) else None for trade in trades]
 
     def trader_color(i):
@@ -156,14 +328,15 @@ def add_graph_context_for_monitor_page(context):
         blue = (0 + int((i/2)*100)) % 255
         return f"rgb({red},{green},{blue}, 0.3)"
 
-    # We want graphs to show data for all (including possibly removed) traders
-    all_traders = market.all_traders()
+    # We want graphs to show data for all (including possibly removed) traders.
+    # generate_balance_list() needs trader.market, so it is fetched along with the traders
+    all_traders = list(market.all_traders().select_related('market'))
 
     balanceDataSet = [{
         'label': trader.name,
         'backgroundColor': trader_color(i),
         'borderColor': trader_color(i),
-        'data': generate_balance_list(trader)
+        'data': generate_balance_list(trader, trades_by_trader.get(trader.id, []))
     }
         for i, trader in enumerate(all_traders)
     ]
@@ -0,0 +1,396 @@
+"""
+Load test of a running server, simulating a full lecture hall (see the load_test management command),
+and a benchmark of the number of pollers a server sustains (see the poll_benchmark management command).
+
+Hundreds of simulated students join a market through join_market, poll current_round every
+second like the play page does, and submit a trade in every round. A simulated host polls the
+trader table like the monitor page does, and finishes each round when all students are ready.
+Every request goes through the real URLs over HTTP, so the server (e.g. gunicorn) is tested as
+deployed. The load test talks to the server's database directly only to create the host and the
+market, so it has to run with the same settings as the server.
+"""
+
+import http.cookiejar
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY, get_user_model
+
+from .forms import MarketForm
+from .scenarios import SCENARIOS
+
+HOST_USERNAME = 'loadtest_host'
+
+# Seconds before a request counts as failed
+REQUEST_TIMEOUT = 30
+
+
+def percentile(sorted_values, percent):
+    """ Nearest-rank percentile of a sorted list """
+    if not sorted_values:
+        return None
+    rank = max(1, round(percent / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Stats:
+    """ Latencies and errors per endpoint, shared by all simulated clients """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def record(self, endpoint, seconds, ok):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if not ok:
+                self.errors[endpoint] += 1
+
+    def report_lines(self):
+        lines = [f"{'endpoint':<22}{'requests':>9}{'errors':>8}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'max ms':>9}"]
+        for endpoint, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            p50, p90, p99 = (percentile(latencies, percent) * 1000 for percent in (50, 90, 99))
+            lines.append(
+                f"{endpoint:<22}{len(latencies):>9}{self.errors[endpoint]:>8}"
+                f"{p50:>9.0f}{p90:>9.0f}{p99:>9.0f}{latencies[-1] * 1000:>9.0f}")
+        return lines
+
+
+class NoRedirects(urllib.request.HTTPRedirectHandler):
+    """ Redirects are not followed, so each measured request is exactly one request to the server """
+
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Client:
+    """ A browser with its own cookies (session, CSRF token) """
+
+    def __init__(self, base_url, stats, timeout=REQUEST_TIMEOUT):
+        self.base_url = base_url.rstrip('/')
+        self.stats = stats
+        self.timeout = timeout
+        self.cookies = http.cookiejar.CookieJar()
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), NoRedirects)
+
+    def set_cookie(self, name, value):
+        # The cookie jar's name of the host (e.g. 'localhost.local' for 'localhost')
+        _, host = http.cookiejar.eff_request_host(urllib.request.Request(self.base_url))
+        self.cookies.set_cookie(http.cookiejar.Cookie(
+            0, name, value, None, False, host, False, False, '/', True,
+            False, None, False, None, None, {}))
+
+    def cookie(self, name):
+        for cookie in self.cookies:
+            if cookie.name == name:
+                return cookie.value
+        return None
+
+    def request(self, endpoint, path, data=None):
+        """
+        Sends a GET (or a POST, if data is given) request and records it under endpoint.
+        Returns the status code and the body (None on connection errors).
+        """
+        headers = {}
+        if data is not None:
+            # Django's CSRF check accepts the token of the csrftoken cookie in a header
+            headers['X-CSRFToken'] = self.cookie(settings.CSRF_COOKIE_NAME) or ''
+            data = urllib.parse.urlencode(data).encode()
+        request = urllib.request.Request(self.base_url + path, data=data, headers=headers)
+
+        start = time.monotonic()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                status, body = response.status, response.read()
+        except urllib.error.HTTPError as error:
+            status, body = error.code, error.read()
+        except (urllib.error.URLError, OSError):
+            status, body = None, None
+        self.stats.record(endpoint, time.monotonic() - start, status is not None and status < 400)
+        return status, body
+
+    def get_json(self, endpoint, path):
+        status, body = self.request(endpoint, path)
+        if status != 200:
+            return None
+        return json.loads(body)
+
+
+class RoundTracker:
+    """ Records when each round is finished by the host and first seen by each student """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.finished_at = {}
+        self.seen_by_all_at = {}
+        self.seen_by = defaultdict(set)
+
+    def finished(self, round_num, at):
+        with self.lock:
+            self.finished_at[round_num] = at
+
+    def seen(self, student, round_num, num_students):
+        with self.lock:
+            if student in self.seen_by[round_num]:
+                return
+            self.seen_by[round_num].add(student)
+            if len(self.seen_by[round_num]) == num_students:
+                self.seen_by_all_at[round_num] = time.monotonic()
+
+    def report_lines(self, num_students):
+        lines = []
+        for round_num, finished_at in sorted(self.finished_at.items()):
+            next_round = round_num + 1
+            seen = len(self.seen_by[next_round])
+            if next_round in self.seen_by_all_at:
+                seconds = self.seen_by_all_at[next_round] - finished_at
+                lines.append(f"Round {round_num + 1}: all {num_students} students saw the next round after {seconds:.1f} s")
+            else:
+                lines.append(f"Round {round_num + 1}: only {seen} of {num_students} students saw the next round")
+        return lines
+
+
+def create_host_and_market(scenario_id):
+    """ Creates (or reuses) the host user and creates a market from the scenario. Returns both """
+    host, _ = get_user_model().objects.get_or_create(username=HOST_USERNAME)
+    form = MarketForm(SCENARIOS[scenario_id])
+    market = form.save(commit=False)
+    market.created_by = host
+    market.save()
+    return host, market
+
+
+def host_session_key(host):
+    """ Logs the host in by creating a session directly, as django.contrib.auth.login() would """
+    session = import_module(settings.SESSION_ENGINE).SessionStore()
+    session[SESSION_KEY] = str(host.pk)
+    session[BACKEND_SESSION_KEY] = settings.AUTHENTICATION_BACKENDS[0]
+    session[HASH_SESSION_KEY] = host.get_session_auth_hash()
+    session.save()
+    return session.session_key
+
+
+class LoadTest:
+    """ One run of the load test. Use run() and then report_lines() """
+
+    def __init__(self, base_url, num_students, num_rounds, scenario_id=0, poll_interval=1.0,
+                 think_time=20.0, ramp_up=10.0, round_timeout=120.0):
+        self.base_url = base_url
+        self.num_students = num_students
+        self.num_rounds = num_rounds
+        self.scenario_id = scenario_id
+        self.poll_interval = poll_interval
+        self.think_time = think_time
+        self.ramp_up = ramp_up
+        self.round_timeout = round_timeout
+
+        self.stats = Stats()
+        self.rounds = RoundTracker()
+        self.stop = threading.Event()
+        self.market = None
+
+    def run(self):
+        host, self.market = create_host_and_market(self.scenario_id)
+        session_key = host_session_key(host)
+
+        students = [threading.Thread(target=self.run_student, args=(i,), daemon=True)
+                    for i in range(self.num_students)]
+        for student in students:
+            student.start()
+        try:
+            self.run_host(session_key)
+        finally:
+            self.stop.set()
+            for student in students:
+                student.join(timeout=REQUEST_TIMEOUT)
+
+    def run_student(self, i):
+        market_id = self.market.market_id
+        client = Client(self.base_url, self.stats)
+
+        # Students don't all arrive at the same second
+        if self.stop.wait(random.uniform(0, self.ramp_up)):
+            return
+        client.request('home', f"/?market_id={market_id}")
+        status, _ = client.request('join_market', '/join_market/', {
+            'name': f"elev{i}", 'market_id': market_id})
+        if status != 302:
+            return
+
+        traded_in_round = None
+        trade_at = None
+        while not self.stop.is_set():
+            data = client.get_json('current_round', f"/{market_id}/current_round/")
+            if data is not None:
+                if data['game_over']:
+                    return
+                self.rounds.seen(i, data['round'], self.num_students)
+
+                # Decide on a trade some time after the round started
+                if traded_in_round != data['round']:
+                    if trade_at is None:
+                        trade_at = time.monotonic() + random.uniform(0, self.think_time)
+                    elif time.monotonic() >= trade_at:
+                        self.trade(client, market_id)
+                        traded_in_round = data['round']
+                        trade_at = None
+            self.stop.wait(self.poll_interval)
+
+    def trade(self, client, market_id):
+        client.request('play', f"/{market_id}/play/")
+        price = random.uniform(float(self.market.min_cost), 2 * float(self.market.max_cost))
+        client.request('play (POST)', f"/{market_id}/play/", {
+            'unit_price': f"{price:.2f}", 'unit_amount': random.randint(0, 20)})
+
+    def run_host(self, session_key):
+        market_id = self.market.market_id
+        client = Client(self.base_url, self.stats)
+        client.set_cookie(settings.SESSION_COOKIE_NAME, session_key)
+        # The home page always has a form, so it sets the CSRF cookie needed by finish_round
+        client.request('home', '/')
+        status, _ = client.request('monitor', f"/{market_id}/monitor/")
+        if status != 200:
+            raise RuntimeError(f"The host could not open the monitor page (status {status})")
+
+        for round_num in range(self.num_rounds):
+            deadline = time.monotonic() + self.round_timeout
+            while time.monotonic() < deadline:
+                # The monitor page polls the trader table every second
+                client.request('trader_table', f"/{market_id}/trader_table/")
+                data = client.get_json('current_round', f"/{market_id}/current_round/")
+                if data is not None and data['num_ready_traders'] >= self.num_students:
+                    break
+                time.sleep(self.poll_interval)
+
+            start = time.monotonic()
+            status, _ = client.request('finish_round', f"/{market_id}/finish_round", {})
+            if status != 302:
+                # e.g. no trades at all in the round
+                break
+            self.rounds.finished(round_num, start)
+            client.request('monitor', f"/{market_id}/monitor/")
+
+        # Give the students time to see the last round change
+        time.sleep(2 * self.poll_interval)
+
+    def report_lines(self):
+        total = sum(len(latencies) for latencies in self.stats.latencies.values())
+        errors = sum(self.stats.errors.values())
+        lines = [
+            f"Market {self.market.market_id}: {self.num_students} students, {self.num_rounds} rounds",
+            '',
+        ]
+        lines += self.stats.report_lines()
+        lines += [
+            '',
+            f"Error rate: {errors}/{total} requests ({100 * errors / max(total, 1):.1f} %)",
+            '',
+        ]
+        lines += self.rounds.report_lines(self.num_students)
+        return lines
+
+
+class PollBenchmark:
+    """
+    How many pollers a running server sustains (see the poll_benchmark management command).
+
+    The number of pollers is raised in steps. In each step every poller polls current_round
+    once per poll interval, like the play page, and the host polls the trader table, like the
+    monitor page. A step is sustained if the 99th percentile latency of the polls stays below
+    MAX_P99 seconds without errors. Use run() and then report_lines().
+    """
+    MAX_P99 = 1.0
+
+    def __init__(self, base_url, steps, step_seconds=20.0, poll_interval=1.0, scenario_id=0):
+        self.base_url = base_url
+        self.steps = steps
+        self.step_seconds = step_seconds
+        self.poll_interval = poll_interval
+        self.scenario_id = scenario_id
+
+        self.results = []
+        self.market = None
+
+    def run(self):
+        host, self.market = create_host_and_market(self.scenario_id)
+        session_key = host_session_key(host)
+        for num_pollers in self.steps:
+            result = self.run_step(num_pollers, session_key)
+            self.results.append(result)
+            if not result['sustained']:
+                break
+
+    def run_step(self, num_pollers, session_key):
+        stats = Stats()
+        stop = threading.Event()
+        pollers = [threading.Thread(target=self.poll, args=(stats, stop, None), daemon=True)
+                   for _ in range(num_pollers)]
+        pollers.append(threading.Thread(target=self.poll, args=(stats, stop, session_key), daemon=True))
+        for poller in pollers:
+            poller.start()
+        time.sleep(self.step_seconds)
+        stop.set()
+        for poller in pollers:
+            poller.join(timeout=REQUEST_TIMEOUT)
+
+        latencies = sorted(stats.latencies['current_round'] + stats.latencies['trader_table'])
+        errors = sum(stats.errors.values())
+        p99 = percentile(latencies, 99)
+        return {
+            'pollers': num_pollers,
+            'polls_per_second': len(latencies) / self.step_seconds,
+            'p99': p99,
+            'errors': errors,
+            'sustained': p99 is not None and p99 < self.MAX_P99 and errors == 0,
+        }
+
+    def poll(self, stats, stop, session_key):
+        """ Polls current_round, or the trader table if session_key (the host's) is given, until stop is set """
+        market_id = self.market.market_id
+        client = Client(self.base_url, stats)
+        if session_key is None:
+            endpoint, path = 'current_round', f"/{market_id}/current_round/"
+        else:
+            client.set_cookie(settings.SESSION_COOKIE_NAME, session_key)
+            endpoint, path = 'trader_table', f"/{market_id}/trader_table/"
+
+        # Spread the polls over the interval, like browsers that opened the page at different times
+        if stop.wait(random.uniform(0, self.poll_interval)):
+            return
+        while not stop.is_set():
+            start = time.monotonic()
+            client.request(endpoint, path)
+            stop.wait(max(0.0, self.poll_interval - (time.monotonic() - start)))
+
+    def max_sustained(self):
+        """ The largest number of pollers sustained, or 0 """
+        return max((result['pollers'] for result in self.results if result['sustained']), default=0)
+
+    def report_lines(self):
+        lines = [
+            f"Market {self.market.market_id}: {self.step_seconds:.0f} s per step, "
+            f"a poll every {self.poll_interval:g} s per poller",
+            '',
+            f"{'pollers':>8}{'polls/s':>10}{'p99 ms':>9}{'errors':>8}  sustained",
+        ]
+        for result in self.results:
+            p99 = f"{result['p99'] * 1000:.0f}" if result['p99'] is not None else '-'
+            lines.append(
+                f"{result['pollers']:>8}{result['polls_per_second']:>10.1f}{p99:>9}{result['errors']:>8}"
+                f"  {'yes' if result['sustained'] else 'no'}")
+        lines += [
+            '',
+            f"Max pollers sustained (p99 < {self.MAX_P99 * 1000:.0f} ms, no errors): {self.max_sustained()}",
+        ]
+        return lines
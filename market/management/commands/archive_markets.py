@@ -0,0 +1,35 @@
+# archive_markets.py
+from django.core.management.base import BaseCommand
+
+from market.archive import MarketChangedError, archivable_markets, archive_market
+
+
+class Command(BaseCommand):
+    help = "Moves finished and deleted markets to compressed archive files and purges their rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than-days', type=int, default=30,
+            help="Only archive markets created more than this many days ago (default: 30)")
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help="List the markets that would be archived without archiving them")
+
+    def handle(self, *args, **options):
+        markets = archivable_markets(options['older_than_days'])
+
+        for market in markets.iterator():
+            if options['dry_run']:
+                self.stdout.write(f"Would archive {market.market_id}")
+                continue
+            try:
+                path = archive_market(market)
+            except FileExistsError as error:
+                # E.g. left behind by a restore that crashed. Check it and move it away by hand
+                self.stderr.write(f"Skipped {market.market_id}: {error}")
+                continue
+            except MarketChangedError as error:
+                # It is archived by a later run
+                self.stderr.write(f"Skipped {market.market_id}: {error}")
+                continue
+            self.stdout.write(f"Archived {market.market_id} to {path}")
@@ -0,0 +1,74 @@
+# benchmark.py
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from market.benchmarks import (BENCHMARKS, DEFAULT_TRADERS, DEFAULT_ROUNDS, run_benchmarks,
+                               save_baseline, load_baseline, compare)
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / 'benchmarks' / 'baseline.json'
+
+
+def int_list(value):
+    return [int(number) for number in value.split(',')]
+
+
+class Command(BaseCommand):
+    help = "Times settlement and chart generation on seeded markets and compares with a saved baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--traders', type=int_list, default=DEFAULT_TRADERS,
+            help="Comma separated numbers of traders (default: 10,100,500)")
+        parser.add_argument(
+            '--rounds', type=int_list, default=DEFAULT_ROUNDS,
+            help="Comma separated numbers of rounds played (default: 1,15,100)")
+        parser.add_argument(
+            '--only', nargs='+', choices=list(BENCHMARKS),
+            help="Only run these benchmarks (default: all)")
+        parser.add_argument(
+            '--warmup', type=int, default=2,
+            help="Untimed runs before the timed runs (default: 2)")
+        parser.add_argument(
+            '--repeat', type=int, default=10,
+            help="Timed runs of each benchmark (default: 10)")
+        parser.add_argument(
+            '--baseline', type=Path, default=DEFAULT_BASELINE,
+            help=f"Baseline file (default: {DEFAULT_BASELINE})")
+        parser.add_argument(
+            '--save', action='store_true',
+            help="Save the results as the new baseline")
+        parser.add_argument(
+            '--tolerance', type=float, default=0.25,
+            help="A median more than this fraction slower than the baseline is a regression (default: 0.25)")
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Fail if any benchmark regressed compared with the baseline")
+
+    def handle(self, *args, **options):
+        self.stdout.write("Running benchmarks...")
+        results = run_benchmarks(
+            traders=options['traders'], rounds=options['rounds'], names=options['only'],
+            warmup=options['warmup'], repeats=options['repeat'])
+
+        baseline_path = options['baseline']
+        baseline = load_baseline(baseline_path) if baseline_path.exists() else {}
+        rows = compare(results, baseline, options['tolerance'])
+
+        self.stdout.write(f"{'benchmark':<24}{'size':>9}{'median ms':>12}{'baseline ms':>13}{'change':>9}")
+        for name, key, median, baseline_median, regressed in rows:
+            if baseline_median is None:
+                self.stdout.write(f"{name:<24}{key:>9}{median:>12.2f}{'-':>13}{'-':>9}")
+                continue
+            line = (f"{name:<24}{key:>9}{median:>12.2f}{baseline_median:>13.2f}"
+                    f"{100 * (median / baseline_median - 1):>+8.0f}%")
+            self.stdout.write(self.style.ERROR(line) if regressed else line)
+
+        if options['save']:
+            save_baseline(baseline_path, results, options['warmup'], options['repeat'])
+            self.stdout.write(self.style.SUCCESS(f"Saved baseline to {baseline_path}"))
+
+        regressions = [row for row in rows if row[4]]
+        if options['check'] and regressions:
+            raise CommandError(f"{len(regressions)} benchmark(s) regressed more than {options['tolerance']:.0%}")
@@ -0,0 +1,52 @@
+# load_test.py
+from django.core.management.base import BaseCommand
+
+from market.load_test import LoadTest
+
+
+class Command(BaseCommand):
+    help = "Simulates a lecture hall of students and a host playing a market on a running server"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://localhost:8000',
+            help="Base URL of the server to test (default: http://localhost:8000)")
+        parser.add_argument(
+            '--students', type=int, default=200,
+            help="Number of simulated students (default: 200)")
+        parser.add_argument(
+            '--rounds', type=int, default=3,
+            help="Number of rounds the host finishes (default: 3)")
+        parser.add_argument(
+            '--scenario', type=int, default=0,
+            help="Index of the scenario in scenarios.SCENARIOS used for the market (default: 0)")
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help="Seconds between polls of current_round and trader_table (default: 1)")
+        parser.add_argument(
+            '--think-time', type=float, default=20.0,
+            help="Students trade at a random time within this many seconds of a new round (default: 20)")
+        parser.add_argument(
+            '--ramp-up', type=float, default=10.0,
+            help="Students join at a random time within this many seconds (default: 10)")
+        parser.add_argument(
+            '--round-timeout', type=float, default=120.0,
+            help="The host finishes a round after this many seconds, even if not all students are ready (default: 120)")
+
+    def handle(self, *args, **options):
+        load_test = LoadTest(
+            base_url=options['url'],
+            num_students=options['students'],
+            num_rounds=options['rounds'],
+            scenario_id=options['scenario'],
+            poll_interval=options['poll_interval'],
+            think_time=options['think_time'],
+            ramp_up=options['ramp_up'],
+            round_timeout=options['round_timeout'],
+        )
+        self.stdout.write(
+            f"Running load test against {options['url']} with {options['students']} students...")
+        load_test.run()
+
+        for line in load_test.report_lines():
+            self.stdout.write(line)
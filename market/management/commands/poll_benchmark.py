@@ -0,0 +1,35 @@
+# poll_benchmark.py
+from django.core.management.base import BaseCommand
+
+from market.load_test import PollBenchmark
+
+
+class Command(BaseCommand):
+    help = "Raises the number of pollers of current_round in steps, until a running server can't keep up"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url', default='http://localhost:8000',
+            help="Base URL of the server to test (default: http://localhost:8000)")
+        parser.add_argument(
+            '--steps', default='50,100,200,400,800',
+            help="Comma-separated numbers of pollers, one step each (default: 50,100,200,400,800)")
+        parser.add_argument(
+            '--step-seconds', type=float, default=20.0,
+            help="Duration of each step in seconds (default: 20)")
+        parser.add_argument(
+            '--poll-interval', type=float, default=1.0,
+            help="Seconds between polls of each poller (default: 1)")
+
+    def handle(self, *args, **options):
+        benchmark = PollBenchmark(
+            base_url=options['url'],
+            steps=[int(step) for step in options['steps'].split(',')],
+            step_seconds=options['step_seconds'],
+            poll_interval=options['poll_interval'],
+        )
+        self.stdout.write(f"Running poll benchmark against {options['url']}...")
+        benchmark.run()
+
+        for line in benchmark.report_lines():
+            self.stdout.write(line)
@@ -0,0 +1,26 @@
+# restore_market.py
+from django.core.management.base import BaseCommand, CommandError
+
+from market.archive import restore_market
+from market.models import Market
+
+
+class Command(BaseCommand):
+    help = "Restores archived markets from their archive files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('market_ids', nargs='+')
+
+    def handle(self, *args, **options):
+        for market_id in options['market_ids']:
+            try:
+                market = Market.objects.get(market_id=market_id.upper())
+            except Market.DoesNotExist:
+                raise CommandError(f"There is no market with ID {market_id}")
+
+            if not market.archived:
+                self.stdout.write(f"{market.market_id} is not archived")
+                continue
+
+            restore_market(market)
+            self.stdout.write(f"Restored {market.market_id}")
@@ -0,0 +1,103 @@
+# robot_tournament.py
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from market.scenarios import SCENARIOS
+from market.tournament import load_strategies, profit_distribution, run_tournament, scenario_rounds
+
+
+def int_list(value):
+    return [int(number) for number in value.split(',')]
+
+
+class Command(BaseCommand):
+    help = ("Plays round-robin tournaments between robot strategies on the scenarios, "
+            "and shows the win rate and profit distribution of each strategy")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'strategies', nargs='*',
+            help="Python files with strategies written against the constants of code_header.py "
+                 "(algorithms 1 to 3 of the play page always take part)")
+        parser.add_argument(
+            '--no-builtin', action='store_true',
+            help="Leave out the algorithms of the play page")
+        parser.add_argument(
+            '--games', type=int, default=1000,
+            help="Games played by each combination of strategies on each scenario (default: 1000)")
+        parser.add_argument(
+            '--seats', type=int, default=2,
+            help="Number of strategies (one trader each) in a game (default: 2)")
+        parser.add_argument(
+            '--scenarios', type=int_list,
+            help="Comma separated numbers of the scenarios, starting from 1 (default: all)")
+        parser.add_argument(
+            '--rounds', type=int, default=15,
+            help="Rounds played in endless scenarios (default: 15)")
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count(),
+            help="Number of processes playing games in parallel (default: the number of CPUs)")
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help="Seed of the random choices, so the same options play the same games (default: 0)")
+
+    def handle(self, *args, **options):
+        try:
+            strategies = load_strategies(options['strategies'], builtin=not options['no_builtin'])
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        for name, code in strategies.items():
+            try:
+                compile(code, name, 'exec')
+            except SyntaxError as error:
+                raise CommandError(f"Syntax error in {name}: {error}")
+        if not 2 <= options['seats'] <= len(strategies):
+            raise CommandError(f"--seats must be between 2 and the number of strategies ({len(strategies)})")
+
+        scenarios = None
+        if options['scenarios']:
+            if not all(1 <= number <= len(SCENARIOS) for number in options['scenarios']):
+                raise CommandError(f"The scenarios are numbered from 1 to {len(SCENARIOS)}")
+            scenarios = [number - 1 for number in options['scenarios']]
+
+        self.stdout.write(f"Strategies: {', '.join(sorted(strategies))}")
+        start = time.perf_counter()
+        results = run_tournament(
+            strategies, games=options['games'], seats=options['seats'], endless_rounds=options['rounds'],
+            scenarios=scenarios, workers=options['workers'], seed=options['seed'])
+        seconds = time.perf_counter() - start
+
+        total_games = total_rounds = total_decisions = 0
+        for scenario_index, scenario_results in results.items():
+            scenario = SCENARIOS[scenario_index]
+            num_rounds = scenario_rounds(scenario, options['rounds'])
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"Scenario {scenario_index + 1}: {scenario['title']} ({num_rounds} rounds)"))
+            self.stdout.write(
+                f"{'strategy':<20}{'games':>8}{'win rate':>10}{'mean':>10}"
+                f"{'p5':>10}{'p25':>10}{'median':>10}{'p75':>10}{'p95':>10}")
+            ranking = sorted(scenario_results.items(), key=lambda item: item[1]['wins'] / item[1]['games'],
+                             reverse=True)
+            for name, totals in ranking:
+                distribution = ''.join(f"{value:>10.0f}" for value in profit_distribution(totals['profits']))
+                self.stdout.write(
+                    f"{name:<20}{totals['games']:>8}{totals['wins'] / totals['games']:>10.1%}{distribution}")
+            for name, totals in ranking:
+                if totals['error']:
+                    self.stdout.write(self.style.ERROR(
+                        f"{name} failed ({totals['error']}) and made no trades after that"))
+
+            scenario_games = sum(totals['games'] for totals in scenario_results.values()) // options['seats']
+            total_games += scenario_games
+            total_rounds += scenario_games * num_rounds
+            total_decisions += scenario_games * num_rounds * options['seats']
+
+        self.stdout.write('')
+        self.stdout.write("Profits are the final balance minus the initial balance, in kr.")
+        self.stdout.write(
+            f"{total_games} games, {total_rounds} rounds and {total_decisions} decisions in {seconds:.1f} s "
+            f"with {options['workers']} workers: {total_games / seconds:.0f} games/s, "
+            f"{total_rounds / seconds:.0f} rounds/s, {total_decisions / seconds:.0f} decisions/s")
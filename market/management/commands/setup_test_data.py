@@ -1,69 +1,67 @@
 # setup_test_data.py
-import random
+import time
 
-from django.db import transaction
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 
-from market.tests.factories import UserFactory, MarketFactory
+from market.synthetic_data import TEST_EMAIL, TEST_PASSWORD, generate, host_user
 
 
-# from forum.models import User, Thread, Club, Comment
-# from forum.factories import (
-#     UserFactory,
-#     ThreadFactory,
-#     ClubFactory,
-#     CommentFactory
-# )
-
-# NUM_USERS = 50
-# NUM_CLUBS = 10
-# NUM_THREADS = 12
-# COMMENTS_PER_THREAD = 25
-# USERS_PER_CLUB = 8
-
 class Command(BaseCommand):
-    help = "Generates test data for development server"
+    help = "Generates finished games with realistic trade histories, from a few markets for the development server to millions of trades"
 
-    @transaction.atomic
-    def handle(self, *args, **kwargs):
-        self.stdout.write("Adding test users")
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--markets', type=int, default=2,
+            help="Number of markets (default: 2)")
+        parser.add_argument(
+            '--traders', type=int, default=20,
+            help="Number of traders per market (default: 20)")
+        parser.add_argument(
+            '--rounds', type=int, default=15,
+            help="Number of rounds played on each market (default: 15)")
+        parser.add_argument(
+            '--robot-share', type=float, default=0.2,
+            help="Share of the traders that are robots, between 0 and 1 (default: 0.2)")
+        parser.add_argument(
+            '--workers', type=int, default=1,
+            help="Number of processes inserting markets in parallel (default: 1)")
+        parser.add_argument(
+            '--days', type=float, default=30,
+            help="The markets are created at random times within this many days (default: 30)")
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help="Seed of the random games, so the same options generate the same games (default: 0)")
 
-        person = UserFactory(email="test@m.dk",
-                             password="test")
+    def handle(self, *args, **options):
+        if not 0 <= options['robot_share'] <= 1:
+            raise CommandError("--robot-share must be between 0 and 1")
+        if options['rounds'] > 100:
+            raise CommandError("--rounds can be at most 100 (see Market.UPPER_LIMIT_ON_MAX_ROUNDS)")
 
-        self.stdout.write("Adding test markets")
-        market1 = MarketFactory(market_id="FOO", created_by=person)
-        market2 = MarketFactory(market_id="BAR", created_by=person)
-        
-        # self.stdout.write("Deleting old data...")
-        # models = [User, Thread, Comment, Club]
-        # for m in models:
-        #     m.objects.all().delete()
+        host = host_user()
+        self.stdout.write(f"Markets are hosted by {TEST_EMAIL} (password: {TEST_PASSWORD})")
 
-        # self.stdout.write("Creating new data...")
-        # # Create all the users
-        # people = []
-        # for _ in range(NUM_USERS):
-        #     person = UserFactory()
-        #     people.append(person)
+        start = time.perf_counter()
+        total_trades = 0
 
-        # # Add some users to clubs
-        # for _ in range(NUM_CLUBS):
-        #     club = ClubFactory()
-        #     members = random.choices(
-        #         people,
-        #         k=USERS_PER_CLUB
-        #     )
-        #     club.user.add(*members)
+        def progress(num_markets, num_trades):
+            nonlocal total_trades
+            total_trades += num_trades
+            seconds = time.perf_counter() - start
+            self.stdout.write(
+                f"{num_markets}/{options['markets']} markets, {total_trades} trades "
+                f"({total_trades / max(seconds, 0.001):.0f} trades/s)")
 
-        # # Create all the threads
-        # for _ in range(NUM_THREADS):
-        #     creator = random.choice(people)
-        #     thread = ThreadFactory(creator=creator)
-        #     # Create comments for each thread
-        #     for _ in range(COMMENTS_PER_THREAD):
-        #         commentor = random.choice(people)
-        #         CommentFactory(
-        #             user=commentor,
-        #             thread=thread
-        #         )
+        generate(
+            num_markets=options['markets'],
+            num_traders=options['traders'],
+            num_rounds=options['rounds'],
+            robot_share=options['robot_share'],
+            workers=options['workers'],
+            days=options['days'],
+            seed=options['seed'],
+            created_by=host,
+            progress=progress,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Generated {options['markets']} markets and {total_trades} trades in {time.perf_counter() - start:.1f} s"))
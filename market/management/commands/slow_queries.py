@@ -0,0 +1,53 @@
+# slow_queries.py
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from market.slow_queries import read_log, summarize
+
+# Characters of the SQL shown for each query, unless --full-sql
+SQL_PREVIEW_LENGTH = 300
+
+
+class Command(BaseCommand):
+    help = "Summarizes the slow query log: the queries with the most total time first"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--log', type=Path, default=None,
+            help="Slow query log file (default: settings.SLOW_QUERY_LOG)")
+        parser.add_argument(
+            '--top', type=int, default=10,
+            help="Number of queries to show (default: 10)")
+        parser.add_argument(
+            '--plans', action='store_true',
+            help="Show the latest EXPLAIN plan of each query")
+        parser.add_argument(
+            '--full-sql', action='store_true',
+            help="Show the full SQL of each query")
+
+    def handle(self, *args, **options):
+        path = options['log'] or Path(settings.SLOW_QUERY_LOG)
+        if not path.exists():
+            raise CommandError(f"No slow query log at {path}")
+
+        entries = read_log(path)
+        groups = summarize(entries)
+        self.stdout.write(f"{len(entries)} slow queries, {len(groups)} different queries in {path}")
+
+        for rank, group in enumerate(groups[:options['top']], start=1):
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"#{rank}: total {group['total_ms']:.0f} ms, {group['count']} times, "
+                f"mean {group['total_ms'] / group['count']:.0f} ms, max {group['max_ms']:.0f} ms"))
+            for label, key in (('views', 'views'), ('origins', 'origins'), ('called from', 'callers')):
+                if group[key]:
+                    self.stdout.write(f"  {label}: {', '.join(sorted(group[key]))}")
+            sql = group['sql']
+            if not options['full_sql'] and len(sql) > SQL_PREVIEW_LENGTH:
+                sql = sql[:SQL_PREVIEW_LENGTH] + ' ...'
+            self.stdout.write(f"  {sql}")
+            if options['plans'] and group['plan']:
+                for line in group['plan'].splitlines():
+                    self.stdout.write(f"    {line}")
@@ -0,0 +1,80 @@
+# startup_profile.py
+import json
+import os
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from market.startup import RESULT_PREFIX, parse_importtime
+
+
+class Command(BaseCommand):
+    help = "Measures how long a fresh process takes to start Django: settings, apps, middleware, URLs, templates and imports"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'settings_modules', nargs='*',
+            help="Settings modules to compare, e.g. config.settings config.settings_production "
+                 "(default: the current settings)")
+        parser.add_argument(
+            '--repeat', type=int, default=5,
+            help="Number of fresh processes started per settings module; the median is shown (default: 5)")
+        parser.add_argument(
+            '--top', type=int, default=15,
+            help="Number of slowest imports and packages shown (default: 15)")
+
+    def measure(self, settings_module):
+        """ Starts a fresh process with the settings module. Returns its result and the output of -X importtime """
+        environment = {**os.environ, 'DJANGO_SETTINGS_MODULE': settings_module}
+        process = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-m', 'market.startup'],
+            cwd=settings.BASE_DIR, env=environment, capture_output=True, text=True)
+        for line in process.stdout.splitlines():
+            if line.startswith(RESULT_PREFIX):
+                return json.loads(line[len(RESULT_PREFIX):]), process.stderr.splitlines()
+        raise CommandError(f"Starting Django with {settings_module} failed:\n{process.stderr[-3000:]}")
+
+    def handle(self, *args, **options):
+        modules = options['settings_modules'] or [os.environ['DJANGO_SETTINGS_MODULE']]
+        runs = {}
+        for module in modules:
+            self.stdout.write(f"Starting {options['repeat']} fresh processes with {module}...")
+            runs[module] = [self.measure(module) for _ in range(options['repeat'])]
+
+        def median(module, key):
+            return statistics.median(key(result) for result, _ in runs[module])
+
+        width = max(len(module) for module in modules) + 2
+        self.stdout.write('')
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{'phase (median ms)':<20}" + ''.join(f"{module:>{width}}" for module in modules)))
+        for phase in ('settings', 'apps', 'middleware', 'urls', 'templates'):
+            self.stdout.write(f"{phase:<20}" + ''.join(
+                f"{median(module, lambda result: result['phases'][phase]):>{width}.0f}" for module in modules))
+        self.stdout.write(f"{'total':<20}" + ''.join(
+            f"{median(module, lambda result: result['total']):>{width}.0f}" for module in modules))
+
+        for module in modules:
+            result, importtime = runs[module][-1]
+            self.stdout.write('')
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"Apps of {module} (ms: import, models, ready), {result['templates']} templates compiled"))
+            apps = sorted(result['apps'].items(), key=lambda item: sum(item[1].values()), reverse=True)
+            for label, app in apps:
+                self.stdout.write(
+                    f"  {label:<22}{app['import']:>8.1f}{app['models']:>8.1f}{app['ready']:>8.1f}")
+
+            imports = parse_importtime(importtime)
+            packages = defaultdict(float)
+            for name, self_ms, _ in imports:
+                packages[name.split('.')[0]] += self_ms
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Slowest imports of {module} (ms: cumulative, self)"))
+            for name, self_ms, cumulative_ms in imports[:options['top']]:
+                self.stdout.write(f"  {name:<50}{cumulative_ms:>8.1f}{self_ms:>8.1f}")
+            self.stdout.write(self.style.MIGRATE_HEADING(f"Import time by package of {module} (ms)"))
+            for name, self_ms in sorted(packages.items(), key=lambda item: item[1], reverse=True)[:options['top']]:
+                self.stdout.write(f"  {name:<50}{self_ms:>8.1f}")
@@ -0,0 +1,91 @@
+"""
+Market IDs.
+
+A market ID is 7 letters that are easy to read aloud and type (no I or O). IDs are unique
+by construction: every new market takes the next value of the database sequence
+market_id_seq, and that number is scrambled by a keyed permutation (a small Feistel
+network) before it is written as letters. Different numbers always give different IDs,
+so there is no "does this ID exist?" query and no race between concurrent market creations.
+The scrambling makes consecutive IDs look unrelated, so a market's ID doesn't give away
+the IDs of the markets created just before or after it.
+
+Markets created before this scheme have 8-letter IDs, so old and new IDs never collide.
+
+The permutation is keyed by settings.MARKET_ID_SECRET. Changing it on a running
+installation would let new IDs collide with existing ones, so it must never change.
+"""
+
+import hashlib
+import hmac
+
+from django.conf import settings
+from django.db import connection
+
+MARKET_ID_ALPHABET = 'ABCDEFGHJKLMNPQRSTUVWXYZ'
+MARKET_ID_LENGTH = 7
+
+# Number of different market IDs (24**7, about 4.6 billion)
+NUM_MARKET_IDS = len(MARKET_ID_ALPHABET) ** MARKET_ID_LENGTH
+
+# Created in migration 0008_market_id_sequence
+MARKET_ID_SEQUENCE = 'market_id_seq'
+
+# The Feistel network permutes numbers of 2 * 17 = 34 bits (2**34 > NUM_MARKET_IDS)
+HALF_BITS = 17
+HALF_MASK = (1 << HALF_BITS) - 1
+FEISTEL_ROUNDS = 4
+
+
+def round_function(key, round_number, value):
+    """ The pseudo random function of one Feistel round """
+    digest = hmac.new(key, f"{round_number}:{value}".encode(), hashlib.sha256).digest()
+    return int.from_bytes(digest[:4], 'big') & HALF_MASK
+
+
+def feistel(key, number):
+    """ A permutation of the numbers 0 <= number < 2**34 """
+    left, right = number >> HALF_BITS, number & HALF_MASK
+    for round_number in range(FEISTEL_ROUNDS):
+        left, right = right, left ^ round_function(key, round_number, right)
+    return (left << HALF_BITS) | right
+
+
+def permute(number, key=None):
+    """
+    A permutation of the numbers 0 <= number < NUM_MARKET_IDS.
+    Numbers that the Feistel network maps out of range are mapped again
+    until they land in range ("cycle walking"), which keeps the mapping one-to-one.
+    """
+    if key is None:
+        key = settings.MARKET_ID_SECRET.encode()
+    number = feistel(key, number)
+    while number >= NUM_MARKET_IDS:
+        number = feistel(key, number)
+    return number
+
+
+def encode(number):
+    """ Writes 0 <= number < NUM_MARKET_IDS as MARKET_ID_LENGTH letters """
+    letters = []
+    for _ in range(MARKET_ID_LENGTH):
+        number, digit = divmod(number, len(MARKET_ID_ALPHABET))
+        letters.append(MARKET_ID_ALPHABET[digit])
+    return ''.join(reversed(letters))
+
+
+def market_id_from_sequence_value(value):
+    """ Returns the market ID of a value (1, 2, 3, ...) of the market ID sequence """
+    return encode(permute(value - 1))
+
+
+def new_market_ids(count):
+    """
+    Returns a list of count new, unique market IDs.
+    All the sequence values are fetched in a single query, so markets created together
+    (see Market.objects.bulk_create) only cost one extra round trip in total.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT nextval(%s) FROM generate_series(1, %s)", [MARKET_ID_SEQUENCE, count])
+        values = [value for (value,) in cursor.fetchall()]
+    return [market_id_from_sequence_value(value) for value in values]
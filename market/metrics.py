@@ -0,0 +1,281 @@
+"""
+Metrics of the game and the server, served in the Prometheus text format at /metrics.
+
+Each gunicorn worker counts in its own in-process registry. At most once per second (see
+Registry.flush), the worker writes its registry to a file of its own in the shared
+directory settings.METRICS_DIR. The /metrics view adds up the files of all workers, so it
+doesn't matter which worker answers the scrape. A worker's file may be up to FLUSH_INTERVAL
+seconds behind, and the directory is emptied when the server starts (see entrypoint.prod.sh).
+
+With settings.METRICS_TOKEN, the view only answers scrapes with that bearer token (see authorized).
+
+Besides counters and histograms there are "recency" metrics: the number of different markets
+(or traders) seen within the last few minutes, e.g. the number of traders that are polling.
+"""
+
+import hmac
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+# Seconds between writes of a worker's registry to its file
+FLUSH_INTERVAL = 1.0
+
+# Request durations in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def authorized(request):
+    """ Whether the request may read the metrics: it has the bearer token, if one is set """
+    if not settings.METRICS_TOKEN:
+        return True
+    return hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {settings.METRICS_TOKEN}')
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labelnames, labelvalues, extra=()):
+    """ E.g. {view="market:play",le="0.5"} """
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+def format_value(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """
+    A metric with zero or more labels. The values are kept per combination of label values.
+    The state of a metric (see state()) is what a worker writes to its file.
+    """
+    type = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.lock = threading.Lock()
+        self.values = {}
+        (registry or REGISTRY).register(self)
+
+    def label_values(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def state(self):
+        with self.lock:
+            return [[list(labelvalues), value] for labelvalues, value in self.values.items()]
+
+    def reset(self):
+        with self.lock:
+            self.values = {}
+
+    def header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+
+
+class Counter(Metric):
+    """ A count that only goes up, e.g. the number of trades """
+    type = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    @staticmethod
+    def merge(states):
+        merged = {}
+        for state in states:
+            for labelvalues, value in state:
+                merged[tuple(labelvalues)] = merged.get(tuple(labelvalues), 0) + value
+        return merged
+
+    def exposition(self, merged):
+        lines = self.header()
+        for labelvalues, value in sorted(merged.items()):
+            lines.append(f"{self.name}{format_labels(self.labelnames, labelvalues)} {format_value(value)}")
+        return lines
+
+
+class Histogram(Metric):
+    """ Observations (e.g. durations) counted in buckets, plus their sum and count """
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS, registry=None):
+        self.buckets = tuple(buckets)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, value, **labels):
+        key = self.label_values(labels)
+        with self.lock:
+            if key not in self.values:
+                # Counts of each bucket (not cumulative), sum and count
+                self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            counts, _, _ = self.values[key]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self.values[key][1] += value
+            self.values[key][2] += 1
+
+    def merge(self, states):
+        merged = {}
+        for state in states:
+            for labelvalues, (counts, total, count) in state:
+                if len(counts) != len(self.buckets):
+                    # Written by a worker running a different version of the code
+                    continue
+                key = tuple(labelvalues)
+                if key not in merged:
+                    merged[key] = [[0] * len(self.buckets), 0.0, 0]
+                merged[key][0] = [a + b for a, b in zip(merged[key][0], counts)]
+                merged[key][1] += total
+                merged[key][2] += count
+        return merged
+
+    def exposition(self, merged):
+        lines = self.header()
+        for labelvalues, (counts, total, count) in sorted(merged.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = format_labels(self.labelnames, labelvalues, [('le', format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = format_labels(self.labelnames, labelvalues, [('le', '+Inf')])
+            lines.append(f"{self.name}_bucket{labels} {count}")
+            labels = format_labels(self.labelnames, labelvalues)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Recency(Metric):
+    """
+    A gauge of the number of different keys (e.g. trader ids) seen within the last window seconds.
+    Each worker remembers when it last saw each key, and the workers' times are merged by taking
+    the latest.
+    """
+    type = 'gauge'
+
+    def __init__(self, name, documentation, window, registry=None):
+        self.window = window
+        super().__init__(name, documentation, (), registry)
+
+    def touch(self, key):
+        with self.lock:
+            self.values[str(key)] = time.time()
+
+    def state(self):
+        # Forget keys that are too old to count, so the files don't grow
+        oldest = time.time() - self.window
+        with self.lock:
+            self.values = {key: seen for key, seen in self.values.items() if seen >= oldest}
+            return dict(self.values)
+
+    @staticmethod
+    def merge(states):
+        merged = {}
+        for state in states:
+            for key, seen in state.items():
+                merged[key] = max(seen, merged.get(key, 0))
+        return merged
+
+    def exposition(self, merged):
+        oldest = time.time() - self.window
+        return self.header() + [f"{self.name} {sum(1 for seen in merged.values() if seen >= oldest)}"]
+
+
+class Registry:
+    """ The metrics of this process, and the aggregation of the files of all processes """
+
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+        self.last_flush = 0.0
+
+    def register(self, metric):
+        self.metrics[metric.name] = metric
+
+    def reset(self):
+        for metric in self.metrics.values():
+            metric.reset()
+
+    def state(self):
+        return {name: metric.state() for name, metric in self.metrics.items()}
+
+    def directory(self):
+        return Path(settings.METRICS_DIR)
+
+    def path(self):
+        return self.directory() / f"{os.getpid()}.json"
+
+    def flush(self, force=False):
+        """ Writes the registry to this process' file, unless it was written less than FLUSH_INTERVAL ago """
+        now = time.monotonic()
+        with self.lock:
+            if not force and now - self.last_flush < FLUSH_INTERVAL:
+                return
+            self.last_flush = now
+        directory = self.directory()
+        directory.mkdir(parents=True, exist_ok=True)
+        # Write and rename, so other workers never read a half written file
+        temporary_path = directory / f"{os.getpid()}.json.tmp"
+        temporary_path.write_text(json.dumps(self.state()))
+        os.replace(temporary_path, self.path())
+
+    def collect(self):
+        """ Returns the states of all processes, read from the shared directory """
+        self.flush(force=True)
+        states = []
+        for path in self.directory().glob('*.json'):
+            try:
+                states.append(json.loads(path.read_text()))
+            except (OSError, ValueError):
+                # Removed or replaced while reading
+                continue
+        return states
+
+    def exposition(self):
+        """ All metrics in the Prometheus text format """
+        states = self.collect()
+        lines = []
+        for name, metric in self.metrics.items():
+            merged = metric.merge([state[name] for state in states if name in state])
+            lines += metric.exposition(merged)
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# Views that browsers poll every second (the play page and the monitor page)
+POLLING_VIEWS = ('market:current_round', 'market:trader_table')
+
+REQUEST_DURATION = Histogram(
+    'markedsspillet_request_duration_seconds', "Time to handle a request, by view", ['view'])
+POLLS = Counter(
+    'markedsspillet_polls_total', "Polling requests from the play and monitor pages, by view", ['view'])
+TRADES = Counter(
+    'markedsspillet_trades_total', "Trades submitted by traders")
+FINISH_ROUND_DURATION = Histogram(
+    'markedsspillet_finish_round_duration_seconds', "Time to finish a round (settle all trades)",
+    buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0))
+FINISH_ROUND_TRADES = Histogram(
+    'markedsspillet_finish_round_trades', "Number of trades settled when finishing a round",
+    buckets=(1, 10, 25, 50, 100, 250, 500, 1000))
+ACTIVE_MARKETS = Recency(
+    'markedsspillet_active_markets', "Markets with a request within the last 10 minutes", window=600)
+CONNECTED_TRADERS = Recency(
+    'markedsspillet_connected_traders', "Traders that loaded the play page within the last 10 minutes",
+    window=600)
@@ -0,0 +1,173 @@
+"""
+Middleware used by the market app
+"""
+
+import asyncio
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.urls import Resolver404, resolve
+
+from .db_router import reads_from_replica, replica_configured
+from . import metrics
+from .profiling import asks_for_profile, profiled, wants_profile
+from .request_timing import timed_request
+
+logger = logging.getLogger('market.request_timing')
+
+
+class HybridMiddleware:
+    """
+    Base class of the middleware below. Like Django's own middleware, it works both when
+    Django handles requests synchronously (WSGI) and asynchronously (ASGI), so under ASGI the
+    async views (current_round, trader_table) run without being switched to a thread.
+    Subclasses implement sync_call() and async_call().
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Mark the instance as a coroutine function, as Django's MiddlewareMixin does
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.async_call(request)
+        return self.sync_call(request)
+
+
+class RequestTimingMiddleware(HybridMiddleware):
+    """
+    Measures every request (see request_timing.py): adds a Server-Timing header to the
+    response and logs a line with the view, status, total time, database queries,
+    template time and session cache hits and misses.
+
+    Put it first in MIDDLEWARE, so the time of all other middleware is included.
+    """
+
+    def sync_call(self, request):
+        with timed_request(request) as timing:
+            response = self.get_response(request)
+        return self.add_timing(request, response, timing)
+
+    async def async_call(self, request):
+        with timed_request(request) as timing:
+            response = await self.get_response(request)
+        return self.add_timing(request, response, timing)
+
+    def add_timing(self, request, response, timing):
+        match = request.resolver_match
+        view_name = match.view_name if match else '-'
+        response['Server-Timing'] = timing.server_timing(view_name)
+        logger.info(timing.log_line(request, response, view_name))
+        return response
+
+
+class MetricsMiddleware(HybridMiddleware):
+    """
+    Counts every request in the metrics of this worker (see metrics.py): the duration by view,
+    polling requests, and the markets and traders that are active.
+    """
+
+    def sync_call(self, request):
+        start = time.perf_counter()
+        response = self.get_response(request)
+        self.count(request, response, time.perf_counter() - start)
+        return response
+
+    async def async_call(self, request):
+        start = time.perf_counter()
+        response = await self.get_response(request)
+        self.count(request, response, time.perf_counter() - start)
+        return response
+
+    def count(self, request, response, duration):
+        match = request.resolver_match
+        if match is not None and match.view_name != 'market:metrics':
+            metrics.REQUEST_DURATION.observe(duration, view=match.view_name)
+            if match.view_name in metrics.POLLING_VIEWS:
+                metrics.POLLS.inc(view=match.view_name)
+            if 'market_id' in match.kwargs and response.status_code < 400:
+                metrics.ACTIVE_MARKETS.touch(match.kwargs['market_id'])
+            # Only sessions the view has read already (e.g. the play page), so polling stays as cheap as it is
+            session = getattr(request, 'session', None)
+            if session is not None and session.accessed and 'trader_id' in session:
+                metrics.CONNECTED_TRADERS.touch(session['trader_id'])
+
+        metrics.REGISTRY.flush()
+
+
+class ProfilingMiddleware(HybridMiddleware):
+    """
+    Profiles the request if a staff user asks for it with ?profile or the header X-Profile
+    (see profiling.py). The name of the stored profile is sent in the header X-Profile.
+    """
+
+    def sync_call(self, request):
+        if not wants_profile(request):
+            return self.get_response(request)
+        with profiled(request) as profile:
+            response = self.get_response(request)
+        response['X-Profile'] = profile['name']
+        return response
+
+    async def async_call(self, request):
+        # Looking up the user is a database query, so only do it when a profile is asked for
+        if not asks_for_profile(request) or not await sync_to_async(wants_profile)(request):
+            return await self.get_response(request)
+        with profiled(request) as profile:
+            response = await self.get_response(request)
+        response['X-Profile'] = profile['name']
+        return response
+
+
+class ReplicaRoutingMiddleware(HybridMiddleware):
+    """
+    Lets the read-only views listed in settings.REPLICA_READ_VIEWS read from the replica.
+
+    To give clients read-your-writes consistency, a client that has just made a POST request
+    (e.g. a trade on the play page, or finishing a round) gets a short-lived cookie. As long as
+    the cookie is set, all the client's reads go to the primary, so the replica has time to
+    catch up with the client's own writes.
+    """
+    STICKY_COOKIE_NAME = 'primary_db'
+
+    def sync_call(self, request):
+        if not replica_configured():
+            return self.get_response(request)
+
+        with reads_from_replica(self.may_read_from_replica(request)):
+            response = self.get_response(request)
+        return self.set_sticky_cookie(request, response)
+
+    async def async_call(self, request):
+        if not replica_configured():
+            return await self.get_response(request)
+
+        with reads_from_replica(self.may_read_from_replica(request)):
+            response = await self.get_response(request)
+        return self.set_sticky_cookie(request, response)
+
+    def set_sticky_cookie(self, request, response):
+        if request.method == 'POST':
+            response.set_cookie(
+                self.STICKY_COOKIE_NAME, '1',
+                max_age=settings.REPLICA_STICKY_SECONDS,
+                httponly=True, samesite='Lax')
+        return response
+
+    def may_read_from_replica(self, request):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        if self.STICKY_COOKIE_NAME in request.COOKIES:
+            return False
+        try:
+            view_name = resolve(request.path_info).view_name
+        except Resolver404:
+            return False
+        return view_name in settings.REPLICA_READ_VIEWS
@@ -0,0 +1,29 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='market',
+            index=models.Index(condition=models.Q(('deleted', False)), fields=['created_by', '-created_at'], name='market_host_live_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(condition=models.Q(('was_forced', False)), fields=['round', 'trader'], name='trade_unforced_round_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trader',
+            index=models.Index(fields=['market', '-balance'], name='trader_market_balance_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='trader',
+            index=models.Index(condition=models.Q(('bankrupt', False), ('removed_from_market', False)), fields=['market', '-balance'], name='trader_active_balance_idx'),
+        ),
+    ]
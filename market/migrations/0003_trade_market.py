@@ -0,0 +1,18 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0002_hot_lookup_indexes'),
+    ]
+
+    operations = [
+        # Added as nullable first, backfilled in 0004 and made non-nullable in 0005
+        migrations.AddField(
+            model_name='trade',
+            name='market',
+            field=models.ForeignKey(db_index=False, null=True, on_delete=django.db.models.deletion.CASCADE, to='market.market'),
+        ),
+    ]
@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def backfill_trade_market(apps, schema_editor):
+    """
+    Copy trader.market to trade.market in batches of BATCH_SIZE trades.
+    The migration is non-atomic, so every batch is committed on its own and
+    the trade table is never locked for the whole backfill.
+    """
+    Trade = apps.get_model('market', 'Trade')
+    Trader = apps.get_model('market', 'Trader')
+
+    market_of_trader = Trader.objects.filter(
+        id=OuterRef('trader_id')).values('market_id')[:1]
+
+    last_id = 0
+    while True:
+        batch = list(
+            Trade.objects.filter(id__gt=last_id, market__isnull=True)
+            .order_by('id')
+            .values_list('id', flat=True)[:BATCH_SIZE])
+        if not batch:
+            break
+        Trade.objects.filter(id__in=batch).update(market_id=Subquery(market_of_trader))
+        last_id = batch[-1]
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('market', '0003_trade_market'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_trade_market, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0004_backfill_trade_market'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='trade',
+            name='market',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='market.market'),
+        ),
+        migrations.RemoveIndex(
+            model_name='trade',
+            name='trade_unforced_round_idx',
+        ),
+        migrations.AddIndex(
+            model_name='trade',
+            index=models.Index(fields=['market', 'round'], name='trade_market_round_idx'),
+        ),
+    ]
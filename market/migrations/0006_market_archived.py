@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0005_trade_market_not_null'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='market',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 3.2.25 on 2026-10-19 14:19
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_assigned_prod_costs(apps, schema_editor):
+    """
+    Every production cost handed out by the old algorithm was moved to UsedCosts,
+    so the number of UsedCosts rows of a market is the number of costs assigned so far.
+    """
+    Market = apps.get_model('market', 'Market')
+    UsedCosts = apps.get_model('market', 'UsedCosts')
+
+    used_costs_of_market = (
+        UsedCosts.objects.filter(market_id=OuterRef('market_id'))
+        .order_by()
+        .values('market_id')
+        .annotate(count=Count('id'))
+        .values('count'))
+    Market.objects.update(
+        num_prod_costs_assigned=Coalesce(Subquery(used_costs_of_market), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0006_market_archived'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='market',
+            name='num_prod_costs_assigned',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_assigned_prod_costs, migrations.RunPython.noop),
+        migrations.DeleteModel(
+            name='UnusedCosts',
+        ),
+        migrations.DeleteModel(
+            name='UsedCosts',
+        ),
+    ]
@@ -0,0 +1,17 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0007_prod_cost_counter'),
+    ]
+
+    operations = [
+        # Source of new market IDs (see market/market_ids.py). MAXVALUE is the number of
+        # different 7-letter IDs (24**7), so the sequence can never hand out a number twice
+        migrations.RunSQL(
+            "CREATE SEQUENCE market_id_seq MINVALUE 1 MAXVALUE 4586471424",
+            "DROP SEQUENCE market_id_seq",
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0008_market_id_sequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MarketEvent',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('join', 'Join'), ('trade', 'Trade placed'), ('bankruptcy', 'Bankruptcy'), ('removal', 'Removal'), ('round_finished', 'Round finished'), ('settings_edited', 'Settings edited')], max_length=16)),
+                ('round', models.IntegerField()),
+                ('trader_id', models.IntegerField(blank=True, null=True)),
+                ('duration_ms', models.FloatField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('market', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='market.market')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='marketevent',
+            index=models.Index(fields=['market', 'created_at'], name='event_market_created_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.25 on 2026-10-19 15:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('market', '0009_market_event'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='trader',
+            name='robot_code',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='trader',
+            name='robot_log',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
@@ -1,21 +1,27 @@
-from django.db import models
-from django.utils.crypto import get_random_string
+from django.db import models, transaction
+from django.db.models import F
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
 from decimal import Decimal
-from random import choice
 
+from .market_ids import new_market_ids
+from .slow_queries import TracedQuerySet, traced_query
 
-def new_unique_market_id():
+
+def spectrum_fraction(ordinal):
     """
-    Create a new unique market ID (8 alphabetic chars)
+    Returns the fraction (0 <= fraction <= 1) of the production cost range given to the trader
+    with the given join ordinal (0, 1, 2, ...) on a market: 0, 1, 1/2, 1/4, 3/4, 1/8, 5/8, 3/8, 7/8, ...
+    From the third trader on, this is the van der Corput sequence: each new fraction lies in
+    one of the largest gaps left by the previous ones, so the costs cover the whole spectrum.
     """
-    while True:
-        market_id = get_random_string(
-            8, allowed_chars='ABCDEFGHIJKLMSOPQRSTUVXYZ')
-        if not Market.objects.filter(market_id=market_id).exists():
-            break
-    return market_id
+    if ordinal < 2:
+        return Decimal(ordinal)
+    # The van der Corput number of n is n's binary digits mirrored around the binary point
+    n = ordinal - 1
+    num_bits = n.bit_length()
+    mirrored = int(format(n, 'b')[::-1], 2)
+    return Decimal(mirrored) / Decimal(2 ** num_bits)
 
 
 class Market(models.Model):
@@ -88,6 +94,24 @@ class Market(models.Model):
 
     game_over = models.BooleanField(default=False)
 
+    # When a finished or deleted market is moved to cold storage (see archive.py), its traders,
+    # trades and round stats are removed from the database and this value is set to True:
+    archived = models.BooleanField(default=False)
+
+    # Number of traders who have been given a production cost by Trader.prod_cost_algorithm().
+    # Only ever incremented in the database. Traders join while the host's market object is in
+    # memory, so the host's views save the market with update_fields, without this field
+    num_prod_costs_assigned = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            # Serves the 'my markets' listing: a host's non-deleted markets, newest first
+            models.Index(
+                fields=['created_by', '-created_at'],
+                condition=models.Q(deleted=False),
+                name='market_host_live_idx'),
+        ]
+
     def check_game_over(self):
         """ 
         Checks if the game state should be set to game_over. 
@@ -98,15 +122,16 @@ class Market(models.Model):
     def save(self, *args, **kwargs):
         """
         Do the following before creating a new market object:
-            *) Set unique custom id for market
+            *) Set unique custom id for market (see market_ids.py)
         """
         if not self.market_id:  # <== we are in fact creating a new market (not updating an existing market)
-            self.market_id = new_unique_market_id()
+            self.market_id = new_market_ids(1)[0]
         super(Market, self).save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.market_id}[{self.round}]:{self.alpha},{self.theta},{self.gamma},"
 
+    @traced_query
     def all_traders(self):
         """
         Returns a query set of all (possible removed) traders on the market.
@@ -116,6 +141,7 @@ class Market(models.Model):
             market=self).order_by('-balance')
         return all_traders
 
+    @traced_query
     def active_traders(self):
         """
         Returns a query set of all active traders on the market.
@@ -127,12 +153,14 @@ class Market(models.Model):
             bankrupt=False)
         return active_traders
 
+    @traced_query
     def num_active_traders(self):
         """
         Returns the number of active (non-removed) traders on the market.
         """
         return self.active_traders().count()
 
+    @traced_query
     def active_or_bankrupt_traders(self):
         """
         Returns a query set off all traders that are either active or bankrupt, 
@@ -145,16 +173,18 @@ class Market(models.Model):
         ).order_by('-balance')
         return active_or_bankrupt_traders
 
+    @traced_query
     def all_trades_this_round(self):
         """ 
         Returns all (including forced trades and trades made by removed traders) on this market in the current round.
         """
         all_trades = Trade.objects.filter(
+            market=self,
             round=self.round,
-            trader__in=Trader.objects.filter(market=self),
         )
         return all_trades
 
+    @traced_query
     def valid_trades_this_round(self):
         """ 
         Returns the number of valid trades on this market in the current round.
@@ -166,6 +196,7 @@ class Market(models.Model):
         )
         return valid_trades
 
+    @traced_query
     def num_ready_traders(self):
         """
         Returns the number of 'ready' traders on the market.
@@ -173,6 +204,7 @@ class Market(models.Model):
         """
         return self.valid_trades_this_round().count()
 
+    @traced_query
     def num_bankrupt_traders(self):
         """
         Returns the number of 'bankrupt' (and non-removed) traders on the market.
@@ -183,6 +215,7 @@ class Market(models.Model):
             bankrupt=True).count()
         return num_bankrupt_traders
 
+    @traced_query
     def all_are_bankrupt(self):
         """
         Returns True if at leat one trader is bankrupt and there are no active traders left in the game. 
@@ -191,6 +224,19 @@ class Market(models.Model):
             if self.num_active_traders() == 0:
                 return True
 
+    @traced_query
+    def all_are_robots(self):
+        """
+        Returns True if the market allows robots and all of its active traders (at least one) are
+        robots that play on the server, so the remaining rounds can be fast-forwarded (see fast_forward.py).
+        """
+        if not self.allow_robots or self.game_over:
+            return False
+        counts = self.active_traders().aggregate(
+            traders=models.Count('id'),
+            robots=models.Count('id', filter=models.Q(auto_play=True) & ~models.Q(robot_code='')))
+        return counts['traders'] > 0 and counts['robots'] == counts['traders']
+
     def max_allowed_price(self):
         """
         Returns the highest price allowed in current round
@@ -221,12 +267,20 @@ class Trader(models.Model):
     # If auto_play is true, the trade algorithm will play all remaining rounds automatically in a game with robots
     auto_play = models.BooleanField(default=False)
 
+    # The Python code of the trade algorithm, run on the server after each round while auto_play is true
+    # (see robots.py), and the log of its latest run
+    robot_code = models.TextField(blank=True, default='')
+    robot_log = models.TextField(blank=True, default='')
+
     # removed_from_market should be True if the host has deleted the trader
     removed_from_market = models.BooleanField(default=False)
 
     # bankrupt will only be True if the trader has declared himself bankrupt
     bankrupt = models.BooleanField(default=False)
 
+    # Querysets remember the query method of Market that built them (see slow_queries.py)
+    objects = TracedQuerySet.as_manager()
+
     class Meta:
         # There can only be one trader with a given name in a given market.
         # Specifying the constraint here to discover bugs in code during development
@@ -235,6 +289,17 @@ class Trader(models.Model):
             models.UniqueConstraint(
                 fields=['market', 'name'], name='market_and_name_unique_together'),
         ]
+        indexes = [
+            # Serves the trader table and charts (all traders on a market ordered by balance)
+            models.Index(
+                fields=['market', '-balance'],
+                name='trader_market_balance_idx'),
+            # Serves active_traders() and num_active_traders(), polled every second
+            models.Index(
+                fields=['market', '-balance'],
+                condition=models.Q(removed_from_market=False, bankrupt=False),
+                name='trader_active_balance_idx'),
+        ]
 
     def save(self, *args, **kwargs):
         """
@@ -264,41 +329,21 @@ class Trader(models.Model):
     def prod_cost_algorithm(self):
         """ 
         Used when market.min_cost < market.max_cost to produce 
-        semi-random production costs that cover the whole spectrum of 
-        possible production costs 
+        production costs that cover the whole spectrum of possible production costs:
+        the first trader on the market gets min_cost, the second max_cost, the third the
+        cost in the middle, and so on (see spectrum_fraction()).
         """
-
-        # Get all unused production costs
-        unused_costs = UnusedCosts.objects.filter(
-            market=self.market)
-
-        # If there are any unused costs,
-        if len(unused_costs) > 0:
-            # pick one at random
-            rnd_unused_cost = choice(unused_costs)
-            self.prod_cost = rnd_unused_cost.cost
-            # then move it to the used costs
-            UsedCosts(cost=self.prod_cost,
-                      market=self.market).save()
-            rnd_unused_cost.delete()
-
-        # If there are no unused costs,
-        else:
-            # use the costs "between" each pair of used costs as new unused costs
-            all_used_costs = UsedCosts.objects.filter(
-                market=self.market).order_by('cost')
-            for i in range(len(all_used_costs)-1):
-                new_unused_cost = (all_used_costs[i].cost/2
-                                   + all_used_costs[i+1].cost/2)
-                UnusedCosts(cost=new_unused_cost,
-                            market=self.market).save()
-            # then pick one of the new unused costs for this trader
-            rnd_unused_cost = choice(
-                UnusedCosts.objects.filter(market=self.market))
-            self.prod_cost = rnd_unused_cost.cost
-            UsedCosts(cost=self.prod_cost,
-                      market=self.market).save()
-            rnd_unused_cost.delete()
+        with transaction.atomic():
+            # The UPDATE locks the market row until the transaction ends,
+            # so traders joining at the same time are given different ordinals
+            Market.objects.filter(pk=self.market_id).update(
+                num_prod_costs_assigned=F('num_prod_costs_assigned') + 1)
+            ordinal = Market.objects.values_list(
+                'num_prod_costs_assigned', flat=True).get(pk=self.market_id) - 1
+
+        cost_range = self.market.max_cost - self.market.min_cost
+        self.prod_cost = (self.market.min_cost + cost_range *
+                          spectrum_fraction(ordinal)).quantize(Decimal('0.01'))
 
     def __str__(self):
         return f"{self.name} [{self.market.market_id}] - ${self.balance}"
@@ -340,6 +385,10 @@ class Trader(models.Model):
 class Trade(models.Model):
     trader = models.ForeignKey(Trader, on_delete=models.CASCADE)
 
+    # Denormalized copy of trader.market, so per-market lookups don't have to go through the trader table.
+    # The (market, round) index below covers lookups on market alone, so the FK doesn't get its own index.
+    market = models.ForeignKey(Market, on_delete=models.CASCADE, db_index=False)
+
     prod_cost = models.DecimalField(
         null=True,
         max_digits=12,
@@ -390,6 +439,9 @@ class Trade(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True, null=True)
 
+    # Querysets remember the query method of Market that built them (see slow_queries.py)
+    objects = TracedQuerySet.as_manager()
+
     class Meta:
         # There can only be one trade pr trader pr round
         # Specifying the constraint here to discover bugs in code during development
@@ -397,6 +449,20 @@ class Trade(models.Model):
             models.UniqueConstraint(
                 fields=['trader', 'round'], name='trader_and_round_unique_together'),
         ]
+        indexes = [
+            # Serves all_trades_this_round() and valid_trades_this_round(), polled every second
+            models.Index(
+                fields=['market', 'round'],
+                name='trade_market_round_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        A trade always belongs to the market of its trader.
+        """
+        if not self.market_id:
+            self.market_id = self.trader.market_id
+        super(Trade, self).save(*args, **kwargs)
 
     def __str__(self):
         return f"{self.trader.name} ${self.unit_price} x {self.unit_amount} [{self.trader.market.market_id}][{self.round}]"
@@ -432,33 +498,51 @@ class RoundStat(models.Model):
         return f"{self.market.market_id}[{self.round}]"
 
 
-class UnusedCosts(models.Model):
-    market = models.ForeignKey(Market, on_delete=models.CASCADE)
-    cost = models.DecimalField(max_digits=14, decimal_places=2,
-                               validators=[MinValueValidator(Decimal('0.01'))])
-
-    class Meta:
-        # There cannot be unused costs of the same value in the same market
-        constraints = [
-            models.UniqueConstraint(
-                fields=['market', 'cost'], name='market_and_unused_cost_unique_together'),
-        ]
+class MarketEvent(models.Model):
+    """
+    An entry in the append-only event log of a market (see events.py): something a trader or
+    the host did, when, in which round, and how long the server took to do it.
+    Events are only ever inserted, never updated.
+    """
+    JOIN = 'join'
+    TRADE = 'trade'
+    BANKRUPTCY = 'bankruptcy'
+    REMOVAL = 'removal'
+    ROUND_FINISHED = 'round_finished'
+    SETTINGS_EDITED = 'settings_edited'
+    KIND_CHOICES = [
+        (JOIN, 'Join'),
+        (TRADE, 'Trade placed'),
+        (BANKRUPTCY, 'Bankruptcy'),
+        (REMOVAL, 'Removal'),
+        (ROUND_FINISHED, 'Round finished'),
+        (SETTINGS_EDITED, 'Settings edited'),
+    ]
+
+    market = models.ForeignKey(Market, on_delete=models.CASCADE, db_index=False)
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    round = models.IntegerField()
 
-    def __str__(self):
-        return f"{self.cost}"
+    # Not a foreign key: traders removed in round 0 are deleted, but their events are kept
+    trader_id = models.IntegerField(null=True, blank=True)
 
+    # Time the server spent on the action, e.g. the settlement of a finished round
+    duration_ms = models.FloatField(null=True, blank=True)
 
-class UsedCosts(models.Model):
-    market = models.ForeignKey(Market, on_delete=models.CASCADE)
-    cost = models.DecimalField(max_digits=14, decimal_places=2,
-                               validators=[MinValueValidator(Decimal('0.01'))])
+    created_at = models.DateTimeField(auto_now_add=True)
 
     class Meta:
-        # There cannot be used costs of the same value in the same market
-        constraints = [
-            models.UniqueConstraint(
-                fields=['market', 'cost'], name='market_and_used_cost_unique_together'),
+        indexes = [
+            # Serves the timeline of a market (all its events in order)
+            models.Index(
+                fields=['market', 'created_at'],
+                name='event_market_created_idx'),
         ]
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Market events are append-only and can't be changed")
+        super().save(*args, **kwargs)
+
     def __str__(self):
-        return f"{self.cost}"
+        return f"{self.kind} [{self.market_id}][{self.round}]"
@@ -0,0 +1,161 @@
+"""
+Profiling of single requests on demand, for staff users (see ProfilingMiddleware in middleware.py).
+
+A staff user profiles a request by adding ?profile to the URL (e.g. /ABCDEFG/monitor/?profile)
+or by sending the header X-Profile. The request runs under cProfile while a sampler thread
+records the stack of the request every millisecond. Each profile is stored in
+settings.PROFILE_DIR as three files:
+
+ - <name>.prof: the cProfile stats (open with python -m pstats, snakeviz, ...)
+ - <name>.txt: the call tree as text: the functions with the most cumulative time, and the
+   functions each of them calls
+ - <name>.folded: the sampled stacks in the "folded" format of flamegraph.pl and speedscope.app
+
+The profiles are listed at /profiles/ (see views.profiles).
+"""
+
+import cProfile
+import io
+import pstats
+import re
+import sys
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+
+# Seconds between samples of the stack
+SAMPLE_INTERVAL = 0.001
+
+# Number of functions in the call tree
+CALL_TREE_LENGTH = 60
+
+PROFILE_SUFFIXES = ('.prof', '.txt', '.folded')
+PROFILE_FILENAME_RE = re.compile(r'^[\w-]+\.(prof|txt|folded)$')
+
+
+def asks_for_profile(request):
+    return 'profile' in request.GET or 'HTTP_X_PROFILE' in request.META
+
+
+def wants_profile(request):
+    """ True if a staff user asks for a profile of the request (looks up the user, if not done already) """
+    if not asks_for_profile(request):
+        return False
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+def profile_dir():
+    return Path(settings.PROFILE_DIR)
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return f"{Path(code.co_filename).name}:{code.co_name}"
+
+
+def folded_stack(frame):
+    """ The stack of the frame, outermost first, e.g. 'wsgi.py:__call__;views.py:monitor' """
+    names = []
+    while frame is not None:
+        names.append(frame_name(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class StackSampler(threading.Thread):
+    """ Counts the stacks of another thread, sampled every SAMPLE_INTERVAL seconds """
+
+    def __init__(self, thread_id):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.wait(SAMPLE_INTERVAL):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[folded_stack(frame)] += 1
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def profile_name(request):
+    """ E.g. 20211103-101530-123456_market-monitor_ABCDEFG """
+    match = request.resolver_match
+    parts = [datetime.now().strftime('%Y%m%d-%H%M%S-%f')]
+    if match is not None:
+        parts.append(match.view_name)
+        if 'market_id' in match.kwargs:
+            parts.append(match.kwargs['market_id'])
+    return re.sub(r'[^\w-]', '-', '_'.join(parts))
+
+
+@contextmanager
+def profiled(request):
+    """
+    Profiles the code inside the with block as the request, and stores the profile.
+    Yields a dict, which gets the name of the profile (key 'name') after the with block.
+    Under ASGI only the event loop's thread is profiled, not the threads of sync_to_async.
+    """
+    profile = {}
+    profiler = cProfile.Profile()
+    sampler = StackSampler(threading.get_ident())
+    sampler.start()
+    profiler.enable()
+    try:
+        yield profile
+    finally:
+        profiler.disable()
+        sampler.stop()
+
+    profile['name'] = profile_name(request)
+    save_profile(profile['name'], profiler, sampler.stacks)
+
+
+def save_profile(name, profiler, stacks):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+
+    profiler.dump_stats(directory / f"{name}.prof")
+
+    call_tree = io.StringIO()
+    stats = pstats.Stats(profiler, stream=call_tree).sort_stats('cumulative')
+    stats.print_stats(CALL_TREE_LENGTH)
+    stats.print_callees(CALL_TREE_LENGTH)
+    (directory / f"{name}.txt").write_text(call_tree.getvalue())
+
+    (directory / f"{name}.folded").write_text(
+        ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common()))
+
+
+def list_profiles():
+    """ The stored profiles, newest first, as dicts with the name, time and files (filename and kind, e.g. 'txt') """
+    profiles = {}
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    for path in directory.iterdir():
+        if not PROFILE_FILENAME_RE.match(path.name):
+            continue
+        profile = profiles.setdefault(path.stem, {
+            'name': path.stem, 'created_at': datetime.fromtimestamp(path.stat().st_mtime), 'files': []})
+        profile['files'].append({'filename': path.name, 'kind': path.suffix[1:]})
+    for profile in profiles.values():
+        profile['files'].sort(key=lambda file: PROFILE_SUFFIXES.index('.' + file['kind']))
+    return sorted(profiles.values(), key=lambda profile: profile['name'], reverse=True)
+
+
+def profile_file_path(filename):
+    """ The path of a stored profile file, or None if there is no such file """
+    if not PROFILE_FILENAME_RE.match(filename):
+        return None
+    path = profile_dir() / filename
+    return path if path.is_file() else None
@@ -0,0 +1,155 @@
+"""
+Timing of requests (see RequestTimingMiddleware in middleware.py).
+
+For every request we measure the total time, the number and time of database queries, the
+time spent rendering templates and the hits and misses of the session cache. The numbers are
+sent to the browser in a Server-Timing header (shown under "Timing" in the network tab of the
+developer tools) and written to the log as one line per request.
+
+The measurements of the current request are collected in a RequestTiming object, kept in a
+context variable, so code of the request that runs in other threads (e.g. the database work of
+the async views) is measured too. The database queries are counted by an execute wrapper that
+every database connection gets when it is opened (see apps.py), the templates by the template backend TimedDjangoTemplates (see TEMPLATES in
+settings.py), and the session cache by market/session_store.py. Queries made while a template
+is rendered (e.g. by a lazy queryset) count both as database time and as template time.
+Slow queries are also logged by the execute wrapper (see slow_queries.py).
+"""
+
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.template import TemplateDoesNotExist
+from django.template.backends.django import DjangoTemplates, Template, reraise
+
+from . import slow_queries
+
+_timing = ContextVar('request_timing', default=None)
+
+
+class RequestTiming:
+    """ The measurements of a single request """
+
+    def __init__(self, request=None):
+        self.request = request
+        self.start = time.perf_counter()
+        self.total_seconds = None
+        self.db_queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.rendering = False
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            result = execute(sql, params, many, context)
+        finally:
+            seconds = time.perf_counter() - start
+            self.db_queries += 1
+            self.db_seconds += seconds
+        if not many:
+            slow_queries.check(sql, params, seconds, context['connection'], self.request)
+        return result
+
+    def stop(self):
+        self.total_seconds = time.perf_counter() - self.start
+
+    def server_timing(self, view_name):
+        """ The value of the Server-Timing header """
+        return ', '.join([
+            f'total;dur={self.total_seconds * 1000:.1f}',
+            f'db;desc="{self.db_queries} queries";dur={self.db_seconds * 1000:.1f}',
+            f'tpl;desc="templates";dur={self.template_seconds * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hits / {self.cache_misses} misses"',
+            f'view;desc="{view_name}"',
+        ])
+
+    def log_line(self, request, response, view_name):
+        """ One line of key=value pairs, easy to grep and to parse """
+        return ' '.join([
+            f'view={view_name}',
+            f'method={request.method}',
+            f'path={request.path}',
+            f'status={response.status_code}',
+            f'total_ms={self.total_seconds * 1000:.1f}',
+            f'db_queries={self.db_queries}',
+            f'db_ms={self.db_seconds * 1000:.1f}',
+            f'template_ms={self.template_seconds * 1000:.1f}',
+            f'cache_hits={self.cache_hits}',
+            f'cache_misses={self.cache_misses}',
+        ])
+
+
+def current_timing():
+    """ The RequestTiming of the current request, or None outside requests """
+    return _timing.get()
+
+
+@contextmanager
+def timed_request(request=None):
+    """ Measures everything inside the with block as one request """
+    timing = RequestTiming(request)
+    token = _timing.set(timing)
+    try:
+        yield timing
+    finally:
+        timing.stop()
+        _timing.reset(token)
+
+
+def execute_wrapper(execute, sql, params, many, context):
+    timing = current_timing()
+    if timing is None:
+        return execute(sql, params, many, context)
+    return timing.execute_wrapper(execute, sql, params, many, context)
+
+
+def install_execute_wrapper(sender, connection, **kwargs):
+    """ Receiver of the connection_created signal (see apps.py) """
+    # The same connection object is reused for the next connection of the thread
+    if execute_wrapper not in connection.execute_wrappers:
+        connection.execute_wrappers.append(execute_wrapper)
+
+
+def record_cache_lookup(hit):
+    timing = current_timing()
+    if timing is not None:
+        if hit:
+            timing.cache_hits += 1
+        else:
+            timing.cache_misses += 1
+
+
+class TimedTemplate(Template):
+    """ A template that adds its render time to the current request """
+
+    def render(self, context=None, request=None):
+        timing = current_timing()
+        if timing is None or timing.rendering:
+            # Templates rendered by other templates (e.g. the templates of crispy forms)
+            # are part of the time of the outermost template
+            return super().render(context, request)
+        timing.rendering = True
+        start = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timing.template_seconds += time.perf_counter() - start
+            timing.rendering = False
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The Django template backend with timed templates.
+    """
+
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return TimedTemplate(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            reraise(exc, self)
@@ -0,0 +1,228 @@
+"""
+Runs the trading algorithms of robot traders. Started by robots.py in a subprocess, so it
+doesn't import Django or anything else from the project.
+
+Usage: python -I robot_runner.py <cpu seconds> <memory in MB> <number of jobs>
+
+First sandboxes the process (see sandbox()). Then reads one JSON object per line from stdin,
+with a trader's Python code, the constants of code_header.py and a seed for the random module
+(or null). For each of them, it runs the code with the constants as its globals, and writes a
+line with a JSON object with the raw values of price_choice and amount_choice, what the code
+printed, and the error (if any) to stdout.
+
+The sandbox:
+ - limits the CPU time (cpu seconds for each job) and memory of the process,
+ - imports the modules the code may use, and then switches to the user nobody (when started
+   as root, as in the docker container),
+ - installs a seccomp filter that makes the system calls for opening files, sockets, changing
+   the file system, starting programs or processes and reaching other processes fail. So the
+   code can't read or change any file (not even the Python library), or connect to anything.
+The code only gets the modules in ALLOWED_MODULES and no open(). That alone is not a sandbox
+(there are ways around it in Python), it just gives a clear error to ordinary code.
+"""
+
+import builtins
+import ctypes
+import errno
+import os
+import pwd
+import io
+import json
+import math
+import random
+import resource
+import sys
+import traceback
+from contextlib import redirect_stdout
+from functools import lru_cache
+
+# At most this many characters of what the code prints are sent back
+MAX_OUTPUT = 2000
+
+
+def number_or_none(value):
+    """ Only plain numbers are sent back, anything else is treated as undefined by robots.py """
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        return None
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    return value
+
+
+ALLOWED_MODULES = ('math', 'random', 'statistics')
+
+REMOVED_BUILTINS = ('open', 'input', 'breakpoint', 'help', 'compile', 'exec', 'eval')
+
+UNPRIVILEGED_USER = 'nobody'
+
+# Numbers of the system calls the seccomp filter makes fail, for each architecture
+# (AUDIT_ARCH_* and the numbers of the kernel's unistd.h)
+DENIED_SYSCALLS = {
+    'x86_64': (0xC000003E, {
+        'open': 2, 'creat': 85, 'openat': 257, 'openat2': 437, 'open_by_handle_at': 304,
+        'socket': 41, 'socketpair': 53, 'connect': 42, 'bind': 49,
+        'unlink': 87, 'unlinkat': 263, 'rename': 82, 'renameat': 264, 'renameat2': 316,
+        'rmdir': 84, 'mkdir': 83, 'mkdirat': 258, 'mknod': 133, 'mknodat': 259,
+        'link': 86, 'linkat': 265, 'symlink': 88, 'symlinkat': 266,
+        'chmod': 90, 'fchmodat': 268, 'fchmodat2': 452, 'chown': 92, 'lchown': 94, 'fchownat': 260,
+        'truncate': 76, 'utime': 132, 'utimes': 235, 'utimensat': 280,
+        'setxattr': 188, 'removexattr': 197, 'mount': 165,
+        'execve': 59, 'execveat': 322, 'fork': 57, 'vfork': 58, 'clone': 56, 'clone3': 435,
+        'kill': 62, 'tkill': 200, 'tgkill': 234, 'rt_sigqueueinfo': 129, 'rt_tgsigqueueinfo': 297,
+        'pidfd_open': 434, 'pidfd_getfd': 438, 'pidfd_send_signal': 424,
+        'ptrace': 101, 'process_vm_readv': 310, 'process_vm_writev': 311, 'io_uring_setup': 425,
+    }),
+    'aarch64': (0xC00000B7, {
+        'openat': 56, 'openat2': 437, 'open_by_handle_at': 265,
+        'socket': 198, 'socketpair': 199, 'connect': 203, 'bind': 200,
+        'unlinkat': 35, 'renameat': 38, 'renameat2': 276, 'mkdirat': 34, 'mknodat': 33,
+        'linkat': 37, 'symlinkat': 36, 'fchmodat': 53, 'fchmodat2': 452, 'fchownat': 54,
+        'truncate': 45, 'utimensat': 88, 'setxattr': 5, 'removexattr': 14, 'mount': 40,
+        'execve': 221, 'execveat': 281, 'clone': 220, 'clone3': 435,
+        'kill': 129, 'tkill': 130, 'tgkill': 131, 'rt_sigqueueinfo': 138, 'rt_tgsigqueueinfo': 240,
+        'pidfd_open': 434, 'pidfd_getfd': 438, 'pidfd_send_signal': 424,
+        'ptrace': 117, 'process_vm_readv': 270, 'process_vm_writev': 271, 'io_uring_setup': 425,
+    }),
+}
+
+# From linux/prctl.h, linux/seccomp.h and linux/filter.h
+PR_SET_NO_NEW_PRIVS = 38
+PR_SET_SECCOMP = 22
+SECCOMP_MODE_FILTER = 2
+SECCOMP_RET_KILL_PROCESS = 0x80000000
+SECCOMP_RET_ERRNO = 0x00050000
+SECCOMP_RET_ALLOW = 0x7FFF0000
+BPF_LOAD_WORD = 0x20  # BPF_LD | BPF_W | BPF_ABS
+BPF_JUMP_EQUAL = 0x15  # BPF_JMP | BPF_JEQ | BPF_K
+BPF_JUMP_GREATER_EQUAL = 0x35  # BPF_JMP | BPF_JGE | BPF_K
+BPF_RETURN = 0x06  # BPF_RET | BPF_K
+X32_SYSCALL_BIT = 0x40000000
+
+
+class SockFilter(ctypes.Structure):
+    _fields_ = [('code', ctypes.c_ushort), ('jt', ctypes.c_ubyte), ('jf', ctypes.c_ubyte), ('k', ctypes.c_uint)]
+
+
+class SockFprog(ctypes.Structure):
+    _fields_ = [('len', ctypes.c_ushort), ('filter', ctypes.POINTER(SockFilter))]
+
+
+def restricted_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level != 0 or name not in ALLOWED_MODULES:
+        raise ImportError(f"Robotter kan kun importere modulerne {', '.join(ALLOWED_MODULES)}")
+    return builtins.__import__(name, globals, locals, fromlist, level)
+
+
+ROBOT_BUILTINS = {name: value for name, value in vars(builtins).items() if name not in REMOVED_BUILTINS}
+ROBOT_BUILTINS['__import__'] = restricted_import
+
+
+def limit_resources(cpu_seconds, memory_mb):
+    memory = memory_mb * 1024 * 1024
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds))
+    resource.setrlimit(resource.RLIMIT_AS, (memory, memory))
+    resource.setrlimit(resource.RLIMIT_FSIZE, (0, 0))
+    resource.setrlimit(resource.RLIMIT_NPROC, (0, 0))
+
+
+def drop_privileges():
+    """ Switches to the unprivileged user, when started as root """
+    if os.getuid() != 0:
+        return
+    user = pwd.getpwnam(UNPRIVILEGED_USER)
+    os.setgroups([])
+    os.setgid(user.pw_gid)
+    os.setuid(user.pw_uid)
+
+
+def seccomp_filter():
+    """ The BPF program that makes the DENIED_SYSCALLS of this architecture fail with EPERM """
+    machine = os.uname().machine
+    if machine not in DENIED_SYSCALLS:
+        raise RuntimeError(f"No seccomp filter for {machine}")
+    arch, syscalls = DENIED_SYSCALLS[machine]
+
+    checks = []
+    if machine == 'x86_64':
+        # The x32 numbers of the same system calls
+        checks.append((BPF_JUMP_GREATER_EQUAL, X32_SYSCALL_BIT))
+    checks += [(BPF_JUMP_EQUAL, number) for number in sorted(syscalls.values())]
+
+    # Kill the process on another architecture (where the numbers mean something else),
+    # load the number of the system call, jump to the last instruction if it is denied
+    program = [(BPF_LOAD_WORD, 0, 0, 4),
+               (BPF_JUMP_EQUAL, 1, 0, arch),
+               (BPF_RETURN, 0, 0, SECCOMP_RET_KILL_PROCESS),
+               (BPF_LOAD_WORD, 0, 0, 0)]
+    denied = len(program) + len(checks) + 1
+    for code, value in checks:
+        program.append((code, denied - len(program) - 1, 0, value))
+    program.append((BPF_RETURN, 0, 0, SECCOMP_RET_ALLOW))
+    program.append((BPF_RETURN, 0, 0, SECCOMP_RET_ERRNO | errno.EPERM))
+    return (SockFilter * len(program))(*program)
+
+
+def deny_syscalls():
+    instructions = seccomp_filter()
+    program = SockFprog(len(instructions), instructions)
+    libc = ctypes.CDLL(None, use_errno=True)
+    libc.prctl.argtypes = [ctypes.c_int, ctypes.c_ulong, ctypes.c_void_p, ctypes.c_ulong, ctypes.c_ulong]
+    if (libc.prctl(PR_SET_NO_NEW_PRIVS, 1, None, 0, 0) != 0
+            or libc.prctl(PR_SET_SECCOMP, SECCOMP_MODE_FILTER, ctypes.addressof(program), 0, 0) != 0):
+        raise OSError(ctypes.get_errno(), "Could not install the seccomp filter")
+
+
+def sandbox(cpu_seconds, memory_mb):
+    limit_resources(cpu_seconds, memory_mb)
+    for module in ALLOWED_MODULES:
+        __import__(module)
+    # Everything the runner needs later must be loaded before files can't be opened
+    run('raise ValueError', {})
+    run('(', {})
+    drop_privileges()
+    deny_syscalls()
+
+
+@lru_cache(maxsize=64)
+def compiled(code):
+    """ A robot's code is the same in every round, so it is only compiled once per process """
+    return compile(code, '<robot>', 'exec')
+
+
+def run(code, constants):
+    """ Runs the code with the constants as globals. Also used by tournament.py """
+    namespace = dict(constants, __name__='__main__', __builtins__=ROBOT_BUILTINS)
+    output = io.StringIO()
+    error = None
+    try:
+        with redirect_stdout(output):
+            exec(compiled(code), namespace)
+    except BaseException as exception:
+        # Also SystemExit and KeyboardInterrupt, so the result is always written
+        error = ''.join(traceback.format_exception_only(type(exception), exception)).strip()
+    return {
+        'price_choice': number_or_none(namespace.get('price_choice')),
+        'amount_choice': number_or_none(namespace.get('amount_choice')),
+        'output': output.getvalue()[:MAX_OUTPUT],
+        'error': error,
+    }
+
+
+def main():
+    cpu_seconds, memory_mb, jobs = map(int, sys.argv[1:4])
+    try:
+        sandbox(cpu_seconds * jobs, memory_mb)
+    except (OSError, RuntimeError, KeyError) as error:
+        # Never run the code without the sandbox
+        sys.exit(f"Robotter kan ikke køres sikkert på denne server ({error})")
+    for line in iter(sys.stdin.readline, ''):
+        job = json.loads(line)
+        if job.get('seed') is not None:
+            random.seed(job['seed'])
+        result = run(job['code'], job['constants'])
+        sys.stdout.write(json.dumps(result) + '\n')
+        sys.stdout.flush()
+
+
+if __name__ == '__main__':
+    main()
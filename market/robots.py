@@ -0,0 +1,363 @@
+"""
+Server-side execution of the trading algorithms of robot traders (traders with auto_play).
+
+When a trader starts a robot on the play page, the Python code of the algorithm is stored on
+the trader (Trader.robot_code). After each round, finish_round calls play_robots(), which runs
+the code of all robots on the market and places their trades for the new round with one bulk
+insert, so the robots keep playing when the student's browser is closed.
+
+Each algorithm runs in its own sandboxed subprocess (robot_runner.py: limits on CPU time and
+memory, the user nobody, and a seccomp filter that stops it from opening files and sockets,
+changing files and starting processes) with a timeout. The subprocess of each robot is kept
+running between the rounds (see warm_pool), and at most settings.ROBOT_WORKERS of them run at
+the same time, within a total time budget for all the robots of the round. The code gets the
+same constants as in code_header.py on the play page, and its price_choice and amount_choice
+are cleaned the same way as in the browser (see play.robots.html).
+"""
+
+import json
+import logging
+import math
+import select
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from .models import MarketEvent, RoundStat, Trade, Trader
+
+logger = logging.getLogger(__name__)
+
+RUNNER = Path(__file__).resolve().parent / 'robot_runner.py'
+
+LIMIT_ERROR = 'Koden brugte for meget tid eller hukommelse.'
+OUTPUT_ERROR = 'Koden skrev ugyldigt output.'
+
+# The key has the market settings the constants depend on, so an edit of the market mid-round
+# (see market_edit) gives new constants
+CONSTANTS_CACHE_KEY = 'market.robots.constants:{trader_id}:{round}:{max_cost}'
+
+
+def robot_constants(market, trader, last_trade, last_round_stat):
+    """ The constants code_header.py gives the trader's code on the play page """
+    def last(field, convert=float):
+        value = getattr(last_trade, field, None) if market.round > 0 else None
+        return None if value is None else convert(value)
+
+    return {
+        'balance': float(trader.balance),
+        'prod_cost': float(trader.prod_cost),
+        'max_amount': math.floor(trader.balance / trader.prod_cost),
+        'max_price': float(4 * market.max_cost),
+        'round': market.round + 1,
+        'amount_last_round': last('unit_amount', int),
+        'price_last_round': last('unit_price'),
+        'avg_price_last_round': (float(last_round_stat.avg_price)
+                                 if market.round > 0 and last_round_stat is not None else None),
+        'demand_last_round': last('demand', int),
+        'profit_last_round': last('profit'),
+    }
+
+
+def current_robot_constants(trader):
+    """
+    The robot constants of the trader in the current round of trader.market, for the play page.
+    They only change when a round is finished or the market is edited, so they are computed once
+    per trader, round and market settings.
+    """
+    market = trader.market
+    key = CONSTANTS_CACHE_KEY.format(trader_id=trader.id, round=market.round, max_cost=market.max_cost)
+    constants = cache.get(key)
+    if constants is None:
+        last_trade = Trade.objects.filter(trader=trader, round=market.round - 1).first()
+        last_round_stat = RoundStat.objects.filter(market=market, round=market.round - 1).first()
+        constants = robot_constants(market, trader, last_trade, last_round_stat)
+        cache.set(key, constants)
+    return constants
+
+
+def runner_command(jobs):
+    # -I: don't read PYTHON* environment variables, the user's site-packages or the current directory
+    return [sys.executable, '-I', str(RUNNER),
+            str(settings.ROBOT_CPU_SECONDS), str(settings.ROBOT_MEMORY_MB), str(jobs)]
+
+
+def run_robot(code, constants):
+    """
+    Runs the code in a sandboxed subprocess and returns the result of robot_runner.py
+    (with the error set if the code failed, ran out of time or memory, or killed the process)
+    """
+    job = json.dumps({'code': code, 'constants': constants}) + '\n'
+    try:
+        # Run in an empty directory, that is deleted afterwards
+        with tempfile.TemporaryDirectory(prefix='robot_') as directory:
+            process = subprocess.run(
+                runner_command(1), input=job, capture_output=True, text=True,
+                timeout=settings.ROBOT_TIMEOUT_SECONDS, cwd=directory, env={},
+            )
+    except subprocess.TimeoutExpired:
+        return failed_run(timeout_error())
+
+    if process.returncode != 0:
+        # Killed by the CPU limit, or out of memory before the result could be written
+        return failed_run(process.stderr.strip().splitlines()[-1] if process.stderr.strip()
+                          else LIMIT_ERROR)
+    try:
+        return json.loads(process.stdout)
+    except ValueError:
+        return failed_run(OUTPUT_ERROR)
+
+
+class RobotProcess:
+    """
+    A robot_runner.py subprocess that runs the code of one robot in many rounds, so Python is
+    only started once for each robot. The CPU limit covers the given number of rounds, after
+    which a new process is started, and the timeout each of them. If the code breaks a limit,
+    the process is killed and a new one is started in the next round.
+    """
+
+    def __init__(self, rounds):
+        self.rounds = rounds
+        self.runs = 0
+        self.process = None
+        self.directory = None
+
+    def start(self):
+        self.directory = tempfile.TemporaryDirectory(prefix='robot_')
+        self.process = subprocess.Popen(
+            runner_command(self.rounds), stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL, text=True, cwd=self.directory.name, env={})
+        self.runs = 0
+
+    def run(self, code, constants, seed=None, deadline=None):
+        """
+        The result of the code (see run_robot). The seed, if any, seeds the random module first.
+        The code is stopped at the deadline (a time.perf_counter() value), if that comes before
+        its timeout.
+        """
+        if self.process is not None and self.runs >= self.rounds:
+            self.close()
+        if self.process is None:
+            self.start()
+        self.runs += 1
+        try:
+            self.process.stdin.write(json.dumps({'code': code, 'constants': constants, 'seed': seed}) + '\n')
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            self.close()
+            return failed_run(LIMIT_ERROR)
+
+        timeout, error = settings.ROBOT_TIMEOUT_SECONDS, timeout_error()
+        if deadline is not None and deadline - time.perf_counter() < timeout:
+            timeout, error = max(deadline - time.perf_counter(), 0), BUDGET_ERROR
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        if not ready:
+            self.close()
+            return failed_run(error)
+        line = self.process.stdout.readline()
+        if not line:
+            self.close()
+            return failed_run(LIMIT_ERROR)
+        try:
+            return json.loads(line)
+        except ValueError:
+            self.close()
+            return failed_run(OUTPUT_ERROR)
+
+    def close(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.communicate()
+            self.directory.cleanup()
+            self.process = None
+
+
+class RobotPool:
+    """
+    A RobotProcess for each robot trader, each for the given number of rounds. Used as a context
+    manager, that stops the processes at the end (as by fast_forward.py), or kept warm across the
+    rounds of the markets (see warm_pool). With max_processes, the processes of the robots that
+    played least recently are stopped when there are more.
+    """
+
+    def __init__(self, rounds, max_processes=None):
+        self.rounds = rounds
+        self.max_processes = max_processes
+        # By trader id, the most recently used last
+        self.processes = OrderedDict()
+        self.busy = set()
+        # play_robots runs the robots in threads
+        self.lock = threading.Lock()
+
+    def run(self, trader, constants, deadline=None):
+        with self.lock:
+            process = self.processes.pop(trader.id, None) or RobotProcess(self.rounds)
+            self.processes[trader.id] = process
+            self.busy.add(trader.id)
+            idle = [trader_id for trader_id in self.processes if trader_id not in self.busy]
+            stopped = [self.processes.pop(trader_id) for trader_id in
+                       idle[:max(len(self.processes) - self.max_processes, 0)]] if self.max_processes else []
+        for old_process in stopped:
+            old_process.close()
+        try:
+            return process.run(trader.robot_code, constants, deadline=deadline)
+        finally:
+            with self.lock:
+                self.busy.discard(trader.id)
+
+    def close(self):
+        with self.lock:
+            processes = list(self.processes.values())
+            self.processes.clear()
+        for process in processes:
+            process.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+_warm_pool = None
+
+
+def warm_pool():
+    """
+    The RobotPool of this (web server) process, that keeps the processes of the robots running
+    between the rounds, so finish_round doesn't start Python for every robot
+    """
+    global _warm_pool
+    if _warm_pool is None:
+        _warm_pool = RobotPool(settings.ROBOT_PROCESS_ROUNDS, settings.ROBOT_WARM_PROCESSES)
+    return _warm_pool
+
+
+BUDGET_ERROR = 'Robotterne på markedet brugte al tiden i denne runde, før din kode blev færdig.'
+
+
+def timeout_error():
+    return f'Koden brugte mere end {settings.ROBOT_TIMEOUT_SECONDS} sekunder.'
+
+
+def failed_run(error):
+    return {'price_choice': None, 'amount_choice': None, 'output': '', 'error': error}
+
+
+def clean_choices(result, constants):
+    """
+    Turns the raw price_choice and amount_choice into a valid price (with 2 decimals) and amount,
+    as play.robots.html does in the browser. Returns (price, amount, warnings).
+    """
+    max_price, max_amount = constants['max_price'], constants['max_amount']
+    warnings = []
+    if result['error']:
+        warnings.append(f"Fejl i din Python-kode: {result['error']}")
+        return Decimal('0.00'), 0, warnings
+
+    price = result['price_choice']
+    if price is None:
+        price = 0
+        warnings.append("Din kode definerer ikke 'price_choice' som et tal. Enhedsprisen bliver sat til 0.00.")
+    elif price < 0:
+        price = 0
+        warnings.append("Din kode definerer en negativ værdi af 'price_choice'. Enhedsprisen bliver sat til 0.00.")
+    elif price > max_price:
+        price = max_price
+        warnings.append(f"'price_choice' er højere end maksimumsprisen. Enhedsprisen bliver sat til {max_price:.2f}.")
+
+    amount = result['amount_choice']
+    if amount is None:
+        amount = 0
+        warnings.append("Din kode definerer ikke 'amount_choice' som et tal. Du producerer derfor 0.")
+    elif amount > max_amount:
+        # max_amount is negative when the balance is
+        amount = max(max_amount, 0)
+        warnings.append(f"'amount_choice' er højere end det tilladte. Du producerer derfor {amount}.")
+    elif amount < 0:
+        amount = 0
+        warnings.append("Din kode definerer en negativ værdi af 'amount_choice'. Du producerer derfor 0.")
+
+    # Rounded as toFixed(2) and Math.round() in the browser (halves are rounded up)
+    return Decimal(f'{price:.2f}'), math.floor(amount + 0.5), warnings
+
+
+def robot_log(market, result, price, amount, warnings):
+    """ The log of the robot's run, shown to the trader on the robot log page """
+    lines = [f'Runde: {market.round + 1}. Markeds-ID: {market.market_id}. '
+             f'{timezone.localtime():%d/%m/%Y, %H:%M:%S}.']
+    if result['output']:
+        lines.append(f"Din kode skrev:\n{result['output'].rstrip()}")
+    lines.extend(f'Advarsel! {warning}' for warning in warnings)
+    lines.append(f'Din endelige enhedspris er {price} kr. og dit produktionstal er {amount}.')
+    return '\n'.join(lines)
+
+
+def play_robots(market, pool=None):
+    """
+    Runs the algorithms of all active robot traders on the market, that haven't traded in the
+    current round, and places their trades. Returns the number of trades placed.
+    The code runs in the processes of the pool, by default the warm_pool(). All the robots get
+    settings.ROBOT_ROUND_SECONDS together, so finish_round stays well within the timeout of the
+    web server; robots that haven't finished by then fail, and trade nothing in the round.
+    """
+    if market.game_over:
+        return 0
+    # Robots started before the host turned allow_robots off don't play either
+    robots = list(market.active_traders().filter(auto_play=True, market__allow_robots=True).exclude(robot_code='')
+                  .exclude(trade__round=market.round))
+    if not robots:
+        return 0
+
+    start = time.perf_counter()
+    deadline = start + settings.ROBOT_ROUND_SECONDS
+    pool = pool if pool is not None else warm_pool()
+    last_trades = {trade.trader_id: trade for trade in
+                   Trade.objects.filter(market=market, round=market.round - 1,
+                                        trader_id__in=[trader.id for trader in robots])}
+    last_round_stat = RoundStat.objects.filter(market=market, round=market.round - 1).first()
+    constants = [robot_constants(market, trader, last_trades.get(trader.id), last_round_stat)
+                 for trader in robots]
+
+    def run(trader, trader_constants):
+        if time.perf_counter() >= deadline:
+            return failed_run(BUDGET_ERROR)
+        try:
+            return pool.run(trader, trader_constants, deadline=deadline)
+        except OSError as error:
+            # The process could not be started, e.g. out of memory
+            return failed_run(f'Koden kunne ikke køres ({error}).')
+
+    with ThreadPoolExecutor(max_workers=settings.ROBOT_WORKERS) as executor:
+        results = list(executor.map(run, robots, constants))
+
+    trades, events = [], []
+    for trader, trader_constants, result in zip(robots, constants, results):
+        price, amount, warnings = clean_choices(result, trader_constants)
+        trader.robot_log = robot_log(market, result, price, amount, warnings)
+        trades.append(Trade(
+            trader=trader, market_id=trader.market_id, round=market.round, unit_price=price, unit_amount=amount,
+            balance_before=trader.balance, prod_cost=trader.prod_cost))
+        events.append(MarketEvent(market=market, kind=MarketEvent.TRADE, round=market.round, trader_id=trader.id))
+        if result['error']:
+            logger.info('Robot of trader %s on market %s failed: %s', trader.id, market.market_id, result['error'])
+
+    duration_ms = (time.perf_counter() - start) * 1000
+    for event in events:
+        event.duration_ms = duration_ms
+    # Every robot trades in the round, or none of them
+    with transaction.atomic():
+        Trade.objects.bulk_create(trades)
+        Trader.objects.bulk_update(robots, ['robot_log'])
+        MarketEvent.objects.bulk_create(events)
+    return len(trades)
@@ -0,0 +1,58 @@
+"""
+Session engine used for all sessions (see SESSION_ENGINE in settings.py).
+
+Players are anonymous: their session only holds trader_id, market_id and username, and it is
+read on every page load of every player. These trader sessions are read from a cache shared by
+all workers, falling back to the database on a cache miss, so an ordinary request from a player
+doesn't touch the django_session table at all. The database row is still written when a trader
+session changes (e.g. when joining a market), so nothing is lost if the cache is cleared.
+
+Sessions of logged in hosts (allauth) are stored and read exactly as with Django's default
+database backend, and are never cached.
+"""
+
+from django.contrib.auth import SESSION_KEY
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.db import SessionStore as DBStore
+
+from .request_timing import record_cache_lookup
+
+KEY_PREFIX = "market.session_store"
+
+
+def is_host_session(data):
+    """ Returns True if the session data belongs to a logged in host """
+    return SESSION_KEY in data
+
+
+class SessionStore(cached_db.SessionStore):
+    """
+    Cached, database backed sessions for traders. Database backed sessions for hosts.
+    """
+    cache_key_prefix = KEY_PREFIX
+
+    def load(self):
+        try:
+            data = self._cache.get(self.cache_key)
+        except Exception:
+            # Some backends raise an exception on invalid cache keys, see cached_db.SessionStore
+            data = None
+        record_cache_lookup(hit=data is not None)
+
+        if data is None:
+            s = self._get_session_from_db()
+            if s:
+                data = self.decode(s.session_data)
+                if not is_host_session(data):
+                    self._cache.set(self.cache_key, data, self.get_expiry_age(expiry=s.expire_date))
+            else:
+                data = {}
+        return data
+
+    def save(self, must_create=False):
+        DBStore.save(self, must_create)
+        if is_host_session(self._session):
+            # E.g. a player who logs in as host on the same device
+            self._cache.delete(self.cache_key)
+        else:
+            self._cache.set(self.cache_key, self._session, self.get_expiry_age())
@@ -0,0 +1,264 @@
+"""
+Capture of slow database queries (see the slow_queries management command).
+
+Every query of a request that takes longer than settings.SLOW_QUERY_SECONDS is logged to the
+logger 'market.slow_queries' (the file settings.SLOW_QUERY_LOG, see LOGGING in settings.py) as
+one JSON object per line, with the view and market of the request and where the query came from:
+
+ - "caller": the innermost line of our own code on the stack when the query ran, e.g. a line
+   in views.py or helpers.py.
+ - "origin": the query methods of Market (all_trades_this_round, valid_trades_this_round, ...)
+   that built or ran the query, e.g. "Market.num_ready_traders > Market.valid_trades_this_round".
+   Querysets are lazy and often run in a template long after the method returned, so the
+   querysets of Trader and Trade remember the method that built them (see TracedQuerySet).
+
+For a slow read-only SELECT, the log entry also gets the plan of EXPLAIN, at most once every
+settings.SLOW_QUERY_EXPLAIN_INTERVAL seconds for the same query in each worker. The query is
+not run again (no ANALYZE), and SELECTs with side effects, like nextval() in market_ids.py or
+SELECT ... FOR UPDATE, are never explained. The EXPLAIN of a request runs after its response
+has been sent (see explain_pending), so it doesn't slow down the request; the entries of such
+queries are logged then.
+"""
+
+import functools
+import json
+import logging
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.db import DatabaseError, connections, models, transaction
+
+logger = logging.getLogger('market.slow_queries')
+
+_local = threading.local()
+
+# Time each query fingerprint was last explained by this worker
+_last_explained = {}
+
+# SELECTs that change something or take locks, so they are never explained
+_NOT_READ_ONLY = re.compile(
+    r"\b(nextval|setval|pg_advisory_\w+|pg_try_advisory_\w+|pg_notify|set_config|lo_\w+|dblink\w*)\s*\("
+    r"|\bFOR\s+(NO\s+KEY\s+)?UPDATE\b|\bFOR\s+(KEY\s+)?SHARE\b|\bINTO\b",
+    re.IGNORECASE)
+
+# Frames of these files are never the caller of a query
+_THIS_FILE = Path(__file__).resolve()
+_SKIPPED_FILES = {_THIS_FILE, _THIS_FILE.with_name('request_timing.py'), _THIS_FILE.with_name('middleware.py')}
+
+
+def origin_stack():
+    if not hasattr(_local, 'origins'):
+        _local.origins = []
+    return _local.origins
+
+
+@contextmanager
+def query_origin(name):
+    """ Queries run inside the with block are marked as coming from name """
+    stack = origin_stack()
+    pushed = name is not None and (not stack or stack[-1] != name)
+    if pushed:
+        stack.append(name)
+    try:
+        yield
+    finally:
+        if pushed:
+            stack.pop()
+
+
+def traced_query(method):
+    """
+    Decorator for the query methods of Market. Queries run by the method, and querysets
+    returned by it, are marked with the name of the method (e.g. 'Market.all_traders').
+    """
+    name = method.__qualname__
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with query_origin(name):
+            result = method(*args, **kwargs)
+        if isinstance(result, TracedQuerySet):
+            result = result.traced(name)
+        return result
+    return wrapper
+
+
+class TracedQuerySet(models.QuerySet):
+    """ A queryset that remembers which query method built it (see traced_query) """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._origin = None
+
+    def traced(self, origin):
+        clone = self._chain()
+        clone._origin = origin
+        return clone
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._origin = self._origin
+        return clone
+
+    def _fetch_all(self):
+        with query_origin(self._origin):
+            super()._fetch_all()
+
+    def count(self):
+        with query_origin(self._origin):
+            return super().count()
+
+    def exists(self):
+        with query_origin(self._origin):
+            return super().exists()
+
+    def aggregate(self, *args, **kwargs):
+        with query_origin(self._origin):
+            return super().aggregate(*args, **kwargs)
+
+    def update(self, **kwargs):
+        with query_origin(self._origin):
+            return super().update(**kwargs)
+
+    update.alters_data = True
+
+
+def fingerprint(sql):
+    """ The SQL with lists of placeholders (e.g. of IN (...)) collapsed, so the same query groups together """
+    return re.sub(r'%s(, %s)+', '%s, ...', sql)
+
+
+def caller():
+    """ The innermost line of our own code on the stack, e.g. 'market/views.py:302 in finish_round' """
+    base_dir = Path(settings.BASE_DIR).resolve()
+    frame = sys._getframe(1)
+    while frame is not None:
+        path = Path(frame.f_code.co_filename).resolve()
+        if (path not in _SKIPPED_FILES and base_dir in path.parents
+                and 'site-packages' not in path.parts):
+            return f"{path.relative_to(base_dir)}:{frame.f_lineno} in {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def read_only(sql):
+    """ Whether the query is a SELECT without side effects or locks, so it is safe to explain """
+    return sql.lstrip()[:6].upper() == 'SELECT' and not _NOT_READ_ONLY.search(sql)
+
+
+def should_explain(sql):
+    """ Whether to explain the query now, at most once every SLOW_QUERY_EXPLAIN_INTERVAL per query """
+    if not read_only(sql):
+        return False
+    key = fingerprint(sql)
+    now = time.monotonic()
+    if now - _last_explained.get(key, -float('inf')) < settings.SLOW_QUERY_EXPLAIN_INTERVAL:
+        return False
+    _last_explained[key] = now
+    return True
+
+
+def explain(alias, sql, params):
+    """ The plan of EXPLAIN of a SELECT, or None if it can't be explained """
+    connection = connections[alias]
+    _local.explaining = True
+    try:
+        # A savepoint, so a failing EXPLAIN doesn't break an open transaction
+        with transaction.atomic(using=alias), connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            return '\n'.join(row[0] for row in cursor.fetchall())
+    except DatabaseError:
+        return None
+    finally:
+        _local.explaining = False
+
+
+def pending():
+    if not hasattr(_local, 'pending'):
+        _local.pending = []
+    return _local.pending
+
+
+def explain_pending(**kwargs):
+    """
+    Explains and logs the slow queries of the request that has just been sent.
+    Connected to the request_finished signal (see apps.py).
+    """
+    queries = pending()
+    while queries:
+        entry, alias, sql, params = queries.pop(0)
+        entry['plan'] = explain(alias, sql, params)
+        logger.warning(json.dumps(entry))
+
+
+def record(sql, params, seconds, connection, request=None):
+    """ Logs a slow query. A query to explain is logged after the response (see explain_pending) """
+    match = getattr(request, 'resolver_match', None)
+    entry = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'duration_ms': round(seconds * 1000, 1),
+        'sql': fingerprint(sql),
+        'params': [str(param) for param in params][:20] if isinstance(params, (list, tuple)) else None,
+        'view': match.view_name if match else None,
+        'market_id': match.kwargs.get('market_id') if match else None,
+        'origin': ' > '.join(origin_stack()) or None,
+        'caller': caller(),
+        'plan': None,
+    }
+    if not should_explain(sql):
+        logger.warning(json.dumps(entry))
+    elif request is None:
+        # Not a request (e.g. a management command), so there is no response to wait for
+        entry['plan'] = explain(connection.alias, sql, params)
+        logger.warning(json.dumps(entry))
+    else:
+        pending().append((entry, connection.alias, sql, params))
+
+
+def check(sql, params, seconds, connection, request=None):
+    """ Logs the query if it is slow. Called after each successful query of a request """
+    threshold = settings.SLOW_QUERY_SECONDS
+    if threshold is None or seconds < threshold or getattr(_local, 'explaining', False):
+        return
+    record(sql, params, seconds, connection, request)
+
+
+def read_log(path):
+    """ The entries of a slow query log file """
+    entries = []
+    with open(path) as log_file:
+        for line in log_file:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                continue
+    return entries
+
+
+def summarize(entries):
+    """
+    Groups the entries by query, with the slowest total time first.
+    Returns a list of dicts with the query, count, total and max time, views, origins and callers,
+    and the latest plan.
+    """
+    groups = {}
+    for entry in entries:
+        group = groups.setdefault(entry['sql'], {
+            'sql': entry['sql'], 'count': 0, 'total_ms': 0.0, 'max_ms': 0.0,
+            'views': set(), 'origins': set(), 'callers': set(), 'plan': None,
+        })
+        group['count'] += 1
+        group['total_ms'] += entry['duration_ms']
+        group['max_ms'] = max(group['max_ms'], entry['duration_ms'])
+        for key, values in (('view', 'views'), ('origin', 'origins'), ('caller', 'callers')):
+            if entry.get(key):
+                group[values].add(entry[key])
+        if entry.get('plan'):
+            group['plan'] = entry['plan']
+    return sorted(groups.values(), key=lambda group: group['total_ms'], reverse=True)
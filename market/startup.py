@@ -0,0 +1,148 @@
+"""
+Start-up time of the server (see the startup_profile management command) and the warm-up of
+gunicorn workers (see config/gunicorn.conf.py).
+
+measure_startup() boots Django the way a gunicorn worker does, phase by phase: importing the
+settings, setting up each app (importing it, importing its models and running its ready()),
+loading the middleware, importing the URLconf and the views, and compiling the templates.
+It must run in a fresh process (python -X importtime -m market.startup), so nothing is imported
+already. The command runs it in a subprocess and also reports the slowest imports, from the
+output of -X importtime.
+
+warm_up() imports the URLconf and compiles all templates, so the first requests after a
+restart are as fast as the rest.
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+# Prefix of the result line printed by main()
+RESULT_PREFIX = 'STARTUP_PROFILE '
+
+
+def template_names(engine):
+    """ The names of all files in the template directories of the engine """
+    names = set()
+    for directory in engine.template_dirs:
+        directory = Path(directory)
+        for path in directory.rglob('*'):
+            if path.is_file() and not path.name.startswith('.'):
+                names.add(path.relative_to(directory).as_posix())
+    return sorted(names)
+
+
+def warm_up():
+    """
+    Imports the URLconf (and so all views) and compiles all templates into the template cache.
+    Returns the number of templates compiled. Templates are only kept when the cached template
+    loader is used, which Django does when DEBUG is off.
+    """
+    from django.template import TemplateDoesNotExist, TemplateSyntaxError, engines
+    from django.urls import get_resolver
+
+    get_resolver().url_patterns
+    compiled = 0
+    for engine in engines.all():
+        for name in template_names(engine):
+            try:
+                engine.get_template(name)
+                compiled += 1
+            except (TemplateDoesNotExist, TemplateSyntaxError, UnicodeDecodeError):
+                # Files in the template directories that aren't Django templates
+                continue
+    return compiled
+
+
+def timed_apps(timings):
+    """
+    Patches AppConfig, so django.setup() records the time of each app: importing it, importing
+    its models and running its ready() method (in milliseconds)
+    """
+    from django.apps import AppConfig
+
+    create, import_models = AppConfig.create.__func__, AppConfig.import_models
+
+    def timed_create(cls, entry):
+        start = time.perf_counter()
+        app_config = create(cls, entry)
+        app_timings = timings.setdefault(app_config.label, {'import': 0.0, 'models': 0.0, 'ready': 0.0})
+        app_timings['import'] = (time.perf_counter() - start) * 1000
+
+        ready = app_config.ready
+
+        def timed_ready():
+            start = time.perf_counter()
+            ready()
+            app_timings['ready'] = (time.perf_counter() - start) * 1000
+        app_config.ready = timed_ready
+        return app_config
+
+    def timed_import_models(app_config):
+        start = time.perf_counter()
+        import_models(app_config)
+        timings[app_config.label]['models'] = (time.perf_counter() - start) * 1000
+
+    AppConfig.create = classmethod(timed_create)
+    AppConfig.import_models = timed_import_models
+
+
+def measure_startup():
+    """ Boots Django phase by phase and returns the time of each phase and of each app (in milliseconds) """
+    phases = {}
+    apps = {}
+
+    def phase(name, function):
+        start = time.perf_counter()
+        result = function()
+        phases[name] = (time.perf_counter() - start) * 1000
+        return result
+
+    def setup():
+        import django
+        timed_apps(apps)
+        django.setup(set_prefix=False)
+
+    def load_middleware():
+        from django.core.handlers.wsgi import WSGIHandler
+        return WSGIHandler()
+
+    def import_urlconf():
+        from django.urls import get_resolver
+        return get_resolver().url_patterns
+
+    phase('settings', lambda: __import__('django.conf', fromlist=['settings']).settings.INSTALLED_APPS)
+    phase('apps', setup)
+    phase('middleware', load_middleware)
+    phase('urls', import_urlconf)
+    num_templates = phase('templates', warm_up)
+    return {'phases': phases, 'apps': apps, 'templates': num_templates}
+
+
+def parse_importtime(lines):
+    """
+    The modules imported, from the output of python -X importtime, as a list of
+    (module, self ms, cumulative ms), slowest cumulative time first
+    """
+    modules = []
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        modules.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    return sorted(modules, key=lambda module: module[2], reverse=True)
+
+
+def main():
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    start = time.perf_counter()
+    result = measure_startup()
+    result['total'] = (time.perf_counter() - start) * 1000
+    # The rest of the output (-X importtime) goes to stderr
+    sys.stdout.write(RESULT_PREFIX + json.dumps(result) + '\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+// Web Worker that runs the Python code of a robot with Skulpt (used in play.robots.html).
+// The code runs outside the page thread, so a slow or looping algorithm doesn't freeze the
+// play page or its round poller. The page stops the worker if it runs out of time.
+//
+// Receives {skulpt, constants, integers, program, exec_limit}, where skulpt are the URLs of the
+// Skulpt runtime (with hashed names in production, so they are cached by the browser), and
+// constants are the robot constants of the robot_constants view (integers are the names of
+// those that are ints in Python). Posts back
+//  - {type: 'output', text} for each print of the program,
+//  - {type: 'done', values} when the program has run, with the choices of the program, or
+//  - {type: 'error', error} if the program failed (e.g. a syntax error, or it ran for more than exec_limit ms)
+
+const VARIABLES = ['price_choice', 'amount_choice'];
+
+// The constants are builtins of the program, as if code_header.py had defined them
+function set_constants(constants, integers) {
+    Object.entries(constants).forEach(function ([name, value]) {
+        if (value === null) {
+            Sk.builtins[name] = Sk.builtin.none.none$;
+        } else if (integers.includes(name)) {
+            Sk.builtins[name] = new Sk.builtin.int_(value);
+        } else {
+            Sk.builtins[name] = new Sk.builtin.float_(value);
+        }
+    });
+}
+
+function builtinRead(x) {
+    if (Sk.builtinFiles === undefined || Sk.builtinFiles["files"][x] === undefined)
+        throw "File not found: '" + x + "'";
+    return Sk.builtinFiles["files"][x];
+}
+
+// Numbers are posted as numbers and other values as text (the page treats them as invalid).
+// Variables the program didn't define are left out.
+function variable(name) {
+    if (Sk.globals[name] === undefined) {
+        return undefined;
+    }
+    const value = Sk.ffi.remapToJs(Sk.globals[name]);
+    return typeof value == 'number' ? value : String(value);
+}
+
+self.onmessage = function (event) {
+    // The runtime is only downloaded when a robot runs, not when the play page loads
+    if (self.Sk === undefined) {
+        importScripts(...event.data.skulpt);
+    }
+    Sk.configure({
+        output: text => self.postMessage({type: 'output', text: text}),
+        read: builtinRead,
+        execLimit: event.data.exec_limit,
+    });
+    set_constants(event.data.constants, event.data.integers);
+    Sk.misceval.asyncToPromise(function () {
+        return Sk.importMainWithBody("<stdin>", false, event.data.program, true);
+    }).then(
+        function () {
+            const values = {};
+            VARIABLES.forEach(name => values[name] = variable(name));
+            self.postMessage({type: 'done', values: values});
+        },
+        function (err) {
+            self.postMessage({type: 'error', error: err.toString()});
+        }
+    );
+};
@@ -0,0 +1,47 @@
+"""
+Storage of the static files in production (see STATICFILES_STORAGE in config/settings_production.py).
+
+collectstatic writes each file with a hash of its content in the name (e.g.
+skulpt.min.3f2a9c1b7e4d.js) next to the original, and {% static %} links to the hashed name.
+A hashed file never changes, so nginx lets browsers cache it forever (see nginx_config/nginx.conf).
+Text files also get a gzipped copy (.gz), which nginx serves as is (gzip_static), so big files
+like the Skulpt runtime of the robot page are compressed once, at the highest level.
+"""
+
+import gzip
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+COMPRESSED_EXTENSIONS = ('.css', '.js', '.json', '.svg', '.txt', '.html', '.map')
+
+# Smaller files are not worth a request header saying they are compressed
+MIN_COMPRESS_SIZE = 512
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        # Stylesheets are hashed in several passes, so only the final names are compressed
+        for name in paths:
+            hashed_name = self.hashed_files.get(self.hash_key(self.clean_name(name)))
+            for path in (name, hashed_name):
+                if path and path.endswith(COMPRESSED_EXTENSIONS):
+                    self.compress(path)
+
+    def compress(self, name):
+        """ Writes name.gz next to the file, unless it gets no smaller """
+        with self.open(name) as file:
+            content = file.read()
+        if len(content) < MIN_COMPRESS_SIZE:
+            return
+        # mtime=0, so the same file gives the same .gz on every collectstatic
+        compressed = gzip.compress(content, compresslevel=9, mtime=0)
+        if len(compressed) >= len(content):
+            return
+        if self.exists(name + '.gz'):
+            self.delete(name + '.gz')
+        self._save(name + '.gz', ContentFile(compressed))
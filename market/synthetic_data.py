@@ -0,0 +1,369 @@
+"""
+Generator of synthetic games (see the setup_test_data management command).
+
+bulk_create_markets() and seed_market() seed simpler markets, where every trader makes the same
+trade in every round, for the query plan and view budget tests and the benchmarks.
+
+Generates markets from the scenarios in scenarios.py with traders that have played every round.
+Each round is settled like finish_round does it, with the real demand formula (process_trade),
+so balances, profits, forced trades, bankruptcies and round stats look like those of real games.
+A share of the traders are robots: they trade consistently, with a price near the market's
+average price and the amount they expect to sell. The other traders trade more randomly and
+sometimes miss a round.
+
+The games are simulated in memory and written with bulk inserts (the trades with COPY). With workers > 1, the markets
+are split between processes that each have their own database connection, so millions of trades
+can be generated in minutes, e.g. to test indexes, archiving and charts at production scale.
+"""
+
+import csv
+import io
+import multiprocessing
+import random
+from datetime import timedelta
+from decimal import Decimal
+from math import floor
+
+from django.contrib.auth import get_user_model
+from django.db import connection, connections, transaction
+from django.utils import timezone
+
+from .helpers import new_forced_trade, process_trade
+from .market_ids import new_market_ids
+from .models import Market, Trader, Trade, RoundStat, spectrum_fraction
+from .scenarios import SCENARIOS
+
+TEST_USERNAME = 'test'
+TEST_EMAIL = 'test@m.dk'
+TEST_PASSWORD = 'test'
+
+# Rows per INSERT statement (trades are inserted with COPY, see copy_trades)
+BATCH_SIZE = 5000
+
+# Columns of the trade table written by copy_trades (trader_id and created_at last)
+TRADE_COLUMNS = [
+    'market_id', 'round', 'was_forced', 'prod_cost', 'unit_price', 'unit_amount', 'demand',
+    'units_sold', 'profit', 'balance_before', 'balance_after', 'trader_id', 'created_at']
+
+# Minutes between the rounds of a generated game
+ROUND_MINUTES = 2
+
+# Markets simulated and written together by a worker
+MARKETS_PER_CHUNK = 20
+
+# Chance that a (human) trader doesn't trade in a round and gets a forced trade
+MISSED_ROUND_CHANCE = 0.05
+
+# Chance that a trader with a negative balance declares bankruptcy after a round
+BANKRUPTCY_CHANCE = 0.3
+
+CENT = Decimal('0.01')
+
+# The settings of the markets of bulk_create_markets (those of MarketFactory in the tests)
+SEED_MARKET = {
+    'initial_balance': Decimal('5000.00'),
+    'alpha': Decimal('105.0'),
+    'theta': Decimal('14.5'),
+    'gamma': Decimal('3.0'),
+    'min_cost': Decimal('8.00'),
+    'max_cost': Decimal('8.00'),
+    'max_rounds': 15,
+}
+
+# The processed trade every trader of bulk_create_markets makes in every round
+SEED_TRADE = {
+    'unit_price': Decimal('10.20'),
+    'unit_amount': 13,
+    'demand': 105,
+    'units_sold': 13,
+    'profit': Decimal('28.60'),
+}
+
+
+def host_user():
+    """ The host of the generated markets (created with password TEST_PASSWORD, if it doesn't exist) """
+    # Users log in with their email (see ACCOUNT_AUTHENTICATION_METHOD)
+    user, created = get_user_model().objects.get_or_create(
+        email=TEST_EMAIL, defaults={'username': TEST_USERNAME})
+    if created:
+        user.set_password(TEST_PASSWORD)
+        user.save()
+    return user
+
+
+def new_market(market_id, created_by, num_rounds, robot_share, rng):
+    """ An unsaved market of a random scenario that has played num_rounds rounds """
+    scenario = rng.choice(SCENARIOS)
+    return Market(
+        market_id=market_id,
+        created_by=created_by,
+        product_name_singular=scenario['product_name_singular'],
+        product_name_plural=scenario['product_name_plural'],
+        initial_balance=Decimal(str(scenario['initial_balance'])),
+        alpha=Decimal(str(scenario['alpha'])),
+        theta=Decimal(str(scenario['theta'])),
+        gamma=Decimal(str(scenario['gamma'])),
+        min_cost=Decimal(str(scenario['min_cost'])),
+        max_cost=Decimal(str(scenario['max_cost'])),
+        cost_slope=Decimal(str(scenario['cost_slope'])),
+        max_rounds=num_rounds,
+        endless=False,
+        allow_robots=robot_share > 0,
+        round=num_rounds,
+        game_over=True,
+    )
+
+
+def allowed_decision(market, trader, unit_price, unit_amount):
+    """
+    Caps the price at the market's maximum price and the amount at what the trader can afford,
+    as TradeForm does for humans and clean_choices for robots
+    """
+    unit_price = min(unit_price, market.max_allowed_price())
+    max_unit_amount = floor(trader.balance / trader.prod_cost) if trader.prod_cost > 0 else unit_amount
+    # max_unit_amount is negative when the balance is
+    return unit_price, max(min(unit_amount, max_unit_amount), 0)
+
+
+def robot_decision(market, trader, last_avg_price):
+    """ A price a little above the average price (never below cost) and the expected demand at that price """
+    unit_price = max(trader.prod_cost * Decimal('1.1'), last_avg_price).quantize(CENT)
+    expected_demand = market.alpha - (market.gamma + market.theta) * unit_price + market.theta * last_avg_price
+    return allowed_decision(market, trader, unit_price, int(expected_demand))
+
+
+def human_decision(market, trader, last_avg_price, rng):
+    """ A price and an amount scattered around what a robot would choose """
+    unit_price = (last_avg_price * Decimal(rng.uniform(0.7, 1.4))).quantize(CENT)
+    unit_price = max(unit_price, (trader.prod_cost * Decimal(rng.uniform(0.8, 1.2))).quantize(CENT), CENT)
+    expected_demand = market.alpha - (market.gamma + market.theta) * unit_price + market.theta * last_avg_price
+    return allowed_decision(market, trader, unit_price, int(expected_demand * Decimal(rng.uniform(0.5, 1.5))))
+
+
+def simulate_market(market, num_traders, robot_share, rng):
+    """
+    Plays all rounds of the market in memory. Returns the unsaved traders, trades and round stats
+    (the trades refer to the unsaved traders, so the traders have to be inserted first)
+    """
+    traders = []
+    robots = set()
+    for i in range(num_traders):
+        fraction = spectrum_fraction(i)
+        trader = Trader(
+            market=market, name=f"elev{i}", balance=market.initial_balance, round_joined=0,
+            prod_cost=(market.min_cost + fraction * (market.max_cost - market.min_cost)).quantize(CENT))
+        if rng.random() < robot_share:
+            trader.auto_play = True
+            robots.add(i)
+        traders.append(trader)
+    market.num_prod_costs_assigned = num_traders
+
+    trades = []
+    round_stats = []
+    # Before the first round, the traders guess that prices end up between the costs and twice the costs
+    last_avg_price = (market.min_cost + market.max_cost) * Decimal('0.75')
+    for round_num in range(market.round):
+        valid_trades = []
+        for i, trader in enumerate(traders):
+            if trader.bankrupt or (i not in robots and rng.random() < MISSED_ROUND_CHANCE):
+                continue
+            if i in robots:
+                unit_price, unit_amount = robot_decision(market, trader, last_avg_price)
+            else:
+                unit_price, unit_amount = human_decision(market, trader, last_avg_price, rng)
+            valid_trades.append(Trade(
+                trader=trader, market=market, round=round_num, prod_cost=trader.prod_cost,
+                unit_price=unit_price, unit_amount=unit_amount, balance_before=trader.balance))
+
+        # Settle the round as finish_round does
+        traders_with_trade = set()
+        if valid_trades:
+            avg_price = sum(trade.unit_price for trade in valid_trades) / len(valid_trades)
+            for trade in valid_trades:
+                process_trade(market, trade, avg_price, save=False)
+                traders_with_trade.add(id(trade.trader))
+            round_stats.append(RoundStat(
+                market=market, round=round_num, avg_price=avg_price,
+                avg_balance_after=sum(trader.balance for trader in traders) / len(traders),
+                avg_amount=Decimal(sum(trade.unit_amount for trade in valid_trades)) / len(valid_trades)))
+            last_avg_price = avg_price
+        trades += valid_trades
+        trades += [new_forced_trade(trader=trader, round_num=round_num, is_new_trader=False)
+                   for trader in traders if id(trader) not in traders_with_trade]
+
+        for trader in traders:
+            if trader.balance < 0 and not trader.bankrupt and rng.random() < BANKRUPTCY_CHANCE:
+                trader.bankrupt = True
+            if market.cost_slope and trader.prod_cost > -market.cost_slope:
+                trader.prod_cost += market.cost_slope
+        market.accum_cost_change += market.cost_slope
+
+    return traders, trades, round_stats
+
+
+def copy_trades(trades, markets):
+    """
+    Inserts the trades with COPY, which is several times faster than bulk_create for millions of
+    rows. Each round's trades are created ROUND_MINUTES after the previous round's, counted from
+    the creation of the market.
+    """
+    created_at = {market.pk: market.created_at for market in markets}
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for trade in trades:
+        trade_created_at = created_at[trade.market_id] + timedelta(minutes=ROUND_MINUTES * (trade.round + 1))
+        # None is written as an empty field, which COPY reads as NULL
+        writer.writerow([getattr(trade, column) for column in TRADE_COLUMNS[:-2]]
+                        + [trade.trader.pk, trade_created_at.isoformat()])
+    buffer.seek(0)
+    with connection.cursor() as cursor:
+        cursor.copy_expert(
+            f"COPY {Trade._meta.db_table} ({', '.join(TRADE_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer)
+
+
+def generate_chunk(market_pks, num_traders, robot_share, seed):
+    """ Simulates the markets and inserts their traders, trades and round stats. Returns the number of trades """
+    markets = Market.objects.filter(pk__in=market_pks).order_by('pk')
+    with transaction.atomic():
+        all_traders, all_trades, all_round_stats = [], [], []
+        for market in markets:
+            rng = random.Random(f"{seed}-{market.pk}")
+            traders, trades, round_stats = simulate_market(market, num_traders, robot_share, rng)
+            all_traders += traders
+            all_trades += trades
+            all_round_stats += round_stats
+
+        Trader.objects.bulk_create(all_traders, batch_size=BATCH_SIZE)
+        copy_trades(all_trades, markets)
+        RoundStat.objects.bulk_create(all_round_stats, batch_size=BATCH_SIZE)
+        Market.objects.bulk_update(markets, ['num_prod_costs_assigned', 'accum_cost_change'])
+    return len(all_trades)
+
+
+def generate_chunk_in_worker(args):
+    try:
+        return generate_chunk(*args)
+    finally:
+        connections.close_all()
+
+
+def generate(num_markets, num_traders, num_rounds, robot_share=0.0, workers=1, days=30, seed=0,
+             created_by=None, progress=None):
+    """
+    Generates num_markets finished markets with num_traders traders that have played num_rounds
+    rounds. The markets are created within the last days days. progress (if given) is called with
+    the number of markets done so far and the number of trades inserted by the last chunk.
+    Returns the markets.
+    """
+    rng = random.Random(seed)
+    created_by = created_by or host_user()
+    markets = Market.objects.bulk_create([
+        new_market(market_id, created_by, num_rounds, robot_share, rng)
+        for market_id in new_market_ids(num_markets)
+    ], batch_size=BATCH_SIZE)
+
+    # bulk_create sets created_at to now, so spread the markets over the last days afterwards
+    now = timezone.now()
+    for market in markets:
+        market.created_at = now - timedelta(seconds=rng.uniform(0, days * 24 * 3600))
+    Market.objects.bulk_update(markets, ['created_at'], batch_size=BATCH_SIZE)
+
+    market_pks = [market.pk for market in markets]
+    chunks = [(market_pks[i:i + MARKETS_PER_CHUNK], num_traders, robot_share, seed)
+              for i in range(0, len(market_pks), MARKETS_PER_CHUNK)]
+    done = 0
+    if workers > 1:
+        # The forked workers must not share the connection of this process
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            for num_trades in pool.imap_unordered(generate_chunk_in_worker, chunks):
+                done += MARKETS_PER_CHUNK
+                if progress:
+                    progress(min(done, num_markets), num_trades)
+    else:
+        for chunk in chunks:
+            num_trades = generate_chunk(*chunk)
+            done += len(chunk[0])
+            if progress:
+                progress(done, num_trades)
+    return markets
+
+
+def bulk_create_markets(num_markets, traders_per_market, num_rounds, created_by=None):
+    """
+    Seeds the database with many markets, each with traders that have traded in
+    every round so far. Uses bulk inserts (and plain model instances rather than
+    factories), so it is fast enough to produce the large datasets needed when
+    testing query plans. Returns the list of markets.
+    """
+    created_by = created_by or host_user()
+
+    market_ids = new_market_ids(num_markets)
+    markets = Market.objects.bulk_create([
+        Market(
+            market_id=market_ids[i],
+            product_name_singular='baguette',
+            product_name_plural='baguettes',
+            initial_balance=SEED_MARKET['initial_balance'],
+            alpha=SEED_MARKET['alpha'],
+            theta=SEED_MARKET['theta'],
+            gamma=SEED_MARKET['gamma'],
+            min_cost=SEED_MARKET['min_cost'],
+            max_cost=SEED_MARKET['max_cost'],
+            max_rounds=SEED_MARKET['max_rounds'],
+            endless=False,
+            created_by=created_by,
+            round=num_rounds,
+            deleted=(i % 3 == 2))
+        for i in range(num_markets)
+    ])
+
+    traders = Trader.objects.bulk_create([
+        Trader(
+            market=market,
+            name=f"trader{j}",
+            prod_cost=SEED_MARKET['min_cost'],
+            balance=Decimal(5000 - j),
+            bankrupt=(j % 10 == 0))
+        for market in markets
+        for j in range(traders_per_market)
+    ], batch_size=5000)
+
+    Trade.objects.bulk_create([
+        Trade(
+            trader=trader,
+            market=trader.market,
+            round=round_num,
+            was_forced=(round_num % 4 == 0),
+            prod_cost=trader.prod_cost,
+            unit_price=SEED_TRADE['unit_price'],
+            unit_amount=SEED_TRADE['unit_amount'],
+            demand=SEED_TRADE['demand'],
+            units_sold=SEED_TRADE['units_sold'],
+            profit=SEED_TRADE['profit'],
+            balance_before=trader.balance,
+            balance_after=trader.balance)
+        for trader in traders
+        for round_num in range(num_rounds)
+    ], batch_size=5000)
+
+    return markets
+
+
+def seed_market(num_traders, num_rounds, created_by=None):
+    """
+    Seeds an endless market where every trader has traded in each of the num_rounds
+    previous rounds, and every other trader has traded in the current round.
+    Used for the view budget tests and the benchmarks (see market/benchmarks.py).
+    """
+    market = bulk_create_markets(1, num_traders, num_rounds, created_by=created_by)[0]
+    Market.objects.filter(pk=market.pk).update(endless=True)
+    market.refresh_from_db()
+
+    Trade.objects.bulk_create([
+        Trade(trader=trader, market=market, round=market.round, prod_cost=trader.prod_cost,
+              unit_price=SEED_TRADE['unit_price'], unit_amount=SEED_TRADE['unit_amount'],
+              balance_before=trader.balance)
+        for trader in list(market.all_traders())[::2]
+    ])
+    return market
@@ -1,4 +1,4 @@
-{% load custom_tags %}"""
+"""
 Nedenfor definerer vi nogle brugbare konstanter,
 du kan anvende i dit program. Værdien af disse
 konstanter vil ændre sig fra runde til
@@ -8,58 +8,58 @@ NB: Du kan ikke redigere i denne del af koden.
 """ 
 
 # Din aktuelle saldo:
-balance = {{ trader.balance|to_float }}
+balance = {balance}
 
 # Din produktionsomkostning pr. enhed:
-prod_cost = {{ trader.prod_cost|to_float }}
+prod_cost = {prod_cost}
 
 # Det maksimale antal {{ market.product_name_plural }} du har råd 
 # til at producere:
-max_amount = {{ max_amount }}
+max_amount = {max_amount}
 
 # Den maksimale pris pr. {{ market.product_name_singular }} du
 # kan vælge (defineret som 4 * markedets største
 # produktionsomkostning pr. enhed):
-max_price = {{ max_price|to_float }}
+max_price = {max_price}
 
 # Igangværende runde:
-round = {{ market.round|add:1 }}
+round = {round}
 {% if market.round > 0 %}
 # Din produktion i sidste runde:
-amount_last_round = {{ trades.last.unit_amount }}
+amount_last_round = {amount_last_round}
 {% else %}
 # Din produktion i sidste runde 
 # (vil være None i første runde):
-amount_last_round = None
+amount_last_round = {amount_last_round}
 {% endif %} {% if market.round > 0 %}
 # Din pris i sidste runde:
-price_last_round = {{ trades.last.unit_price | to_float }}
+price_last_round = {price_last_round}
 {% else %}
 # Din pris i sidste runde
 # (vil være None i første runde):
-price_last_round = None
+price_last_round = {price_last_round}
 {% endif %}{% if market.round > 0 %}
 # Markedets gennemsnitspris i sidste runde:
-avg_price_last_round = {{ round_stats.all.last.avg_price | to_float }}
+avg_price_last_round = {avg_price_last_round}
 {% else %}
 # Markedets gennemsnitspris i sidste runde
 # (vil være None i første runde):
-avg_price_last_round = None
+avg_price_last_round = {avg_price_last_round}
 {% endif %}{% if market.round > 0 %}
 # Efterspørgslen på dine {{ market.product_name_plural }}
 # i sidste runde:
-demand_last_round = {{ trades.last.demand }}
+demand_last_round = {demand_last_round}
 {% else %}
 # Efterspørgslen på dine {{ market.product_name_plural }} i sidste runde
 # (vil være None i første runde)
-demand_last_round = None
+demand_last_round = {demand_last_round}
 {% endif %}{% if market.round > 0 %}
 # Dit udbytte i sidste runde:
-profit_last_round = {{ trades.last.profit }}
+profit_last_round = {profit_last_round}
 {% else %}
 # Dit udbytte i sidste runde
 # (vil være None i første runde)
-profit_last_round = None
+profit_last_round = {profit_last_round}
 {% endif %}
 # Resten af koden skal du selv udfylde i
 # boksen nedenfor
\ No newline at end of file
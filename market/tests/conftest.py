@@ -17,3 +17,58 @@ def logged_in_user(db, client):
     client.login(username=user.username,
                  password='defaultpassword')
     return user
+
+
+@pytest.fixture(scope='function', autouse=True)
+def reads_from_primary(settings):
+    # The replica is a test mirror with its own connection, so it can't see data created inside
+    # a test transaction. Tests of the replica routing re-enable it (see test_db_router.py)
+    settings.REPLICA_READ_VIEWS = []
+
+
+@pytest.fixture(scope='function', autouse=True)
+def metrics_dir(settings, tmp_path_factory):
+    # Every request writes the metrics of the test process, so keep them out of the real directory
+    settings.METRICS_DIR = str(tmp_path_factory.getbasetemp() / 'metrics')
+
+
+@pytest.fixture(scope='function', autouse=True)
+def session_cache_dir(settings, tmp_path_factory):
+    # Sessions of tests must not end up in (or be read from) the real session cache directory
+    directory = tmp_path_factory.mktemp('session_cache')
+    settings.CACHES = {
+        **settings.CACHES,
+        'sessions': {**settings.CACHES['sessions'], 'LOCATION': str(directory)},
+    }
+    return directory
+
+
+@pytest.fixture(scope='function', autouse=True)
+def no_slow_query_log(settings):
+    # Slow queries of tests would end up in the real slow query log (see test_slow_queries.py)
+    settings.SLOW_QUERY_SECONDS = None
+
+
+@pytest.fixture(scope='function', autouse=True)
+def stop_robot_processes():
+    # The robot subprocesses kept running between rounds must not outlive the test (see robots.py)
+    yield
+    from ..robots import warm_pool
+    warm_pool().close()
+
+
+def pytest_terminal_summary(terminalreporter):
+    """
+    Prints the measured query counts and latencies of test_view_budgets.py as a table,
+    with a * after the latencies over their budget
+    """
+    from .test_view_budgets import MEASUREMENTS
+    if not MEASUREMENTS:
+        return
+    terminalreporter.section('view budgets')
+    terminalreporter.write_line(
+        f"{'view':<15}{'traders':>8}{'rounds':>8}{'queries':>9}{'budget':>8}{'ms':>9}{'budget':>8}")
+    for view, num_traders, num_rounds, num_queries, max_queries, milliseconds, max_milliseconds in MEASUREMENTS:
+        terminalreporter.write_line(
+            f"{view:<15}{num_traders:>8}{num_rounds:>8}{num_queries:>9}{max_queries:>8}{milliseconds:>9.0f}{max_milliseconds:>8}"
+            f"{' *' if milliseconds > max_milliseconds else ''}")
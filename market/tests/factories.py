@@ -51,6 +51,7 @@ class TradeFactory(factory.django.DjangoModelFactory):
         model = Trade
     
     trader = factory.SubFactory(TraderFactory)
+    market = factory.SelfAttribute('trader.market')
     unit_price = Decimal('10.20')
     unit_amount = 13
     demand = max(0, round_to_int(MarketFactory.alpha - (MarketFactory.gamma + MarketFactory.theta)
@@ -67,6 +68,7 @@ class UnProcessedTradeFactory(factory.django.DjangoModelFactory):
         model = Trade
 
     trader = factory.SubFactory(TraderFactory)
+    market = factory.SelfAttribute('trader.market')
     unit_price = Decimal('10.20')
     unit_amount = 13
     round = 37
@@ -82,7 +84,9 @@ class ForcedTradeFactory(factory.django.DjangoModelFactory):
         model = Trade
 
     trader = factory.SubFactory(TraderFactory)
+    market = factory.SelfAttribute('trader.market')
     was_forced = True
     balance_after = None
     balance_before = None
     round = 37
+
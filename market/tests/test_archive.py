@@ -0,0 +1,154 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_archive.py
+"""
+
+from django.db import DatabaseError
+from django.urls import reverse
+from .. import archive
+from ..archive import archivable_markets, archive_market, archive_path, restore_market
+from ..models import Market, Trader, Trade, RoundStat
+from .factories import MarketFactory, TraderFactory, TradeFactory
+
+import pytest
+from pytest_django.asserts import assertContains
+
+
+@pytest.fixture
+def archive_dir(settings, tmp_path):
+    settings.MARKET_ARCHIVE_DIR = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def finished_market(db):
+    market = MarketFactory(round=2, game_over=True)
+    for name in ['Anna', 'Bo']:
+        trader = TraderFactory(market=market, name=name)
+        TradeFactory(trader=trader, round=0)
+        TradeFactory(trader=trader, round=1)
+    RoundStat.objects.create(market=market, round=0, avg_price=10, avg_balance_after=4000, avg_amount=10)
+    RoundStat.objects.create(market=market, round=1, avg_price=11, avg_balance_after=4100, avg_amount=12)
+    return market
+
+
+def test_archivable_markets(db):
+    finished = MarketFactory(game_over=True)
+    deleted = MarketFactory(deleted=True)
+    MarketFactory()
+    MarketFactory(game_over=True, archived=True)
+
+    assert set(archivable_markets()) == {finished, deleted}
+    assert archivable_markets(older_than_days=1).count() == 0
+
+
+def test_archive_market_writes_file_and_purges_rows(archive_dir, finished_market):
+    other_trade = TradeFactory()
+
+    path = archive_market(finished_market)
+
+    assert path == archive_path(finished_market)
+    assert path.exists()
+    assert Trader.objects.filter(market=finished_market).count() == 0
+    assert Trade.objects.filter(market=finished_market).count() == 0
+    assert RoundStat.objects.filter(market=finished_market).count() == 0
+
+    # The market itself is kept, and other markets are untouched
+    finished_market.refresh_from_db()
+    assert finished_market.archived
+    assert Trade.objects.filter(id=other_trade.id).exists()
+
+
+def test_restore_market_brings_back_all_rows(archive_dir, finished_market, django_capture_on_commit_callbacks):
+    trades_before = list(Trade.objects.filter(
+        market=finished_market).order_by('id').values())
+    archive_market(finished_market)
+
+    with django_capture_on_commit_callbacks(execute=True):
+        restore_market(finished_market)
+
+    finished_market.refresh_from_db()
+    assert not finished_market.archived
+    assert Trader.objects.filter(market=finished_market).count() == 2
+    assert RoundStat.objects.filter(market=finished_market).count() == 2
+    assert list(Trade.objects.filter(
+        market=finished_market).order_by('id').values()) == trades_before
+    assert not archive_path(finished_market).exists()
+
+
+def test_archive_market_keeps_rows_and_flag_if_the_purge_fails(archive_dir, finished_market, monkeypatch):
+    purge_rows = archive.purge_rows
+    purged = []
+
+    def failing_purge(model, pks):
+        # The events and round stats are purged, then it fails
+        if len(purged) == 2:
+            raise DatabaseError("connection lost")
+        purge_rows(model, pks)
+        purged.append(model)
+
+    monkeypatch.setattr(archive, 'purge_rows', failing_purge)
+    with pytest.raises(DatabaseError):
+        archive_market(finished_market)
+
+    finished_market.refresh_from_db()
+    assert not finished_market.archived
+    assert RoundStat.objects.filter(market=finished_market).count() == 2
+    assert Trade.objects.filter(market=finished_market).count() == 4
+    assert not archive_path(finished_market).exists()
+
+    # So it can simply be archived again
+    monkeypatch.setattr(archive, 'purge_rows', purge_rows)
+    archive_market(finished_market)
+    assert Trade.objects.filter(market=finished_market).count() == 0
+
+
+def test_archive_market_never_purges_rows_that_are_not_in_the_archive(archive_dir, finished_market, monkeypatch):
+    write_archive = archive.write_archive
+    trader = Trader.objects.filter(market=finished_market).first()
+
+    def write_archive_and_trade(path, objects):
+        write_archive(path, objects)
+        # A trade written after the rows were read
+        TradeFactory(trader=trader, round=2)
+
+    monkeypatch.setattr(archive, 'write_archive', write_archive_and_trade)
+    with pytest.raises(archive.MarketChangedError):
+        archive_market(finished_market)
+
+    # The new trade was written in the same transaction here, so it is rolled back too
+    finished_market.refresh_from_db()
+    assert not finished_market.archived
+    assert Trade.objects.filter(market=finished_market).count() == 4
+    assert not archive_path(finished_market).exists()
+
+
+def test_archive_market_never_overwrites_an_archive(archive_dir, finished_market):
+    path = archive_path(finished_market)
+    path.write_bytes(b'the only copy')
+
+    with pytest.raises(FileExistsError):
+        archive_market(finished_market)
+
+    assert path.read_bytes() == b'the only copy'
+    assert Trade.objects.filter(market=finished_market).count() == 4
+    finished_market.refresh_from_db()
+    assert not finished_market.archived
+
+
+def test_monitor_view_restores_archived_market_on_post(archive_dir, finished_market, client):
+    client.force_login(finished_market.created_by)
+    archive_market(finished_market)
+
+    # Opening the monitor page doesn't write anything
+    response = client.get(reverse('market:monitor', args=(finished_market.market_id,)))
+    assertContains(response, 'Gendan markedet')
+    finished_market.refresh_from_db()
+    assert finished_market.archived
+
+    response = client.post(
+        reverse('market:restore_archived_market', args=(finished_market.market_id,)), follow=True)
+
+    assertContains(response, 'Anna')
+    finished_market.refresh_from_db()
+    assert not finished_market.archived
@@ -0,0 +1,52 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_benchmarks.py
+"""
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+
+from ..benchmarks import BENCHMARKS, run_benchmarks, compare, save_baseline, load_baseline
+from ..models import Market, Trade
+
+import pytest
+
+
+@pytest.mark.django_db
+def test_run_benchmarks_times_all_benchmarks_and_leaves_database_unchanged():
+    results = run_benchmarks(traders=[4], rounds=[2], warmup=1, repeats=2)
+
+    assert set(results) == set(BENCHMARKS)
+    for timings in results.values():
+        assert set(timings) == {'4x2'}
+        assert 0 < timings['4x2']['min_ms'] <= timings['4x2']['median_ms'] <= timings['4x2']['max_ms']
+    assert Market.objects.count() == 0
+    assert Trade.objects.count() == 0
+
+
+def test_compare_flags_regressions_beyond_tolerance():
+    baseline = {'finish_round': {'10x1': {'median_ms': 10.0}}}
+    results = {'finish_round': {'10x1': {'median_ms': 12.0}, '100x1': {'median_ms': 50.0}}}
+
+    assert compare(results, baseline, 0.25) == [
+        ('finish_round', '10x1', 12.0, 10.0, False),
+        ('finish_round', '100x1', 50.0, None, False),
+    ]
+    assert compare(results, baseline, 0.1)[0][4]
+
+
+@pytest.mark.django_db
+def test_benchmark_command_saves_baseline_and_checks_against_it(tmp_path):
+    baseline_path = tmp_path / 'baseline.json'
+    options = {'traders': [3], 'rounds': [1], 'only': ['process_trade'], 'warmup': 0, 'repeat': 1,
+               'baseline': baseline_path, 'stdout': StringIO()}
+
+    call_command('benchmark', save=True, **options)
+    assert set(load_baseline(baseline_path)) == {'process_trade'}
+
+    # A baseline that is impossible to beat
+    save_baseline(baseline_path, {'process_trade': {'3x1': {'median_ms': 1e-6}}}, 0, 1)
+    with pytest.raises(CommandError):
+        call_command('benchmark', check=True, **options)
@@ -0,0 +1,88 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_db_router.py
+"""
+
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ..db_router import ReplicaRouter, reads_from_replica, reads_from_primary
+from ..middleware import ReplicaRoutingMiddleware
+from ..models import Market, Trader
+from .factories import MarketFactory
+
+import pytest
+
+REPLICA_READ_VIEWS = ['market:current_round', 'market:play']
+
+
+@pytest.fixture
+def replica_reads(settings):
+    settings.REPLICA_READ_VIEWS = REPLICA_READ_VIEWS
+
+
+def test_router_reads_from_primary_by_default():
+    router = ReplicaRouter()
+    assert router.db_for_read(Market) == 'default'
+    assert router.db_for_write(Market) == 'default'
+
+
+def test_router_reads_market_models_from_replica_when_allowed():
+    router = ReplicaRouter()
+    with reads_from_replica():
+        assert router.db_for_read(Market) == 'replica'
+        assert router.db_for_read(Trader) == 'replica'
+        # Sessions and users are always read from the primary
+        assert router.db_for_read(get_user_model()) == 'default'
+        # Writes always go to the primary
+        assert router.db_for_write(Market) == 'default'
+
+        with reads_from_primary():
+            assert router.db_for_read(Market) == 'default'
+    assert router.db_for_read(Market) == 'default'
+
+
+def test_router_does_not_migrate_replica():
+    router = ReplicaRouter()
+    assert router.allow_migrate('default', 'market')
+    assert not router.allow_migrate('replica', 'market')
+
+
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+def test_read_only_view_reads_from_replica(client, replica_reads):
+    market = MarketFactory()
+
+    with CaptureQueriesContext(connections['replica']) as replica_queries:
+        response = client.get(
+            reverse('market:current_round', args=(market.market_id,)))
+
+    assert response.status_code == 200
+    assert len(replica_queries) > 0
+
+
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+def test_reads_stick_to_primary_after_post(client, replica_reads):
+    market = MarketFactory()
+
+    response = client.post(reverse('market:join_market'), {
+        'name': 'Hanne', 'market_id': market.market_id})
+    assert ReplicaRoutingMiddleware.STICKY_COOKIE_NAME in response.cookies
+
+    # The client's next read sees its own write, because it is served by the primary
+    with CaptureQueriesContext(connections['replica']) as replica_queries:
+        response = client.get(reverse('market:play', args=(market.market_id,)))
+
+    assert response.status_code == 200
+    assert response.context['trader'].name == 'Hanne'
+    assert len(replica_queries) == 0
+
+
+@pytest.mark.django_db(transaction=True, databases=['default', 'replica'])
+def test_views_not_listed_read_from_primary(client, replica_reads):
+    market = MarketFactory()
+
+    with CaptureQueriesContext(connections['replica']) as replica_queries:
+        client.get(reverse('market:home') + f"?market_id={market.market_id}")
+
+    assert len(replica_queries) == 0
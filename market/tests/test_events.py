@@ -0,0 +1,80 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_events.py
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.urls import reverse
+from django.utils import timezone
+
+from ..events import record_event, round_timeline
+from ..models import MarketEvent, Trader
+from .factories import MarketFactory, TraderFactory
+
+import pytest
+
+
+def test_actions_of_a_round_are_recorded(client, logged_in_user):
+    market = MarketFactory(created_by=logged_in_user, min_cost=4, max_cost=4)
+    client.post(reverse('market:join_market'), {'name': 'Hanne', 'market_id': market.market_id})
+    trader = Trader.objects.get(market=market)
+    client.post(reverse('market:play', args=(market.market_id,)), {'unit_price': Decimal('11.00'), 'unit_amount': '45'})
+    client.post(reverse('market:finish_round', args=(market.market_id,)))
+    client.post(reverse('market:declare_bankruptcy', args=(trader.id,)))
+
+    events = list(MarketEvent.objects.filter(market=market).order_by('created_at', 'pk'))
+    assert [(event.kind, event.round) for event in events] == [
+        (MarketEvent.JOIN, 0), (MarketEvent.TRADE, 0), (MarketEvent.ROUND_FINISHED, 0), (MarketEvent.BANKRUPTCY, 1)]
+    assert all(event.trader_id == trader.id for event in events if event.kind != MarketEvent.ROUND_FINISHED)
+    assert all(event.duration_ms > 0 for event in events)
+
+
+def test_events_are_append_only(db):
+    event = record_event(MarketFactory(), MarketEvent.SETTINGS_EDITED)
+    with pytest.raises(ValueError):
+        event.save()
+
+
+def test_round_timeline_measures_rounds_and_decisions(db):
+    market = MarketFactory()
+    early, late = TraderFactory(market=market), TraderFactory(market=market)
+    start = timezone.now() - timedelta(minutes=10)
+
+    def event_at(seconds, kind, trader=None, round_num=0, duration_ms=None):
+        event = record_event(market, kind, trader=trader, round_num=round_num)
+        # created_at is set on insert, so move the event back in time with an update
+        MarketEvent.objects.filter(pk=event.pk).update(
+            created_at=start + timedelta(seconds=seconds), duration_ms=duration_ms)
+
+    event_at(0, MarketEvent.JOIN, early)
+    event_at(30, MarketEvent.JOIN, late)
+    event_at(40, MarketEvent.TRADE, early)
+    event_at(50, MarketEvent.TRADE, late)
+    event_at(60, MarketEvent.ROUND_FINISHED, duration_ms=120)
+    event_at(75, MarketEvent.TRADE, early, round_num=1)
+
+    first, second = round_timeline(market)
+    assert first['duration'] == 60
+    assert first['trades'] == 2
+    # The late trader decided 20 seconds after joining
+    assert first['median_decision'] == 30
+    assert first['max_decision'] == 40
+    assert first['settlement_ms'] == 120
+    assert first['joins'] == 2
+    assert second['started_at'] == start + timedelta(seconds=60)
+    assert second['duration'] is None
+    assert second['max_decision'] == 15
+
+
+def test_timeline_view_shows_rounds_to_host_only(client, logged_in_user):
+    market = MarketFactory(created_by=logged_in_user)
+    record_event(market, MarketEvent.ROUND_FINISHED)
+    response = client.get(reverse('market:timeline', args=(market.market_id,)))
+    assert response.status_code == 200
+    assert len(response.context['rounds']) == 1
+
+    other_market = MarketFactory()
+    response = client.get(reverse('market:timeline', args=(other_market.market_id,)))
+    assert response.status_code == 302
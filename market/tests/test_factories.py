@@ -50,7 +50,7 @@ def test_default_round_is_zero(market):
 
 def test_market_id_created_properly(market):
     assert isinstance(market.market_id, str)
-    assert len(market.market_id) == 8
+    assert len(market.market_id) == 7
 
 
 def test_instances_of_default_factory_market(market):
@@ -0,0 +1,92 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_fast_forward.py
+"""
+
+import json
+
+from django.urls import reverse
+
+from ..models import MarketEvent, RoundStat, Trade
+from .factories import MarketFactory, TraderFactory
+
+ALGORITHM = """
+price_choice = prod_cost * 2
+amount_choice = max_amount // 10
+"""
+
+
+def robot_market(user, num_robots=3, **kwargs):
+    market = MarketFactory(created_by=user, allow_robots=True, **kwargs)
+    for _ in range(num_robots):
+        TraderFactory(market=market, auto_play=True, robot_code=ALGORITHM)
+    return market
+
+
+def post_fast_forward(client, market, data=None):
+    response = client.post(reverse('market:fast_forward', args=(market.market_id,)), data or {})
+    if not response.streaming:
+        return response, []
+    return response, [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+
+def test_fast_forward_plays_the_remaining_rounds(client, logged_in_user):
+    market = robot_market(logged_in_user, endless=False, max_rounds=12)
+    response = client.get(reverse('market:monitor', args=(market.market_id,)))
+    assert response.context['fast_forward_form'] is not None
+
+    response, progress = post_fast_forward(client, market)
+    assert response['Content-Type'] == 'application/x-ndjson'
+    assert [step['played'] for step in progress] == list(range(1, 13))
+    assert progress[-1] == {'round': 12, 'played': 12, 'total': 12, 'game_over': True, 'out_of_time': False}
+
+    market.refresh_from_db()
+    assert market.round == 12 and market.game_over
+    assert RoundStat.objects.filter(market=market).count() == 12
+    assert Trade.objects.filter(market=market, was_forced=False).count() == 3 * 12
+    assert MarketEvent.objects.filter(market=market, kind=MarketEvent.ROUND_FINISHED).count() == 12
+
+
+def test_fast_forward_endless_market_plays_the_chosen_rounds(client, logged_in_user):
+    market = robot_market(logged_in_user, endless=True)
+    response, progress = post_fast_forward(client, market)
+    assert response.status_code == 400
+
+    response, progress = post_fast_forward(client, market, {'num_rounds': 5})
+    assert progress[-1]['round'] == 5
+    market.refresh_from_db()
+    assert market.round == 5 and not market.game_over
+    # The robots have traded in the next round already, as after finish_round
+    assert Trade.objects.filter(market=market, round=5).count() == 3
+
+
+def test_fast_forward_stops_before_the_timeout_of_gunicorn(client, logged_in_user, settings):
+    # Streaming doesn't keep gunicorn from killing the worker, so no round is started after the time is up
+    settings.FAST_FORWARD_SECONDS = 0
+    market = robot_market(logged_in_user, endless=False, max_rounds=12)
+
+    response, progress = post_fast_forward(client, market)
+    assert progress == [{'round': 1, 'played': 1, 'total': 12, 'game_over': False, 'out_of_time': True}]
+    market.refresh_from_db()
+    assert market.round == 1 and not market.game_over
+
+    # Fast-forwarding again plays the rest of the rounds
+    settings.FAST_FORWARD_SECONDS = 60
+    response, progress = post_fast_forward(client, market)
+    assert [step['played'] for step in progress] == list(range(1, 12))
+    assert progress[-1]['game_over'] and not progress[-1]['out_of_time']
+
+
+def test_only_robot_markets_can_be_fast_forwarded(client, logged_in_user):
+    market = robot_market(logged_in_user)
+    TraderFactory(market=market)
+    response, progress = post_fast_forward(client, market)
+    assert response.status_code == 400
+    assert not progress
+
+    response = client.get(reverse('market:monitor', args=(market.market_id,)))
+    assert response.context['fast_forward_form'] is None
+
+    other_market = robot_market(MarketFactory().created_by)
+    response, progress = post_fast_forward(client, other_market)
+    assert response.status_code == 302
@@ -0,0 +1,46 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_load_test.py
+"""
+
+from ..load_test import LoadTest, PollBenchmark, percentile
+from ..models import Market, Trader
+
+import pytest
+
+
+def test_percentile():
+    values = list(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile(values, 100) == 100
+    assert percentile([7], 90) == 7
+    assert percentile([], 50) is None
+
+
+@pytest.mark.django_db(transaction=True)
+def test_load_test_plays_rounds_against_live_server(live_server):
+    load_test = LoadTest(
+        base_url=live_server.url, num_students=5, num_rounds=2,
+        poll_interval=0.2, think_time=0.5, ramp_up=0.5, round_timeout=10)
+
+    load_test.run()
+
+    market = Market.objects.get(pk=load_test.market.pk)
+    assert market.round == 2
+    assert Trader.objects.filter(market=market).count() == 5
+    assert sum(load_test.stats.errors.values()) == 0
+    assert len(load_test.stats.latencies['finish_round']) == 2
+    assert 'Round 2: all 5 students saw the next round' in '\n'.join(load_test.report_lines())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_poll_benchmark_reports_pollers_sustained_by_live_server(live_server):
+    benchmark = PollBenchmark(base_url=live_server.url, steps=[2, 4], step_seconds=1.0, poll_interval=0.2)
+
+    benchmark.run()
+
+    assert [result['pollers'] for result in benchmark.results] == [2, 4]
+    assert all(result['errors'] == 0 and result['polls_per_second'] > 0 for result in benchmark.results)
+    assert benchmark.max_sustained() == 4
+    assert 'Max pollers sustained (p99 < 1000 ms, no errors): 4' in benchmark.report_lines()
@@ -0,0 +1,51 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_market_ids.py
+"""
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from ..market_ids import (MARKET_ID_ALPHABET, MARKET_ID_LENGTH, NUM_MARKET_IDS,
+                          encode, permute, new_market_ids)
+from ..models import Market
+from .factories import MarketFactory, UserFactory
+
+
+def test_permute_is_one_to_one_and_stays_in_range():
+    numbers = list(range(20000)) + list(range(NUM_MARKET_IDS - 20000, NUM_MARKET_IDS))
+    permuted = [permute(number) for number in numbers]
+
+    assert len(set(permuted)) == len(numbers)
+    assert all(0 <= number < NUM_MARKET_IDS for number in permuted)
+
+
+def test_permute_depends_on_key():
+    assert [permute(n, b'one key') for n in range(10)] != [permute(n, b'other key') for n in range(10)]
+
+
+def test_encode():
+    assert encode(0) == 'AAAAAAA'
+    assert encode(1) == 'AAAAAAB'
+    assert encode(NUM_MARKET_IDS - 1) == 'ZZZZZZZ'
+
+
+def test_new_market_ids_are_unique_and_typeable(db):
+    with CaptureQueriesContext(connection) as queries:
+        market_ids = new_market_ids(40)
+
+    # All 40 IDs are drawn in one query
+    assert len(queries) == 1
+    assert len(set(market_ids)) == 40
+    for market_id in market_ids:
+        assert len(market_id) == MARKET_ID_LENGTH
+        assert set(market_id) <= set(MARKET_ID_ALPHABET)
+
+
+def test_creating_a_market_does_not_look_for_existing_ids(db):
+    user = UserFactory()
+    with CaptureQueriesContext(connection) as queries:
+        market = MarketFactory(created_by=user)
+
+    # One query for the sequence value, one INSERT
+    assert len(queries) == 2
+    assert Market.objects.get(market_id=market.market_id) == market
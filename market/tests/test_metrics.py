@@ -0,0 +1,102 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_metrics.py
+"""
+
+import json
+import time
+
+from django.urls import reverse
+from .. import metrics
+from ..metrics import Counter, Histogram, Recency, Registry
+from .factories import MarketFactory, TraderFactory, UnProcessedTradeFactory
+
+import pytest
+
+
+@pytest.fixture
+def registry(settings, tmp_path):
+    settings.METRICS_DIR = str(tmp_path)
+    return Registry()
+
+
+@pytest.fixture
+def clean_registry(settings, tmp_path):
+    settings.METRICS_DIR = str(tmp_path)
+    metrics.REGISTRY.reset()
+    yield metrics.REGISTRY
+    metrics.REGISTRY.reset()
+
+
+def test_counter_and_histogram_exposition(registry):
+    polls = Counter('polls_total', "Polls", ['view'], registry=registry)
+    duration = Histogram('duration_seconds', "Duration", buckets=(0.1, 1.0), registry=registry)
+    polls.inc(view='market:current_round')
+    polls.inc(2, view='market:current_round')
+    duration.observe(0.05)
+    duration.observe(0.5)
+    duration.observe(3)
+
+    assert registry.exposition().splitlines() == [
+        '# HELP polls_total Polls',
+        '# TYPE polls_total counter',
+        'polls_total{view="market:current_round"} 3',
+        '# HELP duration_seconds Duration',
+        '# TYPE duration_seconds histogram',
+        'duration_seconds_bucket{le="0.1"} 1',
+        'duration_seconds_bucket{le="1"} 2',
+        'duration_seconds_bucket{le="+Inf"} 3',
+        'duration_seconds_sum 3.55',
+        'duration_seconds_count 3',
+    ]
+
+
+def test_metrics_of_all_workers_are_added_up(registry, tmp_path):
+    trades = Counter('trades_total', "Trades", registry=registry)
+    traders = Recency('connected_traders', "Traders", window=60, registry=registry)
+    trades.inc(5)
+    traders.touch(1)
+
+    # The file of another worker
+    (tmp_path / '99999.json').write_text(json.dumps({
+        'trades_total': [[[], 7]],
+        'connected_traders': {'1': time.time(), '2': time.time(), '3': time.time() - 120},
+    }))
+
+    exposition = registry.exposition()
+    assert 'trades_total 12\n' in exposition
+    # Trader 1 is seen by both workers, trader 3 too long ago
+    assert 'connected_traders 2\n' in exposition
+
+
+def test_metrics_endpoint_counts_game_and_requests(client, logged_in_user, clean_registry):
+    market = MarketFactory(created_by=logged_in_user)
+    TraderFactory.create_batch(2, market=market)
+    client.post(reverse('market:join_market'), {'name': 'Hanne', 'market_id': market.market_id})
+    client.get(reverse('market:current_round', args=(market.market_id,)))
+    client.post(reverse('market:play', args=(market.market_id,)), {
+        'unit_price': '10.00', 'unit_amount': 5})
+    for trader in market.all_traders().exclude(name='Hanne'):
+        UnProcessedTradeFactory(trader=trader, round=0)
+    client.post(reverse('market:finish_round', args=(market.market_id,)))
+
+    response = client.get(reverse('market:metrics'))
+
+    assert response.status_code == 200
+    lines = response.content.decode().splitlines()
+    assert 'markedsspillet_trades_total 1' in lines
+    assert 'markedsspillet_polls_total{view="market:current_round"} 1' in lines
+    assert 'markedsspillet_request_duration_seconds_count{view="market:join_market"} 1' in lines
+    assert 'markedsspillet_finish_round_duration_seconds_count 1' in lines
+    assert 'markedsspillet_finish_round_trades_sum 3' in lines
+    assert 'markedsspillet_active_markets 1' in lines
+    assert 'markedsspillet_connected_traders 1' in lines
+
+
+def test_metrics_endpoint_requires_the_token(client, settings, clean_registry):
+    settings.METRICS_TOKEN = 'hemmelig'
+    url = reverse('market:metrics')
+
+    assert client.get(url).status_code == 401
+    assert client.get(url, HTTP_AUTHORIZATION='Bearer forkert').status_code == 401
+    assert client.get(url, HTTP_AUTHORIZATION='Bearer hemmelig').status_code == 200
@@ -10,9 +10,13 @@ docker-compose -f docker-compose.dev.yml run web pytest -k <substring of test fu
 """
 
 
-from ..models import Trade, RoundStat, UnusedCosts, UsedCosts
+from ..helpers import settle_round
+from ..models import Trade, Trader, RoundStat, spectrum_fraction
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal
-from .factories import MarketFactory, TradeFactory, TraderFactory
+from django.db import connection
+from .factories import MarketFactory, TradeFactory, TraderFactory, UnProcessedTradeFactory
+import pytest
 
 
 ### Test MarketModel ###
@@ -35,95 +39,76 @@ def test_max_allowed_price(db):
     assert market.max_allowed_price() == (12 + 50)*4
 
 
+def test_spectrum_fraction():
+    fractions = [spectrum_fraction(ordinal) for ordinal in range(9)]
+    assert fractions == [Decimal(fraction) for fraction in
+                         ['0', '1', '0.5', '0.25', '0.75', '0.125', '0.625', '0.375', '0.875']]
+
+
+def join(market, name):
+    """ A trader joins the market without a given production cost """
+    return Trader.objects.create(market=market, name=name, balance=market.initial_balance)
+
+
 def test_prod_cost_algorithm(db):
-    # We start out with a market and unused costs.
+    market = MarketFactory(min_cost=Decimal('20.00'), max_cost=Decimal('30.00'))
+
+    costs = [join(market, f"trader{i}").prod_cost for i in range(5)]
+
+    # The first two traders get min_cost and max_cost, the next ones fill the largest gaps
+    assert costs == [Decimal('20.00'), Decimal('30.00'), Decimal('25.00'),
+                     Decimal('22.50'), Decimal('27.50')]
+    market.refresh_from_db()
+    assert market.num_prod_costs_assigned == 5
+
+
+def test_prod_cost_algorithm_costs_are_rounded_to_cents(db):
+    market = MarketFactory(min_cost=Decimal('1.00'), max_cost=Decimal('2.00'))
+
+    costs = [join(market, f"trader{i}").prod_cost for i in range(6)]
+
+    # The sixth trader is given 1 + 1/8 = 1.125, rounded half to even like the prod_cost field does
+    assert costs[5] == Decimal('1.12')
+
+
+def test_prod_cost_counter_is_not_reset_by_the_host(db):
+    market = MarketFactory(min_cost=Decimal('20.00'), max_cost=Decimal('30.00'))
+    for name in ("first", "second"):
+        UnProcessedTradeFactory(trader=join(market, name), round=0)
+
+    # The host's copy of the market was loaded before the traders joined
+    settle_round(market)
+
+    assert join(market, "third").prod_cost == Decimal('25.00')
+    market.refresh_from_db()
+    assert market.round == 1
+    assert market.num_prod_costs_assigned == 3
+
+
+def test_market_save_writes_all_fields(db):
     market = MarketFactory()
-    UnusedCosts.objects.create(
-        market=market, cost=Decimal('20.00'))
-    UnusedCosts.objects.create(
-        market=market, cost=Decimal('30.00'))
-
-    # There really are two unused costs at this point
-    assert (UnusedCosts.objects.all().count() == 2)
-
-    # We create a trader and call the production cost algorithm
-    first_trader = TraderFactory(market=market)
-    first_trader.prod_cost_algorithm()
-
-    # There is now only one unused cost left
-    assert (UnusedCosts.objects.all().count() == 1)
-
-    # There is 1 used cost
-    assert (UsedCosts.objects.all().count() == 1)
-
-    # We create a second trader
-    second_trader = TraderFactory(market=market)
-    second_trader.prod_cost_algorithm()
-
-    # There are now no unused costs left
-    assert (UnusedCosts.objects.all().count() == 0)
-
-    # There are 2 used costs
-    assert (UsedCosts.objects.all().count() == 2)
-
-    # We currently expect one trader with cost 20.00 an another with cost 30.00
-    actual_set_of_trader_costs = {
-        float(first_trader.prod_cost), float(second_trader.prod_cost)}
-    expected_set_of_trader_costs = {20.00, 30.00}
-    assert (actual_set_of_trader_costs == expected_set_of_trader_costs)
-
-    # We create a third trader
-    third_trader = TraderFactory(market=market)
-    third_trader.prod_cost_algorithm()
-
-    # The creating of the third trader should produce a new unused cost (30.00 + 20.00)/2. This cost will be assigned to the third trader
-    # There is now no unused costs
-    assert (UnusedCosts.objects.all().count() == 0)
-
-    # There are 3 used costs
-    assert (UsedCosts.objects.all().count() == 3)
-
-    # We currently expect one trader with cost 20.00 an another with cost 30.00 and a third with 25.00
-    actual_set_of_trader_costs = {
-        float(first_trader.prod_cost), float(second_trader.prod_cost), float(third_trader.prod_cost)}
-    expected_set_of_trader_costs = {20.00, 30.00, 25.00}
-    assert (actual_set_of_trader_costs == expected_set_of_trader_costs)
-
-    # We create a fourth trader
-    fourth_trader = TraderFactory(market=market)
-    fourth_trader.prod_cost_algorithm()
-
-    # The creating of the fourth trader should produce a two new unused cost (20.00 + 25.00)/2 and (25.00+30.00)/2.
-    # One of these new costs should be be assigned to the fourthtrader
-    # There is now one unused costs
-    assert (UnusedCosts.objects.all().count() == 1)
-
-    # There are 4 used costs
-    assert (UsedCosts.objects.all().count() == 4)
-
-    # We produce a fifth trader
-    fifth_trader = TraderFactory(market=market)
-    fifth_trader.prod_cost_algorithm()
-
-    # There should be 0 unused costs at this point
-    assert (UnusedCosts.objects.all().count() == 0)
-
-    # There should be  5 used costs
-    assert (UsedCosts.objects.all().count() == 5)
-
-    # We currently expect one trader with cost 20.00 an another with cost 30.00 and a third with 25.00
-    actual_set_of_trader_costs = {
-        float(first_trader.prod_cost),
-        float(second_trader.prod_cost),
-        float(third_trader.prod_cost),
-        float(fourth_trader.prod_cost),
-        float(fifth_trader.prod_cost)
-    }
-    # The set of assigned costs match our expectations
-    expected_set_of_trader_costs = {20.00, 22.50, 25.00, 27.50, 30.00}
-    assert (actual_set_of_trader_costs ==
-                     expected_set_of_trader_costs)
+    market.num_prod_costs_assigned = 7
+    market.save()
+
+    market.refresh_from_db()
+    assert market.num_prod_costs_assigned == 7
+
+
+@pytest.mark.django_db(transaction=True)
+def test_prod_cost_algorithm_concurrent_joins_get_different_costs():
+    market = MarketFactory(min_cost=Decimal('20.00'), max_cost=Decimal('30.00'))
+
+    def join_in_thread(i):
+        try:
+            return join(market, f"trader{i}").prod_cost
+        finally:
+            connection.close()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        costs = list(executor.map(join_in_thread, range(16)))
 
+    assert len(set(costs)) == 16
+    assert min(costs) == Decimal('20.00') and max(costs) == Decimal('30.00')
 
 
 ### TradeModel ###
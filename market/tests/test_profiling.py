@@ -0,0 +1,59 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_profiling.py
+"""
+
+from django.urls import reverse
+from .factories import MarketFactory, TraderFactory
+
+import pytest
+
+
+@pytest.fixture
+def profile_dir(settings, tmp_path):
+    settings.PROFILE_DIR = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def staff_user(logged_in_user):
+    logged_in_user.is_staff = True
+    logged_in_user.save()
+    return logged_in_user
+
+
+def test_staff_user_profiles_monitor_page(client, staff_user, profile_dir):
+    market = MarketFactory(created_by=staff_user)
+    TraderFactory(market=market)
+
+    response = client.get(reverse('market:monitor', args=(market.market_id,)) + '?profile')
+
+    assert response.status_code == 200
+    name = response['X-Profile']
+    assert name.endswith(f"_market-monitor_{market.market_id}")
+    assert sorted(path.name for path in profile_dir.iterdir()) == [
+        f"{name}.folded", f"{name}.prof", f"{name}.txt"]
+    assert 'render_monitor' in (profile_dir / f"{name}.txt").read_text()
+
+    response = client.get(reverse('market:profiles'))
+    assert name in response.content.decode()
+
+    response = client.get(reverse('market:profile_file', args=(f"{name}.txt",)))
+    assert b'cumulative' in b''.join(response.streaming_content)
+
+
+def test_other_users_cannot_profile(client, logged_in_user, profile_dir):
+    market = MarketFactory(created_by=logged_in_user)
+
+    response = client.get(reverse('market:monitor', args=(market.market_id,)), HTTP_X_PROFILE='1')
+
+    assert response.status_code == 200
+    assert 'X-Profile' not in response
+    assert list(profile_dir.iterdir()) == []
+    assert client.get(reverse('market:profiles')).status_code == 302
+
+
+def test_only_profile_files_are_served(client, staff_user, profile_dir):
+    (profile_dir / 'secret.py').write_text('SECRET_KEY')
+    assert client.get(reverse('market:profile_file', args=('secret.py',))).status_code == 404
+    assert client.get(reverse('market:profile_file', args=('missing.txt',))).status_code == 404
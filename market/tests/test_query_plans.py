@@ -0,0 +1,80 @@
+"""
+Query-plan regression tests for the hot lookups (the queries behind the
+polling endpoints, the trader table and the 'my markets' page).
+
+The tests seed a large dataset, refresh the planner statistics and assert that
+PostgreSQL answers each query without a sequential scan of the big tables.
+
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_query_plans.py
+"""
+
+from django.db import connection
+from ..models import Market, Trade
+from ..synthetic_data import bulk_create_markets
+from .factories import UserFactory
+
+import pytest
+
+NUM_MARKETS = 150
+TRADERS_PER_MARKET = 20
+NUM_ROUNDS = 10
+
+
+@pytest.fixture
+def large_dataset(db):
+    host = UserFactory()
+    markets = bulk_create_markets(
+        NUM_MARKETS, TRADERS_PER_MARKET, NUM_ROUNDS, created_by=host)
+
+    # Other hosts own markets too, so a host's markets are a small fraction of the table
+    for _ in range(5):
+        bulk_create_markets(NUM_MARKETS, 0, 0)
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    return host, markets[1]
+
+
+def assert_no_seq_scan(queryset, *tables):
+    plan = queryset.explain()
+    for table in tables:
+        assert f"Seq Scan on {table}" not in plan, plan
+
+
+def test_valid_trades_this_round_uses_index(large_dataset):
+    _, market = large_dataset
+    assert_no_seq_scan(
+        market.valid_trades_this_round(), 'market_trade', 'market_trader')
+
+
+def test_all_trades_this_round_uses_index(large_dataset):
+    _, market = large_dataset
+    assert_no_seq_scan(market.all_trades_this_round(), 'market_trade')
+
+
+def test_trades_of_previous_round_uses_index(large_dataset):
+    _, market = large_dataset
+    queryset = Trade.objects.filter(
+        market=market, round=market.round - 1, was_forced=False)
+    assert_no_seq_scan(queryset, 'market_trade')
+
+
+def test_active_traders_ordered_by_balance_uses_index(large_dataset):
+    _, market = large_dataset
+    queryset = market.active_traders().order_by('-balance')
+    assert_no_seq_scan(queryset, 'market_trader')
+
+
+def test_all_traders_uses_index(large_dataset):
+    _, market = large_dataset
+    assert_no_seq_scan(market.all_traders(), 'market_trader')
+    assert_no_seq_scan(market.active_or_bankrupt_traders(), 'market_trader')
+
+
+def test_my_markets_listing_uses_index(large_dataset):
+    host, _ = large_dataset
+    queryset = Market.objects.filter(
+        created_by=host, deleted=False).order_by('-created_at')
+    assert_no_seq_scan(queryset, 'market_market')
@@ -0,0 +1,79 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_request_timing.py
+"""
+
+import logging
+import re
+
+from django.db import connection
+from django.template import engines
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ..request_timing import timed_request, current_timing
+from .factories import MarketFactory
+
+import pytest
+
+
+def server_timing(response):
+    """ The Server-Timing header as {name: (description, duration)} """
+    metrics = {}
+    for metric in response['Server-Timing'].split(', '):
+        name = metric.split(';')[0]
+        desc = re.search(r'desc="([^"]*)"', metric)
+        dur = re.search(r'dur=([\d.]+)', metric)
+        metrics[name] = (desc and desc.group(1), dur and float(dur.group(1)))
+    return metrics
+
+
+@pytest.fixture
+def joined_client(db, client):
+    market = MarketFactory()
+    client.post(reverse('market:join_market'), {
+        'name': 'Hanne', 'market_id': market.market_id})
+    return client, market
+
+
+def test_server_timing_header_of_play_page(joined_client):
+    client, market = joined_client
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.get(reverse('market:play', args=(market.market_id,)))
+
+    metrics = server_timing(response)
+    assert metrics['view'][0] == 'market:play'
+    assert metrics['db'][0] == f"{len(queries)} queries"
+    assert metrics['tpl'][1] > 0
+    # Queries made by templates (e.g. lazy querysets) count as both db and template time
+    assert metrics['total'][1] >= max(metrics['db'][1], metrics['tpl'][1])
+    # The trader's session was cached when joining the market
+    assert metrics['cache'][0] == "1 hits / 0 misses"
+
+
+def test_request_is_logged_with_view_name(joined_client, caplog):
+    client, market = joined_client
+
+    with caplog.at_level(logging.INFO, logger='market.request_timing'):
+        client.get(reverse('market:play', args=(market.market_id,)))
+
+    [line] = [record.getMessage() for record in caplog.records
+              if record.name == 'market.request_timing']
+    assert line.startswith(f"view=market:play method=GET path=/{market.market_id}/play/ status=200 ")
+    assert 'db_queries=' in line and 'cache_hits=1 cache_misses=0' in line
+
+
+def test_unknown_urls_are_timed(client):
+    response = client.get('/does/not/exist/')
+    assert response.status_code == 404
+    assert server_timing(response)['view'][0] == '-'
+
+
+def test_templates_are_only_timed_inside_requests():
+    template = engines['django'].from_string('{{ market_id }}')
+    assert current_timing() is None
+
+    with timed_request() as timing:
+        template.render({'market_id': 'ABCDEFG'})
+    assert timing.template_seconds > 0
+    assert current_timing() is None
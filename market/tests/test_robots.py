@@ -0,0 +1,246 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_robots.py
+"""
+
+import re
+import socket
+import time
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.core.cache import cache
+from django.db import connection
+from django.template.loader import render_to_string
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from ..forms import MAX_ROBOT_CODE_LENGTH
+from ..models import Market, MarketEvent, RoundStat, Trade, Trader
+from ..robots import BUDGET_ERROR, RobotPool, clean_choices, play_robots, robot_constants, run_robot, warm_pool
+from .factories import MarketFactory, TradeFactory, TraderFactory
+
+import pytest
+
+ALGORITHM = """
+price_choice = prod_cost + 1
+amount_choice = 10 if round == 1 else amount_last_round + 1
+print("runde", round)
+"""
+
+
+def test_robots_get_the_constants_of_the_code_header(db):
+    market = MarketFactory()
+    header = render_to_string('market/play/code_header.py', {'market': market})
+
+    names = set(re.findall(r'^(\w+) = \{(\w+)\}$', header, re.MULTILINE))
+    assert names == {(name, name) for name in robot_constants(market, TraderFactory(market=market), None, None)}
+
+
+def test_robot_constants_view_computes_the_constants_once_per_round(client, db):
+    cache.clear()
+    market = MarketFactory(round=1)
+    trader = TraderFactory(market=market, balance=Decimal('1000.00'), prod_cost=Decimal('8.00'))
+    last_trade = TradeFactory(trader=trader, round=0)
+    last_round_stat = RoundStat.objects.create(market=market, round=0, avg_price=Decimal('10.50'))
+    session = client.session
+    session['trader_id'] = trader.id
+    session.save()
+    url = reverse('market:robot_constants', args=(market.market_id,))
+
+    response = client.get(url)
+    assert response.json() == {
+        'round': 1,
+        'constants': robot_constants(market, trader, last_trade, last_round_stat),
+        'integers': ['max_amount', 'round', 'amount_last_round', 'demand_last_round'],
+    }
+    assert response.json()['constants']['avg_price_last_round'] == 10.5
+
+    # Only the trader is read, until the round is finished
+    with CaptureQueriesContext(connection) as queries:
+        assert client.get(url).json() == response.json()
+    assert len([query for query in queries if 'market_trader' in query['sql']]) == 1
+    assert not [query for query in queries if 'market_trade"' in query['sql'] or 'market_roundstat' in query['sql']]
+
+    Market.objects.filter(pk=market.pk).update(round=2)
+    assert client.get(url).json()['constants']['round'] == 3
+
+    # An edit of the market mid-round is not hidden by the cache
+    Market.objects.filter(pk=market.pk).update(max_cost=Decimal('20.00'))
+    assert client.get(url).json()['constants']['max_price'] == 80.0
+
+    # Only for the market of the trader
+    assert client.get(reverse('market:robot_constants', args=(MarketFactory().market_id,))).status_code == 404
+
+
+def test_run_robot_returns_choices_and_output():
+    result = run_robot(ALGORITHM, {'prod_cost': 4.0, 'round': 1, 'amount_last_round': None})
+    assert result == {'price_choice': 5.0, 'amount_choice': 10, 'output': 'runde 1\n', 'error': None}
+
+
+@pytest.mark.parametrize('code', [
+    'price_choice = (',
+    'while True: pass',
+    'data = "x" * 10 ** 10',
+    'with open("robot.txt", "w") as f: f.write("x")',
+])
+def test_run_robot_reports_failing_code(settings, code):
+    settings.ROBOT_TIMEOUT_SECONDS = 5
+    result = run_robot(code, {})
+    assert result['error']
+    assert result['price_choice'] is None
+
+
+# Gets the globals of the os module without importing it, to get past the restricted imports and
+# builtins of robot_runner.py and show that the sandbox of the process stops the code anyway
+OS_GLOBALS = ("os = [cls for cls in ().__class__.__base__.__subclasses__() "
+              "if cls.__name__ == '_wrap_close'][0].__init__.__globals__\n")
+
+
+@pytest.mark.parametrize('code', [
+    'print(open({path!r}).read())',
+    OS_GLOBALS + 'print(os["read"](os["open"]({path!r}, os["O_RDONLY"]), 10000))',
+    OS_GLOBALS + 'print(os["listdir"]({directory!r}))',
+])
+def test_robots_cannot_read_files(settings, code):
+    path = Path(settings.BASE_DIR) / 'config' / 'settings.py'
+    result = run_robot(code.format(path=str(path), directory=str(path.parent)), {})
+    assert result['error']
+    assert 'SECRET_KEY' not in result['output'] and 'settings.py' not in result['output']
+
+
+@pytest.mark.parametrize('code', [
+    'import os\nos.remove({path!r})',
+    OS_GLOBALS + 'os["remove"]({path!r})',
+    OS_GLOBALS + 'os["rename"]({path!r}, {path!r} + ".moved")',
+])
+def test_robots_cannot_remove_files(tmp_path, code):
+    path = tmp_path / 'important.txt'
+    path.write_text('data')
+    result = run_robot(code.format(path=str(path)), {})
+    assert result['error']
+    assert path.read_text() == 'data'
+
+
+@pytest.mark.parametrize('code', [
+    'import socket\nsocket.socket().connect(("127.0.0.1", {port}))',
+    # The real import has to read socket.py
+    OS_GLOBALS + 'socket = os["__builtins__"]["__import__"]("socket")\nsocket.socket().connect(("127.0.0.1", {port}))',
+    # ctypes is loaded by the runner, and can make the system call directly
+    OS_GLOBALS + 'libc = os["sys"].modules["ctypes"].CDLL(None)\nassert libc.socket(2, 1, 0) >= 0',
+])
+def test_robots_cannot_connect(code):
+    with socket.socket() as server:
+        server.bind(('127.0.0.1', 0))
+        server.listen()
+        server.settimeout(0.5)
+        result = run_robot(code.format(port=server.getsockname()[1]), {})
+        assert result['error']
+        with pytest.raises(socket.timeout):
+            server.accept()
+
+
+def test_choices_are_cleaned_as_in_the_browser():
+    constants = {'max_price': 40.0, 'max_amount': 25}
+    assert clean_choices({'price_choice': 12.345, 'amount_choice': 2.5, 'error': None}, constants)[:2] == (
+        Decimal('12.35'), 3)
+    price, amount, warnings = clean_choices({'price_choice': 100, 'amount_choice': -1, 'error': None}, constants)
+    assert (price, amount, len(warnings)) == (Decimal('40.00'), 0, 2)
+    assert clean_choices({'price_choice': None, 'amount_choice': 5, 'error': 'SyntaxError'}, constants)[:2] == (
+        Decimal('0.00'), 0)
+
+
+def test_robots_trade_on_the_server_after_each_round(client, logged_in_user):
+    market = MarketFactory(created_by=logged_in_user, min_cost=4, max_cost=4, allow_robots=True)
+    client.post(reverse('market:join_market'), {'name': 'Robot', 'market_id': market.market_id})
+    robot = Trader.objects.get(market=market)
+    human = TraderFactory(market=market)
+
+    # The robot is started with a trade in the first round
+    client.post(reverse('market:play', args=(market.market_id,)), {
+        'unit_price': '5.00', 'unit_amount': '10', 'auto_play': 'true', 'robot_code': ALGORITHM})
+    robot.refresh_from_db()
+    assert robot.auto_play and robot.robot_code == ALGORITHM
+
+    client.post(reverse('market:finish_round', args=(market.market_id,)))
+    client.post(reverse('market:finish_round', args=(market.market_id,)))
+
+    trades = Trade.objects.filter(trader=robot).order_by('round')
+    assert [(trade.round, trade.unit_amount, trade.was_forced) for trade in trades] == [
+        (0, 10, False), (1, 11, False), (2, 12, False)]
+    assert trades[2].unit_price == trades[2].prod_cost + 1
+    assert not Trade.objects.filter(trader=human, was_forced=False).exists()
+    assert MarketEvent.objects.filter(market=market, kind=MarketEvent.TRADE, trader_id=robot.id).count() == 3
+
+    robot.refresh_from_db()
+    assert 'runde 3' in robot.robot_log
+    response = client.get(reverse('market:robot_logs'))
+    assert 'runde 3' in response.content.decode()
+
+
+def test_robot_processes_are_kept_between_rounds(client, logged_in_user):
+    market = MarketFactory(created_by=logged_in_user, allow_robots=True)
+    robot = TraderFactory(market=market, auto_play=True, robot_code=ALGORITHM)
+
+    assert play_robots(market) == 1
+    process = warm_pool().processes[robot.id].process
+    client.post(reverse('market:finish_round', args=(market.market_id,)))
+    assert warm_pool().processes[robot.id].process is process
+    assert Trade.objects.filter(trader=robot).count() == 2
+
+
+def test_all_robots_trade_within_the_time_of_the_round(db, settings):
+    settings.ROBOT_ROUND_SECONDS = 1
+    market = MarketFactory(allow_robots=True)
+    looper = TraderFactory(market=market, auto_play=True, robot_code='while True:\n    pass\n')
+    robot = TraderFactory(market=market, auto_play=True, robot_code=ALGORITHM)
+
+    start = time.perf_counter()
+    assert play_robots(market) == 2
+    assert time.perf_counter() - start < settings.ROBOT_TIMEOUT_SECONDS
+
+    looper.refresh_from_db()
+    assert BUDGET_ERROR in looper.robot_log
+    assert Trade.objects.get(trader=looper).unit_amount == 0
+    assert Trade.objects.get(trader=robot).unit_amount == 10
+
+
+def test_robot_pool_stops_the_least_recently_used_processes():
+    robots = [SimpleNamespace(id=trader_id, robot_code=ALGORITHM) for trader_id in range(3)]
+    constants = {'prod_cost': 4.0, 'round': 1, 'amount_last_round': None}
+    with RobotPool(10, max_processes=2) as pool:
+        for robot in robots:
+            assert pool.run(robot, constants)['amount_choice'] == 10
+        assert list(pool.processes) == [1, 2]
+
+
+def test_robots_only_play_on_markets_that_allow_them(client, db):
+    market = MarketFactory(allow_robots=False)
+    client.post(reverse('market:join_market'), {'name': 'Robot', 'market_id': market.market_id})
+    trader = Trader.objects.get(market=market)
+
+    # The trade is placed, but the code is not stored
+    client.post(reverse('market:play', args=(market.market_id,)), {
+        'unit_price': '5.00', 'unit_amount': '10', 'auto_play': 'true', 'robot_code': ALGORITHM})
+    trader.refresh_from_db()
+    assert not trader.auto_play and trader.robot_code == ''
+    assert Trade.objects.filter(trader=trader, round=0).exists()
+
+    # Robots started before the host turned robots off don't play
+    robot = TraderFactory(market=market, auto_play=True, robot_code=ALGORITHM)
+    assert play_robots(market) == 0
+    assert not Trade.objects.filter(trader=robot).exists()
+
+
+def test_robot_code_has_a_max_length(client, db):
+    market = MarketFactory(allow_robots=True)
+    client.post(reverse('market:join_market'), {'name': 'Robot', 'market_id': market.market_id})
+    trader = Trader.objects.get(market=market)
+
+    client.post(reverse('market:play', args=(market.market_id,)), {
+        'unit_price': '5.00', 'unit_amount': '10', 'auto_play': 'true',
+        'robot_code': ALGORITHM + '#' * MAX_ROBOT_CODE_LENGTH})
+    trader.refresh_from_db()
+    assert not trader.auto_play and trader.robot_code == ''
+    assert not Trade.objects.filter(trader=trader).exists()
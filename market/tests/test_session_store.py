@@ -0,0 +1,86 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_session_store.py
+"""
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ..session_store import SessionStore, KEY_PREFIX
+from .factories import MarketFactory
+
+import pytest
+
+
+def session_queries(queries):
+    return [query for query in queries if 'django_session' in query['sql']]
+
+
+@pytest.fixture
+def joined_client(db, client):
+    market = MarketFactory()
+    client.post(reverse('market:join_market'), {
+        'name': 'Hanne', 'market_id': market.market_id})
+    return client, market
+
+
+def test_trader_poll_makes_no_session_queries(joined_client):
+    client, market = joined_client
+
+    with CaptureQueriesContext(connection) as queries:
+        play_response = client.get(
+            reverse('market:play', args=(market.market_id,)))
+        client.get(reverse('market:current_round', args=(market.market_id,)))
+        home_response = client.get(reverse('market:home'))
+
+    assert play_response.context['trader'].name == 'Hanne'
+    assert home_response.context['market'] == market
+    assert session_queries(queries) == []
+
+
+def test_default_db_backend_queries_session_on_each_page_load(db, settings):
+    # For comparison: with Django's database backend, each page load of a player reads the session
+    settings.SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+    client = Client()
+    market = MarketFactory()
+    client.post(reverse('market:join_market'), {
+        'name': 'Hanne', 'market_id': market.market_id})
+
+    with CaptureQueriesContext(connection) as queries:
+        client.get(reverse('market:play', args=(market.market_id,)))
+
+    assert len(session_queries(queries)) == 1
+
+
+def test_trader_session_falls_back_to_database(joined_client):
+    client, market = joined_client
+    session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+    caches[settings.SESSION_CACHE_ALIAS].delete(KEY_PREFIX + session_key)
+
+    response = client.get(reverse('market:play', args=(market.market_id,)))
+
+    assert response.context['trader'].name == 'Hanne'
+    # The session is cached again after being read from the database
+    assert caches[settings.SESSION_CACHE_ALIAS].get(KEY_PREFIX + session_key) is not None
+
+
+def test_host_sessions_are_not_cached(logged_in_user, client):
+    client.get(reverse('market:my_markets'))
+    session_key = client.cookies[settings.SESSION_COOKIE_NAME].value
+
+    assert caches[settings.SESSION_CACHE_ALIAS].get(KEY_PREFIX + session_key) is None
+    assert SessionStore(session_key).get('_auth_user_id') == str(logged_in_user.pk)
+
+
+def test_session_cache_keeps_more_than_300_sessions(session_cache_dir):
+    # Django's default MAX_ENTRIES of the file based cache is 300
+    cache = caches[settings.SESSION_CACHE_ALIAS]
+    for number in range(400):
+        cache.set(f'{KEY_PREFIX}session{number}', {'trader_id': number})
+
+    assert all(cache.get(f'{KEY_PREFIX}session{number}') is not None for number in range(400))
+    # The tests use a directory of their own
+    assert len(list(session_cache_dir.iterdir())) == 400
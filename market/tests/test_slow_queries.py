@@ -0,0 +1,127 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_slow_queries.py
+"""
+
+import json
+import logging
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.signals import request_finished
+from django.test import RequestFactory
+from django.urls import reverse
+from .. import slow_queries
+from ..market_ids import new_market_ids
+from ..request_timing import timed_request
+from .factories import MarketFactory, TraderFactory
+
+import pytest
+
+
+@pytest.fixture
+def all_queries_slow(settings, caplog, monkeypatch):
+    settings.SLOW_QUERY_SECONDS = 0
+    slow_queries._last_explained.clear()
+    # Only log to caplog, not to the slow query log file
+    monkeypatch.setattr(slow_queries.logger, 'handlers', [])
+    caplog.set_level(logging.WARNING, logger='market.slow_queries')
+    return caplog
+
+
+def logged_entries(caplog):
+    return [json.loads(record.getMessage()) for record in caplog.records
+            if record.name == 'market.slow_queries']
+
+
+def test_slow_query_is_logged_with_view_market_origin_and_plan(db, client, all_queries_slow):
+    market = MarketFactory()
+    TraderFactory(market=market)
+
+    client.get(reverse('market:current_round', args=(market.market_id,)))
+
+    [entry] = [entry for entry in logged_entries(all_queries_slow)
+               if entry['origin'] == 'Market.num_ready_traders > Market.valid_trades_this_round']
+    assert entry['view'] == 'market:current_round'
+    assert entry['market_id'] == market.market_id
+    assert entry['caller'].startswith('market/models.py:')
+    assert entry['sql'].startswith('SELECT COUNT(*)')
+    assert 'Aggregate' in entry['plan']
+
+
+def test_lazy_querysets_remember_the_method_that_built_them(db, all_queries_slow):
+    market = MarketFactory()
+    trades = market.valid_trades_this_round()
+
+    with timed_request():
+        list(trades)
+
+    [entry] = logged_entries(all_queries_slow)
+    assert entry['origin'] == 'Market.valid_trades_this_round'
+    assert entry['caller'].startswith('market/tests/test_slow_queries.py:')
+
+
+def test_queries_of_a_request_are_explained_after_the_response(db, all_queries_slow):
+    market = MarketFactory()
+
+    with timed_request(RequestFactory().get('/')):
+        market.num_ready_traders()
+    assert not [entry for entry in logged_entries(all_queries_slow) if entry['sql'].startswith('SELECT')]
+
+    request_finished.send(sender=None)
+    [entry] = [entry for entry in logged_entries(all_queries_slow) if entry['sql'].startswith('SELECT')]
+    assert 'Aggregate' in entry['plan']
+
+
+def test_slow_nextval_query_is_not_explained(db, all_queries_slow, monkeypatch):
+    explained = []
+    monkeypatch.setattr(slow_queries, 'explain', lambda *args: explained.append(args))
+
+    with timed_request(RequestFactory().get('/')):
+        new_market_ids(3)
+    request_finished.send(sender=None)
+
+    [entry] = [entry for entry in logged_entries(all_queries_slow) if 'nextval' in entry['sql']]
+    assert entry['plan'] is None
+    assert not explained
+
+
+def test_only_read_only_selects_are_explained():
+    assert slow_queries.read_only('SELECT COUNT(*) FROM market_trade WHERE round = %s')
+    assert not slow_queries.read_only("SELECT nextval('market_id_seq') FROM generate_series(1, %s)")
+    assert not slow_queries.read_only('SELECT * FROM market_market WHERE id = %s FOR UPDATE')
+    assert not slow_queries.read_only('SELECT * FROM market_market FOR NO KEY UPDATE SKIP LOCKED')
+    assert not slow_queries.read_only('UPDATE market_market SET round = %s')
+
+
+def test_fast_queries_are_not_logged(db, settings, caplog):
+    settings.SLOW_QUERY_SECONDS = 10
+    with timed_request():
+        MarketFactory().num_ready_traders()
+    assert not [record for record in caplog.records if record.name == 'market.slow_queries']
+
+
+def test_fingerprint_collapses_placeholder_lists():
+    assert slow_queries.fingerprint('SELECT 1 WHERE id IN (%s, %s, %s)') == 'SELECT 1 WHERE id IN (%s, ...)'
+
+
+def test_command_summarizes_by_total_time(tmp_path):
+    log = tmp_path / 'slow_queries.log'
+    entries = [
+        {'sql': 'SELECT a', 'duration_ms': 150, 'view': 'market:monitor', 'origin': None, 'caller': None, 'plan': None},
+        {'sql': 'SELECT b', 'duration_ms': 120, 'view': 'market:play', 'origin': 'Market.all_traders',
+         'caller': 'market/helpers.py:10 in f', 'plan': 'Seq Scan on market_trader'},
+        {'sql': 'SELECT b', 'duration_ms': 110, 'view': 'market:play', 'origin': 'Market.all_traders',
+         'caller': 'market/helpers.py:10 in f', 'plan': None},
+    ]
+    log.write_text(''.join(json.dumps(entry) + '\n' for entry in entries))
+
+    out = StringIO()
+    call_command('slow_queries', log=log, plans=True, stdout=out)
+
+    output = out.getvalue()
+    assert '3 slow queries, 2 different queries' in output
+    assert output.index('SELECT b') < output.index('SELECT a')
+    assert '#1: total 230 ms, 2 times, mean 115 ms, max 120 ms' in output
+    assert 'origins: Market.all_traders' in output
+    assert 'Seq Scan on market_trader' in output
@@ -0,0 +1,41 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_startup.py
+"""
+
+from io import StringIO
+
+from django.core.management import call_command
+from django.template import engines
+
+from ..startup import parse_importtime, warm_up
+
+
+def test_warm_up_compiles_templates_into_the_cache():
+    num_templates = warm_up()
+
+    loader = engines['django'].engine.template_loaders[0]
+    cached_names = {template.origin.template_name for template in loader.get_template_cache.values()
+                    if hasattr(template, 'origin')}
+    assert num_templates > 20
+    assert {'market/monitor.html', 'market/play/play.html', 'market/trader-table.html'} <= cached_names
+
+
+def test_parse_importtime():
+    lines = [
+        'import time: self [us] | cumulative | imported package',
+        'import time:       150 |        150 |     _io',
+        'import time:      1200 |       5300 | django.db.models',
+    ]
+    assert parse_importtime(lines) == [('django.db.models', 1.2, 5.3), ('_io', 0.15, 0.15)]
+
+
+def test_startup_profile_compares_settings_modules():
+    out = StringIO()
+    call_command('startup_profile', 'config.settings', 'config.settings_production', repeat=1, top=5, stdout=out)
+
+    output = out.getvalue()
+    assert 'templates compiled' in output
+    development, production = output.split('Apps of config.settings_production')
+    assert 'django_extensions' in development.split('Apps of config.settings ')[1]
+    assert 'django_extensions' not in production
@@ -0,0 +1,31 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_static_storage.py
+"""
+
+import gzip
+import json
+
+from django.core.management import call_command
+from django.test import override_settings
+
+
+def test_collectstatic_writes_hashed_and_gzipped_files(tmp_path):
+    with override_settings(STATIC_ROOT=str(tmp_path),
+                           STATICFILES_STORAGE='market.static_storage.CompressedManifestStaticFilesStorage'):
+        call_command('collectstatic', '--noinput', verbosity=0)
+
+    manifest = json.loads((tmp_path / 'staticfiles.json').read_text())['paths']
+    hashed_name = manifest['skulpt/skulpt.min.js']
+    assert hashed_name != 'skulpt/skulpt.min.js'
+
+    # The big Skulpt runtime is precompressed, under both names
+    for name in ('skulpt/skulpt.min.js', hashed_name):
+        content = (tmp_path / name).read_bytes()
+        compressed = (tmp_path / (name + '.gz')).read_bytes()
+        assert gzip.decompress(compressed) == content
+        assert len(compressed) < len(content) / 2
+
+    # Small files and images are not
+    assert not (tmp_path / 'skulpt/README.md.gz').exists()
+    assert not list(tmp_path.glob('img/*.gz'))
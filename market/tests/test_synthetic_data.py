@@ -0,0 +1,57 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_synthetic_data.py
+"""
+
+import random
+from decimal import Decimal
+
+from django.core.management import call_command
+
+from ..models import Market, Trader, Trade, RoundStat
+from ..synthetic_data import generate, human_decision, robot_decision
+
+import pytest
+
+
+def test_generated_games_are_settled_with_the_demand_formula(db):
+    markets = generate(num_markets=2, num_traders=6, num_rounds=4, robot_share=0.5)
+
+    for market in markets:
+        market.refresh_from_db()
+        assert market.round == 4 and market.game_over
+        assert market.num_prod_costs_assigned == 6
+        # One trade per trader per round, forced if the trader missed the round
+        assert Trade.objects.filter(market=market).count() == 6 * 4
+        for round_stat in RoundStat.objects.filter(market=market):
+            for trade in Trade.objects.filter(market=market, round=round_stat.round, was_forced=False):
+                raw_demand = market.alpha - (market.gamma + market.theta) * trade.unit_price + market.theta * round_stat.avg_price
+                assert abs(trade.demand - max(0, round(raw_demand))) <= 1
+                assert trade.units_sold == min(trade.demand, trade.unit_amount)
+    assert Trader.objects.filter(market__in=markets, auto_play=True).exists()
+
+
+@pytest.mark.parametrize('balance, max_amount', [(Decimal('20.00'), 2), (Decimal('-50.00'), 0)])
+def test_synthetic_decisions_are_allowed_by_the_game(balance, max_amount):
+    market = Market(alpha=Decimal('105.0'), theta=Decimal('14.5'), gamma=Decimal('3.0'),
+                    min_cost=Decimal('8.00'), max_cost=Decimal('8.00'), accum_cost_change=Decimal('1.00'))
+    trader = Trader(market=market, prod_cost=Decimal('8.00'), balance=balance)
+    # After a round of high prices, the traders want to ask a lot and produce a lot
+    last_avg_price = Decimal('100.00')
+
+    decisions = [robot_decision(market, trader, last_avg_price)]
+    decisions += [human_decision(market, trader, last_avg_price, random.Random(seed)) for seed in range(20)]
+
+    for unit_price, unit_amount in decisions:
+        # As TradeForm and clean_choices allow
+        assert unit_price <= market.max_allowed_price() == Decimal('36.00')
+        assert 0 <= unit_amount <= max_amount
+
+
+@pytest.mark.django_db(transaction=True)
+def test_setup_test_data_generates_markets_in_parallel():
+    call_command('setup_test_data', markets=3, traders=4, rounds=2, workers=2)
+
+    assert Market.objects.count() == 3
+    assert Trader.objects.count() == 3 * 4
+    assert Trade.objects.count() == 3 * 4 * 2
@@ -0,0 +1,86 @@
+"""
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_tournament.py
+"""
+
+from decimal import Decimal
+
+from django.core.management import call_command
+
+from ..fast_forward import fast_forward
+from ..scenarios import SCENARIOS
+from ..tournament import BUILTIN_STRATEGIES, StrategyRunner, load_strategies, play_game, run_tournament
+from .factories import MarketFactory, TraderFactory
+
+import pytest
+
+UNDERCUTTER = """
+price_choice = prod_cost + 1 if round == 1 else avg_price_last_round - 0.5
+amount_choice = 30
+"""
+
+LOOPER = """
+while True:
+    try:
+        pass
+    except BaseException:
+        pass
+"""
+
+
+@pytest.fixture
+def strategy_file(tmp_path):
+    path = tmp_path / 'undercutter.py'
+    path.write_text(UNDERCUTTER)
+    return path
+
+
+def test_games_are_played_as_on_the_server(db):
+    scenario = SCENARIOS[1]
+    codes = [load_strategies()['algoritme_3'], UNDERCUTTER]
+    market = MarketFactory(
+        allow_robots=True, max_rounds=scenario['max_rounds'], initial_balance=scenario['initial_balance'],
+        **{field: Decimal(str(scenario[field])) for field in ('alpha', 'theta', 'gamma', 'min_cost', 'max_cost')})
+    traders = [TraderFactory(market=market, balance=Decimal(scenario['initial_balance']), prod_cost=Decimal('8.00'),
+                             auto_play=True, robot_code=code) for code in codes]
+    list(fast_forward(market, scenario['max_rounds']))
+
+    with StrategyRunner(scenario['max_rounds']) as runner:
+        profits = play_game(scenario, codes, scenario['max_rounds'], runner)
+    for trader, profit in zip(traders, profits):
+        trader.refresh_from_db()
+        assert float(trader.balance - scenario['initial_balance']) == pytest.approx(profit)
+
+
+def test_tournament_results_are_reproducible(strategy_file):
+    strategies = load_strategies([strategy_file])
+    assert set(strategies) == set(BUILTIN_STRATEGIES) | {'undercutter'}
+
+    results = run_tournament(strategies, games=150, scenarios=[0, 3], workers=2, seed=1)
+    assert set(results) == {0, 3}
+    for scenario_results in results.values():
+        # Each strategy plays the 3 others 150 times, and every game has a winner
+        assert all(totals['games'] == 450 for totals in scenario_results.values())
+        assert sum(totals['wins'] for totals in scenario_results.values()) == pytest.approx(6 * 150)
+
+    assert run_tournament(strategies, games=150, scenarios=[0, 3], workers=1, seed=1) == results
+
+
+def test_a_strategy_that_times_out_has_failed(settings, tmp_path):
+    settings.ROBOT_TIMEOUT_SECONDS = 0.5
+    path = tmp_path / 'looper.py'
+    path.write_text(LOOPER)
+    strategies = load_strategies([path])
+
+    results = run_tournament(strategies, games=5, scenarios=[0], seed=1)[0]
+    assert results['looper']['error'] == 'Koden brugte mere end 0.5 sekunder.'
+    assert set(results['looper']['profits']) == {0.0}
+    assert all(totals['error'] is None for name, totals in results.items() if name != 'looper')
+
+
+def test_robot_tournament_command(strategy_file, capsys):
+    call_command('robot_tournament', str(strategy_file), '--games', '10', '--scenarios', '1', '--workers', '1')
+    output = capsys.readouterr().out
+    assert 'Scenario 1' in output and 'Scenario 2' not in output
+    assert 'undercutter' in output
+    assert '60 games' in output
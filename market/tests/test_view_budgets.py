@@ -0,0 +1,142 @@
+"""
+Query-count and latency budgets for the views that are hit hardest during a game.
+
+Each view is requested on markets of 10, 100 and 500 traders that have played
+1, 15 and 100 rounds, and must stay within the budget in BUDGETS below:
+
+    view            max. queries   max. ms
+    --------------  ------------   -------
+    play                       6       300
+    monitor                   10      2000
+    trader_table               6       300
+    current_round              3       100
+    join_market               11       300
+    finish_round              17      1500
+
+The query budgets don't depend on the size of the market, so a change that
+reintroduces an N+1 query pattern (a query per trader or per round) fails on the
+larger markets. The latency budgets are generous upper bounds that catch
+accidental quadratic work, not small regressions. Wall-clock times depend on the
+machine (e.g. a shared CI runner), so a view over its latency budget only fails
+the test with ENFORCE_LATENCY_BUDGETS=1; otherwise it is marked with * in the table
+of the measured numbers, which is printed at the end of the test run.
+
+To run all tests in this file:
+docker-compose -f docker-compose.dev.yml run web pytest market/tests/test_view_budgets.py
+
+With the latency budgets enforced:
+docker-compose -f docker-compose.dev.yml run -e ENFORCE_LATENCY_BUDGETS=1 web pytest market/tests/test_view_budgets.py
+"""
+
+import os
+import time
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from ..models import Trader, Trade
+from ..synthetic_data import seed_market
+
+import pytest
+
+NUM_TRADERS = [10, 100, 500]
+NUM_ROUNDS = [1, 15, 100]
+
+# view: (max. number of queries, max. milliseconds)
+BUDGETS = {
+    'play': (6, 300),
+    'monitor': (10, 2000),
+    'trader_table': (6, 300),
+    'current_round': (3, 100),
+    'join_market': (11, 300),
+    'finish_round': (17, 1500),
+}
+
+# Measurements of the test run, printed by pytest_terminal_summary in conftest.py
+MEASUREMENTS = []
+
+ENFORCE_LATENCY_BUDGETS = os.environ.get('ENFORCE_LATENCY_BUDGETS') == '1'
+
+
+@pytest.fixture(params=[(num_traders, num_rounds) for num_traders in NUM_TRADERS for num_rounds in NUM_ROUNDS],
+                ids=lambda size: f"{size[0]}traders-{size[1]}rounds")
+def seeded_market(request, db, client, logged_in_user):
+    """
+    A market hosted by the logged in user, where every trader has traded in every
+    previous round and half of the traders have traded in the current round.
+    """
+    num_traders, num_rounds = request.param
+    market = seed_market(num_traders, num_rounds, created_by=logged_in_user)
+    traders = list(market.all_traders())
+
+    # The client plays as one of the traders
+    session = client.session
+    session['trader_id'] = traders[1].pk
+    session['market_id'] = market.market_id
+    session['username'] = traders[1].name
+    session.save()
+
+    return market, request.param
+
+
+def measure(view, size, request_view):
+    """ Requests the view, records the number of queries and the time spent, and checks them against the budget """
+    with CaptureQueriesContext(connection) as queries:
+        start = time.perf_counter()
+        response = request_view()
+        milliseconds = (time.perf_counter() - start) * 1000
+
+    max_queries, max_milliseconds = BUDGETS[view]
+    MEASUREMENTS.append((view, *size, len(queries), max_queries, milliseconds, max_milliseconds))
+
+    assert response.status_code in (200, 302)
+    assert len(queries) <= max_queries, '\n'.join(query['sql'] for query in queries)
+    if ENFORCE_LATENCY_BUDGETS:
+        assert milliseconds <= max_milliseconds
+    return response
+
+
+def test_play_budget(client, seeded_market):
+    market, size = seeded_market
+    response = measure('play', size, lambda: client.get(
+        reverse('market:play', args=(market.market_id,))))
+    assert response.status_code == 200
+
+
+def test_monitor_budget(client, seeded_market):
+    market, size = seeded_market
+    response = measure('monitor', size, lambda: client.get(
+        reverse('market:monitor', args=(market.market_id,))))
+    assert response.status_code == 200
+
+
+def test_trader_table_budget(client, seeded_market):
+    market, size = seeded_market
+    response = measure('trader_table', size, lambda: client.get(
+        reverse('market:trader_table', args=(market.market_id,))))
+    assert response.status_code == 200
+
+
+def test_current_round_budget(client, seeded_market):
+    market, size = seeded_market
+    measure('current_round', size, lambda: client.get(
+        reverse('market:current_round', args=(market.market_id,))))
+
+
+def test_join_market_budget(client, seeded_market):
+    market, size = seeded_market
+    response = measure('join_market', size, lambda: client.post(
+        reverse('market:join_market'), {'name': 'latecomer', 'market_id': market.market_id}))
+    assert response.status_code == 302
+    # The new trader has a forced trade for every round played so far
+    trader = Trader.objects.get(market=market, name='latecomer')
+    assert Trade.objects.filter(trader=trader).count() == market.round
+
+
+def test_finish_round_budget(client, seeded_market):
+    market, size = seeded_market
+    response = measure('finish_round', size, lambda: client.post(
+        reverse('market:finish_round', args=(market.market_id,))))
+    assert response.status_code == 302
+    # Every trader has exactly one trade in the finished round
+    assert Trade.objects.filter(market=market, round=market.round).count() == market.all_traders().count()
@@ -10,13 +10,21 @@ docker-compose -f docker-compose.dev.yml run web pytest -k <substring of test fu
 """
 from django.test import TestCase
 from django.urls import reverse
-from ..models import Market, Trader, Trade, RoundStat, UnusedCosts
-from ..forms import TraderForm
+from ..models import Market, Trader, Trade, RoundStat
+from ..forms import TraderForm, BulkMarketForm
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from decimal import Decimal
 from .factories import TradeFactory, UnProcessedTradeFactory, ForcedTradeFactory, TraderFactory, UserFactory, MarketFactory
 from ..scenarios import SCENARIOS
+from .. import views
+
+import asyncio
+import json
 
 import pytest
+from asgiref.sync import async_to_sync
+from asgiref.testing import ApplicationCommunicator
 from pytest_django.asserts import assertTemplateUsed, assertContains, assertNotContains
 
 # Test robot_logs view
@@ -241,7 +249,6 @@ def create_market_data():
 def test_create_market_is_created_when_data_is_valid(client, logged_in_user, create_market_data):
     """ 
     A market is created when posting valid data & logged in user is set as market's creator 
-    Since min_cost < max_cost two new Unused costs are produced
     After successfull creation, client is redirected to monitor page
     """
     response = client.post(
@@ -253,21 +260,18 @@ def test_create_market_is_created_when_data_is_valid(client, logged_in_user, cre
     assert(response['Location'] == reverse(
         'market:monitor', args=(market.market_id,)))
 
-    # min_cost is less than max_cost. Therefore two Unused costs should have been produced after creating the market
-    unused_costs = UnusedCosts.objects.all()
-    assert (unused_costs.count() == 2)
-    # the first unused cost should have value = min_cost
-    assert (unused_costs.first().cost == 11)
-    assert (unused_costs.first().market == market)
-    # the second unused cost should have value = max_cost
-    assert (unused_costs.last().cost == 144)
+    # min_cost is less than max_cost. The first traders to join get min_cost and max_cost
+    first_trader = Trader.objects.create(market=market, name='first', balance=market.initial_balance)
+    second_trader = Trader.objects.create(market=market, name='second', balance=market.initial_balance)
+    assert (first_trader.prod_cost == 11)
+    assert (second_trader.prod_cost == 144)
 
 
-def test_create_market_when_min_costs_equals_max_cost_no_unused_costs_are_produced(client, logged_in_user, create_market_data):
+def test_create_market_when_min_costs_equals_max_cost_all_traders_get_same_cost(client, logged_in_user, create_market_data):
     """ 
     A market is created when posting valid data & logged in user is set as market's creator 
     After successfull creation, client is redirected to monitor page. 
-    Since min_cost == max_cost not Unused costs are produced
+    Since min_cost == max_cost all traders get the same production cost
     """
     create_market_data['max_cost'] = 11
 
@@ -279,9 +283,12 @@ def test_create_market_when_min_costs_equals_max_cost_no_unused_costs_are_produc
     assert (response['Location'] == reverse(
         'market:monitor', args=(market.market_id,)))
 
-    # min_cost is less than max_cost. Therefore two Unused costs should have been produced after creating the market
-    unused_costs = UnusedCosts.objects.all()
-    assert (unused_costs.count() == 0)
+    traders = [Trader.objects.create(market=market, name=name, balance=market.initial_balance)
+               for name in ['first', 'second', 'third']]
+    assert ({trader.prod_cost for trader in traders} == {11})
+    # The production cost algorithm is not used
+    market.refresh_from_db()
+    assert (market.num_prod_costs_assigned == 0)
 
 
 def test_create_market_no_market_is_created_when_min_cost_bigger_than_max_cost_and_error_mgs_is_generated(client, logged_in_user, create_market_data):
@@ -329,6 +336,67 @@ def test_create_market_if_user_chooses_negative_max_rounds_he_gets_a_good_error_
     assertContains(response, "Antal runder kan ikke være mindre end 1")
 
 
+# Test create_markets_bulk view
+
+def test_create_markets_bulk_view_name_and_template(client, logged_in_user):
+    response = client.get(
+        reverse('market:create_markets_bulk')+'?scenario_id=2')
+    assert response.status_code == 200
+    assertTemplateUsed(response, 'market/create_market_details.html')
+    assertContains(response, "Antal markeder")
+    assert response.context['form'].initial['min_cost'] == SCENARIOS[2]['min_cost']
+
+
+def test_create_markets_bulk_view_login_required(client):
+    response = client.get(reverse('market:create_markets_bulk'))
+    assert response.status_code == 302
+    assert response['Location'] == '/accounts/login/?next=/create_markets_bulk/'
+
+
+def test_create_markets_bulk_creates_markets_with_one_insert(client, logged_in_user, create_market_data):
+    create_market_data['num_markets'] = 40
+
+    with CaptureQueriesContext(connection) as queries:
+        response = client.post(
+            reverse('market:create_markets_bulk'), create_market_data)
+
+    markets = Market.objects.filter(created_by=logged_in_user)
+    assert markets.count() == 40
+    assert {market.max_cost for market in markets} == {144}
+    assert len(set(market.market_id for market in markets)) == 40
+
+    market_inserts = [query for query in queries if query['sql'].startswith('INSERT INTO "market_market"')]
+    assert len(market_inserts) == 1
+
+    assert response.status_code == 302
+    assert response['Location'].startswith(reverse('market:join_sheet') + '?market_ids=')
+
+
+def test_create_markets_bulk_no_markets_are_created_when_num_markets_is_invalid(client, logged_in_user, create_market_data):
+    create_market_data['num_markets'] = BulkMarketForm.MAX_NUM_MARKETS + 1
+    response = client.post(
+        reverse('market:create_markets_bulk'), create_market_data)
+    assert response.status_code == 200
+    assert Market.objects.count() == 0
+
+
+def test_join_sheet_shows_join_links_of_own_markets_only(client, logged_in_user, create_market_data):
+    create_market_data['num_markets'] = 3
+    response = client.post(
+        reverse('market:create_markets_bulk'), create_market_data, follow=True)
+    other_market = MarketFactory()
+
+    assertTemplateUsed(response, 'market/join_sheet.html')
+    markets = Market.objects.filter(created_by=logged_in_user).order_by('created_at')
+    assert len(response.context['markets']) == 3
+    for market in markets:
+        assertContains(response, f"?market_id={market.market_id}")
+
+    response = client.get(
+        reverse('market:join_sheet') + f'?market_ids={other_market.market_id}')
+    assert response.context['markets'] == []
+
+
 # Test Monitor View
 
 def test_monitor_view_url_exists_at_proper_name_and_uses_proper_template(client, db, logged_in_user):
@@ -649,6 +717,41 @@ def test_current_round_view_returns_correct_non_zero_round(client, db):
             })
 
 
+def test_current_round_view_only_allows_get(client, db):
+    market = MarketFactory()
+    url = reverse('market:current_round', args=(market.market_id,))
+    response = client.post(url)
+    assert (response.status_code == 405)
+
+
+def test_polling_views_are_async():
+    """ Under an ASGI worker the polls must not take up a worker each (see docs/deployment.md) """
+    assert asyncio.iscoroutinefunction(views.current_round)
+    assert asyncio.iscoroutinefunction(views.trader_table)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_current_round_view_served_by_asgi_application():
+    from config.asgi import application
+    market = MarketFactory(round=3)
+
+    async def get():
+        communicator = ApplicationCommunicator(application, {
+            'type': 'http', 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+            'path': reverse('market:current_round', args=(market.market_id,)),
+            'query_string': b'', 'headers': [(b'host', b'testserver')], 'server': ('testserver', 80),
+        })
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        start = await communicator.receive_output(timeout=10)
+        body = await communicator.receive_output(timeout=10)
+        return start, body
+
+    start, body = async_to_sync(get)()
+    assert (start['status'] == 200)
+    assert (b'Server-Timing' in dict(start['headers']))
+    assert (json.loads(body['body'])['round'] == 3)
+
+
 # Test My Markets
 
 def test_mymarkets_view_login_required(client, logged_in_user):
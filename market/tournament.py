@@ -0,0 +1,220 @@
+"""
+Offline tournaments between robot strategies (see the robot_tournament management command).
+
+A strategy is Python code written against the constants of code_header.py, like the code of a
+robot on the play page. The built-in algorithms 1 to 3 of the play page always take part.
+For each scenario in scenarios.SCENARIOS, every combination of `seats` strategies plays a number
+of games: a market with one trader per strategy, played to max_rounds (or `rounds` in endless
+scenarios). The strategy with the highest balance at the end wins the game.
+
+The games are played in memory with the game engine of the server (process_trade), and the
+strategies are run and their choices cleaned as on the server (robots.py). Nothing is written to
+the database. The games are split into chunks that run in a process pool.
+
+As on the server, each strategy runs in a sandboxed robot_runner.py subprocess with its limits
+on CPU time, memory and the time of each round (a RobotProcess for each strategy in a chunk).
+A strategy that breaks a limit, e.g. with an infinite loop, has failed: it makes no trades in
+the rest of the chunk, and its error is reported with the results.
+"""
+
+import itertools
+import multiprocessing
+import random
+import statistics
+from decimal import Decimal
+from pathlib import Path
+from types import SimpleNamespace
+
+from django.db import connections
+from django.template.loader import render_to_string
+
+from .helpers import process_trade
+from .models import spectrum_fraction
+from .robots import RobotProcess, clean_choices, failed_run, robot_constants
+from .scenarios import SCENARIOS
+
+# The algorithms of the play page
+BUILTIN_STRATEGIES = {
+    'algoritme_1': 'market/play/code_body_1.py',
+    'algoritme_2': 'market/play/code_body_2.py',
+    'algoritme_3': 'market/play/code_body_3.py',
+}
+
+GAMES_PER_CHUNK = 100
+
+
+def load_strategies(paths=(), builtin=True):
+    """ Returns a dict with the code of each strategy by name (the file name without .py) """
+    strategies = {}
+    if builtin:
+        # The code of the play page is a template, with the product names in its comments
+        context = {'market': {'product_name_singular': 'vare', 'product_name_plural': 'varer'}}
+        for name, template in BUILTIN_STRATEGIES.items():
+            strategies[name] = render_to_string(template, context)
+    for path in paths:
+        path = Path(path)
+        if path.stem in strategies:
+            raise ValueError(f"Two strategies are named {path.stem}")
+        strategies[path.stem] = path.read_text()
+    return strategies
+
+
+class StrategyRunner:
+    """
+    Runs the strategies of a chunk of games, each in its own RobotProcess for the given number
+    of rounds. Used as a context manager, that stops the processes at the end.
+    """
+
+    def __init__(self, rounds, seed=0):
+        self.rounds = rounds
+        # The strategies use the random module, so each round gets a seed
+        self.rng = random.Random(seed)
+        self.processes = {}
+        # The error of each strategy that broke a limit
+        self.errors = {}
+
+    def run(self, code, constants):
+        if code in self.errors:
+            return failed_run(self.errors[code])
+        if code not in self.processes:
+            self.processes[code] = RobotProcess(self.rounds)
+        process = self.processes[code]
+        result = process.run(code, constants, seed=self.rng.getrandbits(32))
+        if process.process is None:
+            # Killed for breaking a limit, so it is not run again
+            self.errors[code] = result['error']
+        return result
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        for process in self.processes.values():
+            process.close()
+
+
+def play_game(scenario, codes, num_rounds, runner):
+    """
+    Plays a game of the scenario with a trader for each code (in the order of the seats),
+    running the codes with the StrategyRunner.
+    Returns the profit of each trader: the final balance minus the initial balance.
+    """
+    # The settings of the scenarios are ints and floats, the fields of a market are decimals
+    alpha, theta, gamma, min_cost, max_cost, initial_balance, cost_slope = (
+        Decimal(str(scenario[field])) for field in
+        ('alpha', 'theta', 'gamma', 'min_cost', 'max_cost', 'initial_balance', 'cost_slope'))
+    market = SimpleNamespace(round=0, max_cost=max_cost, alpha=alpha, theta=theta, gamma=gamma)
+
+    # Production costs are given as on the server, in the order the traders join
+    traders = [
+        SimpleNamespace(
+            balance=initial_balance, last_trade=None,
+            prod_cost=(min_cost + (max_cost - min_cost) * spectrum_fraction(ordinal)).quantize(Decimal('0.01')))
+        for ordinal in range(len(codes))
+    ]
+    last_round_stat = None
+
+    for _ in range(num_rounds):
+        trades = []
+        for trader, code in zip(traders, codes):
+            constants = robot_constants(market, trader, trader.last_trade, last_round_stat)
+            price, amount, _ = clean_choices(runner.run(code, constants), constants)
+            trades.append(SimpleNamespace(trader=trader, unit_price=price, unit_amount=amount))
+
+        avg_price = sum(trade.unit_price for trade in trades) / len(trades)
+        for trade in trades:
+            process_trade(market, trade, avg_price, save=False)
+            trade.trader.last_trade = trade
+        last_round_stat = SimpleNamespace(avg_price=avg_price)
+
+        # A cost never becomes 0 or negative, as in finish_round
+        for trader in traders:
+            if trader.prod_cost > -cost_slope:
+                trader.prod_cost += cost_slope
+        market.round += 1
+
+    return [float(trader.balance - initial_balance) for trader in traders]
+
+
+def play_chunk(scenario_index, names, codes, num_games, num_rounds, seed):
+    """
+    Plays num_games games of the scenario between the strategies (one trader each), with the
+    seats shuffled in every game. Returns {name: (wins, profits, error)}; a tie for the highest
+    balance is a shared win, and error is None unless the strategy broke a limit.
+    """
+    scenario = SCENARIOS[scenario_index]
+    rng = random.Random(seed)
+    results = {name: [0.0, [], None] for name in names}
+    with StrategyRunner(num_games * num_rounds, seed) as runner:
+        for _ in range(num_games):
+            seats = list(range(len(names)))
+            rng.shuffle(seats)
+            profits = play_game(scenario, [codes[seat] for seat in seats], num_rounds, runner)
+            best = max(profits)
+            winners = [seat for seat, profit in zip(seats, profits) if profit == best]
+            for seat, profit in zip(seats, profits):
+                results[names[seat]][1].append(profit)
+                if seat in winners:
+                    results[names[seat]][0] += 1 / len(winners)
+        for name, code in zip(names, codes):
+            results[name][2] = runner.errors.get(code)
+    return scenario_index, results
+
+
+def play_chunk_in_worker(args):
+    return play_chunk(*args)
+
+
+def scenario_rounds(scenario, endless_rounds):
+    return endless_rounds if scenario['endless'] else scenario['max_rounds']
+
+
+def run_tournament(strategies, games=1000, seats=2, endless_rounds=15, scenarios=None, workers=1, seed=0):
+    """
+    Plays `games` games of every combination of `seats` strategies on each scenario (all of them,
+    or the given indices of SCENARIOS).
+    Returns {scenario index: {strategy name: {'games', 'wins', 'profits', 'error'}}}, where error
+    is the first error of a strategy that broke a limit of the sandbox (or None).
+    """
+    scenario_indices = range(len(SCENARIOS)) if scenarios is None else scenarios
+    chunks = []
+    for scenario_index in scenario_indices:
+        num_rounds = scenario_rounds(SCENARIOS[scenario_index], endless_rounds)
+        for combination in itertools.combinations(sorted(strategies), seats):
+            codes = [strategies[name] for name in combination]
+            for first_game in range(0, games, GAMES_PER_CHUNK):
+                chunk_seed = f"{seed}-{scenario_index}-{'-'.join(combination)}-{first_game}"
+                chunks.append((scenario_index, combination, codes,
+                               min(GAMES_PER_CHUNK, games - first_game), num_rounds, chunk_seed))
+
+    results = {index: {} for index in scenario_indices}
+
+    def add(scenario_index, chunk_results):
+        for name, (wins, profits, error) in chunk_results.items():
+            totals = results[scenario_index].setdefault(
+                name, {'games': 0, 'wins': 0.0, 'profits': [], 'error': None})
+            totals['games'] += len(profits)
+            totals['wins'] += wins
+            totals['profits'] += profits
+            totals['error'] = totals['error'] or error
+
+    if workers > 1:
+        # The forked workers must not share the connection of this process
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            # In order, so the results don't depend on the number of workers
+            for scenario_index, chunk_results in pool.imap(play_chunk_in_worker, chunks):
+                add(scenario_index, chunk_results)
+    else:
+        for chunk in chunks:
+            add(*play_chunk(*chunk))
+    return results
+
+
+def profit_distribution(profits):
+    """ The mean and the 5th, 25th, 50th, 75th and 95th percentiles of the profits """
+    if len(profits) < 2:
+        return (profits[0],) * 6 if profits else (0.0,) * 6
+    percentiles = statistics.quantiles(profits, n=20, method='inclusive')
+    return (statistics.fmean(profits), percentiles[0], percentiles[4], percentiles[9],
+            percentiles[14], percentiles[18])
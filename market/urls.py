@@ -11,12 +11,22 @@ urlpatterns = [
     path('create_market/', views.create_market, name='create_market'),
     path('create_market_details/', views.create_market_details,
          name='create_market_details'),
+    path('create_markets_bulk/', views.create_markets_bulk,
+         name='create_markets_bulk'),
+    path('join_sheet/', views.join_sheet, name='join_sheet'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('profiles/', views.profiles, name='profiles'),
+    path('profiles/<filename>', views.profile_file, name='profile_file'),
     path('<market_id>/play/', views.play, name='play'),
     path('robotjournal/', views.robot_logs, name='robot_logs'),
+    path('<market_id>/robot_constants/', views.robot_constants, name='robot_constants'),
     path('<market_id>/monitor/', views.monitor, name='monitor'),
+    path('<market_id>/restore/', views.restore_archived_market, name='restore_archived_market'),
     path('<market_id>/market-edit/', views.market_edit, name='market_edit'),
+    path('<market_id>/timeline/', views.timeline, name='timeline'),
     path('my_markets/', views.my_markets, name='my_markets'),
     path('<market_id>/finish_round', views.finish_round, name='finish_round'),
+    path('<market_id>/fast_forward', views.fast_forward_market, name='fast_forward'),
     path('<market_id>/toggle_monitor_auto_pilot_setting/',
          views.toggle_monitor_auto_pilot_setting, name='toggle_monitor_auto_pilot_setting'),
     path('<market_id>/set_game_over',
@@ -1,20 +1,29 @@
-from math import floor
 import json
+import time
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
-from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotAllowed, HttpResponseBadRequest, JsonResponse, FileResponse, Http404, StreamingHttpResponse
 from django.urls import reverse
 from django.views.decorators.http import require_GET, require_POST
 from django.http import HttpResponse
-from .models import Market, Trader, Trade, RoundStat, UnusedCosts
-from .forms import MarketForm, MarketUpdateForm, TraderForm, TradeForm
-from .helpers import create_forced_trade, process_trade, generate_balance_list, add_graph_context_for_monitor_page, generate_prod_cost_list
-from django.contrib.auth.decorators import login_required
+from .models import Market, Trader, Trade, MarketEvent
+from .forms import MarketForm, BulkMarketForm, MarketUpdateForm, TraderForm, TradeForm, FastForwardForm
+from .helpers import new_forced_trade, settle_round, add_graph_context_for_monitor_page, add_context_for_trader_table, add_context_for_play_page
+from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
+from django.conf import settings
 import json
 from .scenarios import SCENARIOS
+from .archive import restore_market
+from .events import record_event, round_timeline, settings_edits
+from .robots import current_robot_constants, play_robots
+from .fast_forward import fast_forward, rounds_to_play
+from . import metrics
+from .profiling import list_profiles, profile_file_path
 
 @login_required
 def market_edit(request, market_id):
+    start = time.perf_counter()
     market = get_object_or_404(Market, market_id=market_id)
 
     # If user is not the creator of the market, redirect to home page
@@ -24,7 +33,9 @@ def market_edit(request, market_id):
     if request.method == 'POST':
         form = MarketUpdateForm(request.POST, instance=market)
         if form.is_valid():
-            form.save()
+            # Only the fields of the form, so the production cost counter is left alone (see models.py)
+            form.save(commit=False).save(update_fields=form.Meta.fields)
+            record_event(market, MarketEvent.SETTINGS_EDITED, started=start)
             messages.success(
                 request, "Du opdaterede markedet."
             )
@@ -42,20 +53,47 @@ def market_edit(request, market_id):
 
 @require_GET
 def robot_logs(request):
-    return render(request, 'market/robot_logs.html')
+    # The log of the latest run of the trader's robot on the server (see robots.py)
+    trader_id = request.session.get('trader_id')
+    trader = Trader.objects.filter(id=trader_id).only('robot_log').first() if trader_id else None
+    return render(request, 'market/robot_logs.html', {'server_log': trader.robot_log if trader else ''})
  
 
-
 @require_GET
+def robot_constants(request, market_id):
+    """
+    The constants of code_header.py for the trader's robot in the current round, fetched by the
+    play page and given to the code as Python values (see robot-worker.js)
+    """
+    trader = Trader.objects.select_related('market').filter(id=request.session.get('trader_id')).first()
+    if trader is None or trader.market.market_id != market_id:
+        raise Http404
+    constants = current_robot_constants(trader)
+    return JsonResponse({
+        'round': trader.market.round,
+        'constants': constants,
+        # JSON has no ints, so the page is told which numbers are ints in Python
+        'integers': [name for name, value in constants.items() if isinstance(value, int)],
+    })
+
+
+async def trader_table(request, market_id):
+    """ Polled by the monitor page. Async, see current_round """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    return await sync_to_async(render_trader_table)(request, market_id)
+
+
 @login_required
-def trader_table(request, market_id):
+def render_trader_table(request, market_id):
     market = get_object_or_404(Market, market_id=market_id)
 
     # If user is not the creator of the market, redirect to home page
     if not request.user == market.created_by:
         return HttpResponseRedirect(reverse('market:home'))
 
-    return render(request, 'market/trader-table.html', {'market': market})
+    context = add_context_for_trader_table({'market': market})
+    return render(request, 'market/trader-table.html', context)
 
 
 def add_context_for_join_form(context, request):
@@ -84,6 +122,7 @@ def add_context_for_join_form(context, request):
 
 @require_POST
 def join_market(request):
+    start = time.perf_counter()
     form = TraderForm(request.POST)
 
     if form.is_valid():
@@ -102,9 +141,11 @@ def join_market(request):
 
         # If player joins a game in round n>0, create 'forced trades' for round 0,1,..,n-1
         if market.round > 0:
-            for round_num in range(market.round):
-                create_forced_trade(
-                    trader=new_trader, round_num=round_num, is_new_trader=True)
+            Trade.objects.bulk_create([
+                new_forced_trade(trader=new_trader, round_num=round_num, is_new_trader=True)
+                for round_num in range(market.round)
+            ])
+        record_event(market, MarketEvent.JOIN, trader=new_trader, started=start)
 
         # After joining the market, the player is redirected to the play page
         return redirect(reverse('market:play', args=(market.market_id,)))
@@ -137,7 +178,7 @@ def my_markets(request):
         delete_market_id = request.POST['delete_market_id']
         market = get_object_or_404(Market, market_id=delete_market_id)
         market.deleted = True
-        market.save()
+        market.save(update_fields=['deleted'])
         return HttpResponseRedirect(reverse('market:my_markets'))
 
     markets = Market.objects.filter(
@@ -157,10 +198,6 @@ def create_market(request):
             new_market = form.save(commit=False)
             new_market.created_by = request.user
             new_market.save()
-            if new_market.min_cost < new_market.max_cost:
-                # add min_cost og max_cost to the list of unused costs
-                UnusedCosts(market=new_market, cost=new_market.min_cost).save()
-                UnusedCosts(market=new_market, cost=new_market.max_cost).save()
             return redirect(reverse('market:monitor', args=(new_market.market_id,)))
 
     elif request.method == 'GET':
@@ -181,12 +218,6 @@ def create_market_details(request):
             new_market = form.save(commit=False)
             new_market.created_by = request.user
             new_market.save()
-            # if traders should be assigned different equal production cost
-            if new_market.min_cost < new_market.max_cost:
-                # add min_cost og max_cost to the list of unused costs
-                UnusedCosts(market=new_market, cost=new_market.min_cost).save()
-                UnusedCosts(market=new_market, cost=new_market.max_cost).save()
-
             return redirect(reverse('market:monitor', args=(new_market.market_id,)))
 
     elif request.method == 'GET':
@@ -205,9 +236,55 @@ def create_market_details(request):
     return render(request, 'market/create_market_details.html', context)
 
 
+@login_required
+def create_markets_bulk(request):
+
+    scenario_title = ""
+
+    if request.method == 'POST':
+        scenario_title = request.POST['scenario_title']
+        form = BulkMarketForm(request.POST)
+
+        if form.is_valid():
+            markets = form.save_markets(created_by=request.user)
+            market_ids = ','.join(market.market_id for market in markets)
+            return redirect(reverse('market:join_sheet') + f'?market_ids={market_ids}')
+
+    elif request.method == 'GET':
+        if 'scenario_id' in request.GET:
+            scenario = SCENARIOS[int(request.GET['scenario_id'])]
+            scenario_title = scenario['title']
+        else:
+            return HttpResponseRedirect(reverse('market:create_market'))
+
+        form = BulkMarketForm(initial=scenario)
+
+    context = {
+        'scenario_title': scenario_title,
+        'form': form,
+        'bulk': True,
+    }
+    return render(request, 'market/create_market_details.html', context)
+
+
+@require_GET
+@login_required
+def join_sheet(request):
+    """ Printable sheet with the join links of the given markets (comma separated IDs in market_ids) """
+    market_ids = request.GET.get('market_ids', '').split(',')
+
+    # Only the user's own markets are shown, in the order given
+    markets = Market.objects.filter(
+        created_by=request.user, deleted=False, market_id__in=market_ids)
+    markets = sorted(markets, key=lambda market: market_ids.index(market.market_id))
+
+    return render(request, 'market/join_sheet.html', {'markets': markets})
+
+
 @require_POST
 @login_required
 def remove_trader_from_market(request):
+    start = time.perf_counter()
     trader_id = request.POST['remove_trader_id']
     trader = get_object_or_404(Trader, id=trader_id)
     market = get_object_or_404(Market, market_id=trader.market.market_id)
@@ -217,6 +294,7 @@ def remove_trader_from_market(request):
         return HttpResponseRedirect(reverse('market:home'))
 
     trader.remove()
+    record_event(market, MarketEvent.REMOVAL, trader=trader, started=start)
     return redirect(reverse('market:monitor', args=(trader.market.market_id,)))
 
 
@@ -230,7 +308,7 @@ def toggle_monitor_auto_pilot_setting(request, market_id):
         return HttpResponseRedirect(reverse('market:home'))
 
     market.monitor_auto_pilot = not market.monitor_auto_pilot
-    market.save()
+    market.save(update_fields=['monitor_auto_pilot'])
     return redirect(reverse('market:monitor', args=(market.market_id,)))
 
 
@@ -244,7 +322,7 @@ def set_game_over(request, market_id):
         return HttpResponseRedirect(reverse('market:home'))
 
     market.game_over = True
-    market.save()
+    market.save(update_fields=['game_over'])
 
     return redirect(reverse('market:monitor', args=(market.market_id,)))
 
@@ -252,90 +330,114 @@ def set_game_over(request, market_id):
 @require_POST
 @login_required
 def finish_round(request, market_id):
+    start = time.perf_counter()
     market = get_object_or_404(Market, market_id=market_id)
 
     # If user is not the creator of the market, redirect to home page
     if not request.user == market.created_by:
         return HttpResponseRedirect(reverse('market:home'))
 
-    # Query the trade decisions made by the traders in the current round
-    valid_trades = market.valid_trades_this_round()
+    valid_trades = settle_round(market)
 
-    # Let's assert that there is at leat 1 valid trade. Otherwise we will get a zero division error,
-    # when calculating the avg. price below.
-    assert(len(valid_trades) >
-           0), "No trades in market this round. Can't calculate avg. price."
+    record_event(market, MarketEvent.ROUND_FINISHED, round_num=market.round - 1, started=start)
+    metrics.FINISH_ROUND_DURATION.observe(time.perf_counter() - start)
+    metrics.FINISH_ROUND_TRADES.observe(len(valid_trades))
 
-    # Calculate the average price (will be used to calculate the demand for each traders good)
-    avg_price = sum(
-        [trade.unit_price for trade in valid_trades]) / len(valid_trades)
+    # The robots place their trades for the new round on the server (see robots.py)
+    play_robots(market)
 
-    # Process each of the valid trades
-    for trade in valid_trades:
-        process_trade(
-            market, trade, avg_price)
+    return redirect(reverse('market:monitor', args=(market.market_id,)))
 
-    # Create 'forced trades' for all traders who did not make a trade in time
-    for trader in market.all_traders():
-        if not trader.is_ready():
-            create_forced_trade(
-                trader=trader, round_num=market.round, is_new_trader=False)
 
-    # Let's assert that at this point, there is exactly one trade pr trader in the current round
-    assert(len(market.all_trades_this_round()) == len(market.all_traders())
-           ), f"Number of trades in this round does not equal num traders ."
+@require_POST
+@login_required
+def fast_forward_market(request, market_id):
+    """
+    Plays the rounds of a market where all traders are robots back to back (see fast_forward.py),
+    and streams the progress to the monitor page as one line of JSON per round
+    """
+    market = get_object_or_404(Market, market_id=market_id)
 
-    # Save data for charts
-    round_stat = RoundStat.objects.create(
-        market=market, round=market.round, avg_price=avg_price)
+    # If user is not the creator of the market, redirect to home page
+    if not request.user == market.created_by:
+        return HttpResponseRedirect(reverse('market:home'))
+
+    if not market.all_are_robots():
+        return HttpResponseBadRequest("Kun markeder, hvor alle spillere er robotter, kan spoles frem.")
+    form = FastForwardForm(market, data=request.POST)
+    if not form.is_valid():
+        return HttpResponseBadRequest(' '.join(form.errors['num_rounds']))
 
-    active_or_bankrupt_traders = market.active_or_bankrupt_traders()
+    num_rounds = rounds_to_play(market, form.cleaned_data['num_rounds'])
+    # The rest of the rounds are played by fast-forwarding again, before gunicorn kills the worker
+    steps = fast_forward(market, num_rounds, seconds=settings.FAST_FORWARD_SECONDS)
+    progress = (json.dumps(step) + '\n' for step in steps)
+    response = StreamingHttpResponse(progress, content_type='application/x-ndjson')
+    # Don't let nginx buffer the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
 
-    round_stat.avg_balance_after = sum(
-        [trader.balance for trader in active_or_bankrupt_traders])/len(active_or_bankrupt_traders)
 
-    round_stat.avg_amount = sum(
-        [trade.unit_amount for trade in valid_trades]) / len(valid_trades)
+@require_GET
+def monitor(request, market_id):
+    market = get_object_or_404(Market, market_id=market_id)
 
-    round_stat.save()
+    # Only the user who created the market has permission to monitor page
+    if not request.user == market.created_by:
+        return HttpResponseRedirect(reverse('market:home'))
 
-    # Update trader production cost
-    for trader in market.all_traders():
-        new_cost = trader.prod_cost + market.cost_slope
-        if new_cost > 0:
-            trader.prod_cost = new_cost
-            trader.save()
+    # The rows of an archived market are in cold storage, the host can restore them (restore_archived_market)
+    if market.archived:
+        return render(request, 'market/archived_market.html', {'market': market})
 
-    # Update total production cost change
-    market.accum_cost_change += market.cost_slope
+    return render_monitor(request, market)
 
-    # Update market round
-    market.round += 1
 
-    # Check game over
-    if market.check_game_over():
-        market.game_over = True
+@require_POST
+@login_required
+def restore_archived_market(request, market_id):
+    """ Brings the market back from cold storage (see archive.py), when the host wants to see it again """
+    market = get_object_or_404(Market, market_id=market_id)
 
-    market.save()
+    # If user is not the creator of the market, redirect to home page
+    if not request.user == market.created_by:
+        return HttpResponseRedirect(reverse('market:home'))
 
+    if market.archived:
+        restore_market(market)
+    # The monitor page reads from the primary for a while after the POST (see db_router.py)
     return redirect(reverse('market:monitor', args=(market.market_id,)))
 
 
 @require_GET
-def monitor(request, market_id):
+@login_required
+def timeline(request, market_id):
+    """ How long each round of the market took, from the event log (see events.py) """
     market = get_object_or_404(Market, market_id=market_id)
 
-    # Only the user who created the market has permission to monitor page
+    # Only the user who created the market has permission to see the timeline
     if not request.user == market.created_by:
         return HttpResponseRedirect(reverse('market:home'))
 
+    context = {
+        'market': market,
+        'rounds': round_timeline(market),
+        'settings_edits': settings_edits(market),
+    }
+    return render(request, 'market/timeline.html', context)
+
+
+def render_monitor(request, market):
+    """ Renders the monitor page of a market. Used by the monitor view """
     context = {
         'market': market,
         'rounds': range(1, market.round + 1),
+        'fast_forward_form': FastForwardForm(market) if market.all_are_robots() else None,
         'show_stats_fields': ['balance_before', 'unit_price', 'profit', 'unit_amount', 'demand', 'units_sold'],
     }
 
-    # Add context for graphs
+    # Add context for the trader table and graphs
+    context = add_context_for_trader_table(context)
     context = add_graph_context_for_monitor_page(context)
 
     return render(request, 'market/monitor.html', context)
@@ -343,6 +445,7 @@ def monitor(request, market_id):
 
 @require_POST
 def declare_bankruptcy(request, trader_id):
+    start = time.perf_counter()
     trader = get_object_or_404(Trader, id=trader_id)
 
     # Only trader himself can declare himself bankrupt
@@ -351,6 +454,7 @@ def declare_bankruptcy(request, trader_id):
 
     trader.bankrupt = True
     trader.save()
+    record_event(trader.market, MarketEvent.BANKRUPTCY, trader=trader, started=start)
 
     return redirect(reverse('market:play', args=(trader.market.market_id,)))
 
@@ -368,81 +472,83 @@ def play(request, market_id):
                 f"<br>You have been permanently removed from the market {market_id} by the market host. <br><br>You can rejoin the market with a new name.<br><br>Please contact the market host if you have any questions.")
 
         market = trader.market
-        round_stats = RoundStat.objects.filter(market=market)
-        trades = Trade.objects.filter(trader=trader)
+        context = {
+            'market': market,
+            'trader': trader,
+        }
 
         if request.method == 'POST':
+            start = time.perf_counter()
             form = TradeForm(data=request.POST)
             if form.is_valid():
                 new_trade = form.save(commit=False)
                 new_trade.trader = trader
+                new_trade.market = market
                 new_trade.round = market.round
                 new_trade.balance_before = trader.balance
                 new_trade.prod_cost = trader.prod_cost
                 new_trade.save()
+                record_event(market, MarketEvent.TRADE, trader=trader, started=start)
+                metrics.TRADES.inc()
 
                 auto_play = form.cleaned_data['auto_play']
-                if auto_play:
+                if auto_play and market.allow_robots:
+                    # From now on the server plays the robot's trades (see robots.py)
                     trader.auto_play = True
+                    trader.robot_code = form.cleaned_data['robot_code']
                     trader.save()
                 return redirect(reverse('market:play', args=(market.market_id,)))
 
-        elif request.method == 'GET':
+            # Show the invalid form with its errors
+            context['form'] = form
 
-            if market.round > 0 and round_stats.last() is not None:
-                market_average = round_stats.last().avg_price
-                form = TradeForm(trader, market_average)
-            else:
-                form = TradeForm(trader)
+        context = add_context_for_play_page(context)
 
-        # Set x-axis for graphs
-        if market.endless:
-            round_labels = list(range(1, market.round + 2))
-        else:
-            round_labels = list(range(1, market.max_rounds + 1))
+        return render(request, 'market/play/play.html', context)
 
-        context = {
-            'market': market,
-            'trader': trader,
-            'form': form,
-            'round_stats': round_stats,
-            'trades': trades,
-            'max_amount': floor(trader.balance/trader.prod_cost),
-            'max_price': 4 * market.max_cost,
-
-            # Labels for x-axis for graphs
-            'round_labels_json': json.dumps(round_labels),
-
-            # data for units graph
-            'data_demand_json': json.dumps([trade.demand for trade in trades]),
-            'data_sold_json': json.dumps([trade.units_sold for trade in trades]),
-            'data_produced_json': json.dumps([trade.unit_amount if (trade.unit_amount != None) else None for trade in trades]),
-
-            # data for price graph
-            'data_price_json': json.dumps([float(trade.unit_price) if (trade.unit_price != None) else None for trade in trades]),
-            'data_prod_cost_json': json.dumps(generate_prod_cost_list(market, trades, trader)),
-            'data_market_avg_price_json': json.dumps([float(round_stat.avg_price) for round_stat in round_stats]),
-
-            # add data for balance graph
-            'trader_balance_json': json.dumps(
-                generate_balance_list(trader)),
-            'avg_balance_json': json.dumps([float(market.initial_balance)] +
-                                           [float(round_stat.avg_balance_after) for round_stat in round_stats])
-        }
 
-        context['wait'] = trader.should_be_waiting()
+@require_GET
+def metrics_view(request):
+    """ The metrics of all workers in the Prometheus text format (see metrics.py) """
+    if not metrics.authorized(request):
+        return HttpResponse(status=401, headers={'WWW-Authenticate': 'Bearer'})
+    return HttpResponse(
+        metrics.REGISTRY.exposition(), content_type='text/plain; version=0.0.4; charset=utf-8')
 
-        return render(request, 'market/play/play.html', context)
+
+@require_GET
+@user_passes_test(lambda user: user.is_staff)
+def profiles(request):
+    """ The profiles of requests captured by staff users (see profiling.py) """
+    return render(request, 'market/profiles.html', {'profiles': list_profiles()})
 
 
 @require_GET
-def current_round(request, market_id):
+@user_passes_test(lambda user: user.is_staff)
+def profile_file(request, filename):
+    path = profile_file_path(filename)
+    if path is None:
+        raise Http404
+    return FileResponse(open(path, 'rb'), as_attachment=path.suffix == '.prof', content_type='text/plain')
+
+
+async def current_round(request, market_id):
+    """
+    Polled every second by the play page of each trader. The view is async, so under an ASGI
+    worker (see docs/deployment.md) a poll doesn't take up a worker process. Django 3.2 has no
+    async ORM, so the queries run in a thread with sync_to_async. (The decorators require_GET
+    and login_required of Django 3.2 don't work on async views.)
+    """
+    if request.method != 'GET':
+        return HttpResponseNotAllowed(['GET'])
+    return JsonResponse(await sync_to_async(current_round_data)(market_id))
+
+
+def current_round_data(market_id):
     market = get_object_or_404(Market, market_id=market_id)
-    return JsonResponse(
-        {
-            'round': market.round,
-            'num_active_traders': market.num_active_traders(),
-            'num_ready_traders': market.num_ready_traders(),
-            'game_over': market.game_over
-        }
-    )
+    return {
+        'round': market.round,
+        'num_active_traders': market.num_active_traders(),
+        'num_ready_traders': market.num_ready_traders(),
+        'game_over': market.game_over
+    }